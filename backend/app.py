@@ -1,132 +1,56 @@
-from fastapi import FastAPI, UploadFile, File, Request
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse, FileResponse
 from dotenv import load_dotenv
-from schemas import AnalysisResponse, TestResponse, PatchRequest, PatchResponse
-from video_utils import extract_frames
-from gemini import analyze_video, generate_test, generate_patch
-from playwright_runner import run_playwright_test, check_playwright_setup, setup_playwright_runner_dir
-import shutil
+from schemas import AnalysisResponse, TestResponse, BatchRunRequest, PatchRequest, PatchResponse
+from video_utils import extract_frames, sampling_params
+from video_clip import (ANALYSIS_MODES, choose_mode, clip_fps, clip_params, ffmpeg_available, needs_state_scan,
+                        probe_recording, scan_states, state_scan_params, transcode_clip)
+from gemini import analyze_video, analyze_clip, generate_test, generate_patch, MODEL_ID, prompt_cache
+from playwright_runner import (
+    run_playwright_test, run_playwright_batch, check_playwright_setup, setup_playwright_runner_dir, BATCH_MAX_SPECS,
+    run_limiter
+)
+from playwright_pool import pool as playwright_pool
+from patch_search import search_patch, target_app_problem, MAX_CANDIDATES as PATCH_SEARCH_MAX_CANDIDATES
+from ingest import ingest_upload
+from cache import ResponseCache, make_key
+from artifacts import artifact_store
+from cors import CORSHeaderMiddleware, current_policy as current_cors_policy, reload_policy as reload_cors_policy
+from jobs import JobQueue, stage_concurrency
+import progress
+import metrics
+from starlette.concurrency import run_in_threadpool
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import os
+import uuid
 import traceback
+from typing import Optional
+import ffmpeg
 
 load_dotenv()
 
 app = FastAPI()
 
-# CORS allowed origins - read from environment variable
-# Format: comma-separated or space-separated URLs
-# Example: CORS_ALLOWED_ORIGINS="http://localhost:3000,https://example.com"
-# Default: localhost URLs for development
-def get_cors_origins():
-    """Get CORS allowed origins from environment or use defaults."""
-    env_origins = os.getenv("CORS_ALLOWED_ORIGINS", "").strip()
-    
-    # Default origins for local development
-    default_origins = [
-        "http://localhost:3000",
-        "http://localhost:3001",
-        "http://127.0.0.1:3000",
-        "http://127.0.0.1:3001",
-    ]
-    
-    if not env_origins:
-        return default_origins
-    
-    # Parse comma or space-separated origins
-    origins = [origin.strip().rstrip('/') for origin in env_origins.replace(",", " ").split() if origin.strip()]
-    
-    # Combine with defaults (avoid duplicates)
-    all_origins = list(set(default_origins + origins))
-    
-    return all_origins
-
-def is_origin_allowed(origin: str) -> bool:
-    """Check if origin is allowed, handling trailing slashes and variations."""
-    if not origin:
-        return False
-    origin_clean = origin.rstrip('/')
-    allowed_origins = get_cors_origins()
-    return origin_clean in allowed_origins or origin in allowed_origins
-
-# CORS middleware - MUST be added before routes
-# Get CORS origins (this will be called once at startup)
-cors_origins = get_cors_origins()
-
-# Log CORS origins at startup for debugging
-print(f"[CORS] Allowed origins: {cors_origins}")
-
-# Custom middleware to ensure CORS headers on ALL responses (including timeouts/errors)
-class CORSHeaderMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        origin = request.headers.get("origin", "")
-        allowed_origins = get_cors_origins()
-        
-        # Determine CORS origin - check if origin is allowed
-        if origin and is_origin_allowed(origin):
-            cors_origin = origin.rstrip('/')
-        elif allowed_origins:
-            cors_origin = allowed_origins[0]
-        else:
-            cors_origin = "*"
-        
-        try:
-            response = await call_next(request)
-        except Exception as e:
-            # Even on exceptions, return CORS headers
-            response = JSONResponse(
-                status_code=500,
-                content={"detail": str(e), "type": type(e).__name__},
-                headers={
-                    "Access-Control-Allow-Origin": cors_origin,
-                    "Access-Control-Allow-Credentials": "true",
-                    "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-                    "Access-Control-Allow-Headers": "*",
-                }
-            )
-        
-        # Ensure CORS headers are always present (override any existing)
-        response.headers["Access-Control-Allow-Origin"] = cors_origin
-        response.headers["Access-Control-Allow-Credentials"] = "true"
-        response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS"
-        response.headers["Access-Control-Allow-Headers"] = "*"
-        
-        return response
-
-# Add custom CORS middleware first (runs last in reverse order)
-app.add_middleware(CORSHeaderMiddleware)
+# CORS: origins come from CORS_ALLOWED_ORIGINS (comma or space-separated) plus
+# localhost defaults. The policy is compiled once here, after .env is loaded;
+# POST /debug/cors/reload rebuilds it without a restart.
+reload_cors_policy()
 
-# Add FastAPI CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=cors_origins,
-    allow_credentials=True,
-    allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-    allow_headers=["*"],
-    expose_headers=["*"],
-)
+# Single pure-ASGI layer: answers preflights and puts CORS headers on ALL
+# responses (including timeouts/errors)
+app.add_middleware(CORSHeaderMiddleware)
 
 # Exception handler to ensure CORS headers on errors
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
-    origin = request.headers.get("origin")
-    # Check if origin is in allowed origins
-    allowed_origins = get_cors_origins()
-    cors_origin = origin if origin in allowed_origins else allowed_origins[0] if allowed_origins else "*"
-    
     return JSONResponse(
         status_code=500,
         content={
             "detail": str(exc),
             "type": type(exc).__name__,
         },
-        headers={
-            "Access-Control-Allow-Origin": cors_origin,
-            "Access-Control-Allow-Credentials": "true",
-            "Access-Control-Allow-Methods": "GET, POST, PUT, DELETE, OPTIONS",
-            "Access-Control-Allow-Headers": "*",
-        }
+        headers=current_cors_policy().header_dict(request.headers.get("origin")),
     )
 
 # Upload directory - can be overridden via env
@@ -136,6 +60,18 @@ os.makedirs(UPLOAD_DIR, exist_ok=True)
 # Backend port - read from env or use default
 BACKEND_PORT = int(os.getenv("PORT", "8000"))
 
+# Frame extraction is CPU-bound; a bounded pool keeps it off the event loop
+# without letting concurrent analyses oversubscribe the CPU
+FRAME_WORKERS = int(os.getenv("FRAME_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+frame_executor = ThreadPoolExecutor(max_workers=FRAME_WORKERS, thread_name_prefix="frames")
+
+# Analysis cache: video digest + sampling params + model -> AnalysisResponse
+analysis_cache = ResponseCache(
+    "analysis",
+    max_entries=int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "500")),
+    ttl_seconds=float(os.getenv("ANALYSIS_CACHE_TTL_HOURS", "168")) * 3600,
+)
+
 @app.get("/health")
 async def health():
     return {"ok": True}
@@ -144,11 +80,57 @@ async def health():
 async def debug_cors():
     """Debug endpoint to see what CORS origins are configured."""
     return {
-        "cors_origins": get_cors_origins(),
+        "cors_origins": list(current_cors_policy().origins),
         "env_var": os.getenv("CORS_ALLOWED_ORIGINS", "NOT SET"),
         "all_env_vars": {k: v for k, v in os.environ.items() if "CORS" in k.upper()}
     }
 
+@app.post("/debug/cors/reload")
+async def reload_cors():
+    """Re-read CORS_ALLOWED_ORIGINS (and .env) and swap in a freshly compiled policy."""
+    load_dotenv(override=True)
+    return {"cors_origins": list(reload_cors_policy().origins)}
+
+CACHES = {"analysis": analysis_cache, "prompt": prompt_cache}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters and size of the response caches."""
+    return {name: await run_in_threadpool(cache.stats) for name, cache in CACHES.items()}
+
+@app.delete("/cache/{name}")
+async def invalidate_cache(name: str):
+    """Drop every entry from one response cache ("analysis" or "prompt")."""
+    cache = CACHES.get(name)
+    if cache is None:
+        raise HTTPException(status_code=404, detail=f"Unknown cache: {name}")
+    return {"cache": name, "removed": await run_in_threadpool(cache.invalidate)}
+
+@app.get("/artifacts/stats")
+async def artifact_stats():
+    """File count and size of the artifact store, with its limits."""
+    return await run_in_threadpool(artifact_store.stats)
+
+@app.get("/artifacts/{name}")
+async def get_artifact(name: str, request: Request):
+    """
+    Serve a stored screenshot, trace or video. Names are content hashes, so
+    responses are immutable; Range requests are handled by FileResponse.
+    """
+    path = artifact_store.path_for(name)
+    if path is None or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    etag = f'"{name.split(".")[0]}"'
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": etag}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return FileResponse(path, headers=headers)
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latency histograms, Gemini token usage and fallback counts in Prometheus text format."""
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
+
 @app.get("/selfcheck")
 async def selfcheck():
     """
@@ -156,7 +138,7 @@ async def selfcheck():
     Returns a detailed report of what's installed and what's missing.
     """
     try:
-        runner_dir = setup_playwright_runner_dir()
+        runner_dir = await run_in_threadpool(setup_playwright_runner_dir)
     except Exception as e:
         return {
             "status": "error",
@@ -164,7 +146,7 @@ async def selfcheck():
             "checks": {}
         }
     
-    checks = check_playwright_setup(runner_dir)
+    checks = await run_in_threadpool(check_playwright_setup, runner_dir)
     
     all_ok = (
         checks["node"] and 
@@ -176,29 +158,289 @@ async def selfcheck():
     return {
         "status": "ok" if all_ok else "warning",
         "checks": checks,
-        "runner_dir": runner_dir
+        "runner_dir": runner_dir,
+        "pool": playwright_pool.stats(),
+        "runLimiter": run_limiter.stats(),
+        "ffmpeg": ffmpeg_available()
     }
 
-@app.post("/analyze", response_model=AnalysisResponse)
-async def analyze(file: UploadFile = File(...)):
-    video_path = f"{UPLOAD_DIR}/{file.filename}"
-    with open(video_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
+def check_analysis_mode(mode: Optional[str]):
+    if mode is not None and mode not in ANALYSIS_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(ANALYSIS_MODES)}")
+    if mode == "video" and not ffmpeg_available():
+        raise HTTPException(status_code=400, detail="Video mode needs ffmpeg, which is not installed on the server")
+
+async def shortest_state(video_path: str, digest: str) -> Optional[float]:
+    """
+    scan_states for a stored recording, cached next to its analyses: the scan
+    decodes the whole recording, which would otherwise make every analysis
+    cache hit take seconds.
+    """
+    key = make_key("shortest_state", digest, state_scan_params())
+    cached = await run_in_threadpool(analysis_cache.get, key)
+    if cached is not None:
+        return cached["shortestStateSeconds"]
+    loop = asyncio.get_running_loop()
+    with metrics.stage("state_scan"):
+        shortest = await loop.run_in_executor(frame_executor, scan_states, video_path)
+    await run_in_threadpool(analysis_cache.set, key, {"shortestStateSeconds": shortest})
+    return shortest
+
+async def run_analysis(video_path: str, digest: str, mode: Optional[str] = None) -> AnalysisResponse:
+    """Cache lookup, frame extraction or clip transcoding, and Gemini analysis for a stored recording."""
+    request_id = uuid.uuid4().hex[:8]
+    loop = asyncio.get_running_loop()
+
+    # Short recordings go to Gemini as one clip, longer ones as sampled frames.
+    # Only a possible clip needs the shortest-UI-state scan, whose result is cached
+    info = await loop.run_in_executor(frame_executor, probe_recording, video_path)
+    if needs_state_scan(info, mode):
+        info["shortestStateSeconds"] = await shortest_state(video_path, digest)
+    requested = mode
+    mode, reason = choose_mode(info, requested)
+    print(f"[Analyze {request_id}] {digest[:12]}: {mode} mode ({reason}), {info['durationSeconds']}s")
+
+    # Same recording, same sampling and same model: reuse the stored analysis
+    cache_key = make_key(digest, clip_params(clip_fps(info)) if mode == "video" else sampling_params(), MODEL_ID)
+    cached = await run_in_threadpool(analysis_cache.get, cache_key)
+    if cached is not None:
+        print(f"[Analyze {request_id}] {digest[:12]}: cache hit")
+        progress.emit("analysis.cache_hit", digest=digest)
+        return AnalysisResponse(**cached)
+
+    if mode == "video":
+        try:
+            with metrics.stage("video_transcode"):
+                clip = await loop.run_in_executor(frame_executor, transcode_clip, video_path, info)
+        except ffmpeg.Error as e:
+            stderr_tail = (e.stderr or b"").decode(errors="replace")[-500:]
+            if requested == "video":
+                raise HTTPException(status_code=422, detail=f"Could not transcode recording: {stderr_tail}")
+            # Auto mode: a recording ffmpeg cannot read may still decode frame by frame
+            print(f"[Analyze {request_id}] Transcode failed, falling back to frames: {stderr_tail}")
+            return await run_analysis(video_path, digest, "frames")
+        progress.emit("clip.transcoded", bytes=len(clip), durationSeconds=info["durationSeconds"])
+        analysis = await analyze_clip(clip, clip_fps(info), request_id=request_id)
+        await run_in_threadpool(analysis_cache.set, cache_key, analysis.model_dump())
+        return analysis
 
-    frames = extract_frames(video_path)
-    analysis = analyze_video(frames)
+    # Frames live only in this request's memory; nothing is shared on disk
+    with metrics.stage("frame_extraction"):
+        frames = await loop.run_in_executor(frame_executor, extract_frames, video_path)
+    print(f"[Analyze {request_id}] {digest[:12]}: extracted {len(frames)} frames ({sum(len(f) for f in frames) // 1024} KB)")
+    progress.emit("frames.extracted", count=len(frames), bytes=sum(len(f) for f in frames))
+    analysis = await analyze_video(frames, request_id=request_id)
+    await run_in_threadpool(analysis_cache.set, cache_key, analysis.model_dump())
     return analysis
 
+# Uploads are parsed from the raw request stream by ingest_upload rather
+# than declared as UploadFile (which spools the whole body first); this keeps
+# the `file` field in the OpenAPI docs
+UPLOAD_BODY = {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+    "type": "object",
+    "properties": {"file": {"type": "string", "format": "binary"}},
+    "required": ["file"],
+}}}}}
+
+@app.post("/analyze", response_model=AnalysisResponse, openapi_extra=UPLOAD_BODY)
+async def analyze(request: Request, mode: Optional[str] = None):
+    """mode: auto (default: ANALYSIS_MODE), frames or video."""
+    check_analysis_mode(mode)
+    video_path, digest = await ingest_upload(request, UPLOAD_DIR)
+    return await run_analysis(video_path, digest, mode)
+
 @app.post("/generate-test", response_model = TestResponse)
-async def api_generate_test(analysis: AnalysisResponse):
-    return generate_test(analysis)
+async def api_generate_test(analysis: AnalysisResponse, bypass_cache: bool = False):
+    return await generate_test(analysis, use_cache=not bypass_cache)
+
+def stream_call(work):
+    """
+    Run work() with its progress bound to a private channel and stream the
+    events as SSE. The stream ends with a "result" event holding the
+    validated response, or an "error" event. The call is cancelled if the
+    client disconnects.
+    """
+    channel = progress.ProgressChannel(uuid.uuid4().hex)
+
+    async def run():
+        try:
+            with progress.bind(channel):
+                result = await work()
+            channel.publish("result", result.model_dump())
+        except Exception as e:
+            traceback.print_exc()
+            channel.publish("error", {"detail": str(e), "type": type(e).__name__})
+        finally:
+            channel.close()
+
+    async def stream():
+        task = asyncio.create_task(run())
+        try:
+            async for record in channel.subscribe():
+                yield progress.format_sse(record)
+        finally:
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/generate-test/stream")
+async def api_generate_test_stream(analysis: AnalysisResponse, bypass_cache: bool = False):
+    """Streaming /generate-test: model.field events as the spec is written, then the result."""
+    return stream_call(lambda: generate_test(analysis, use_cache=not bypass_cache))
 
 @app.post("/run-test")
 async def run_test(test: TestResponse):
-    result = run_playwright_test(test.playwrightSpec)
+    result = await run_playwright_test(test.playwrightSpec)
     return result
 
+@app.post("/run-tests")
+async def run_tests(batch: BatchRunRequest):
+    """Run several specs in one Playwright invocation; results come back per spec, in request order."""
+    if not batch.tests:
+        raise HTTPException(status_code=400, detail="No tests to run")
+    if len(batch.tests) > BATCH_MAX_SPECS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_SPECS} tests per batch")
+    return await run_playwright_batch([(test.filename, test.playwrightSpec) for test in batch.tests])
+
 @app.post('/generate-patch', response_model=PatchResponse)
-async def api_generate_patch(request: PatchRequest):
-    print(f"Analyzing error: {request.error_log}")
-    return generate_patch(request)  
\ No newline at end of file
+async def api_generate_patch(request: PatchRequest, bypass_cache: bool = False):
+    print(f"Analyzing error ({len(request.error_log)} chars): {request.error_log[:200]}")
+    return await generate_patch(request, use_cache=not bypass_cache)
+
+@app.post("/generate-patch/stream")
+async def api_generate_patch_stream(request: PatchRequest, bypass_cache: bool = False):
+    """Streaming /generate-patch: diff and rationale arrive as model.field events, then the result."""
+    return stream_call(lambda: generate_patch(request, use_cache=not bypass_cache))
+
+@app.post("/generate-patch/search")
+async def api_search_patch(request: PatchRequest, candidates: Optional[int] = None):
+    """
+    Request several patches at once and verify each by re-running failing_test
+    against a patched copy of the target app. Returns the first patch that
+    makes the spec pass; the other candidates are cancelled. When the spec
+    also passes without any patch, the result is "unverifiable".
+    """
+    problem = target_app_problem()
+    if problem:
+        raise HTTPException(status_code=503, detail=problem)
+    if candidates is not None and not 1 <= candidates <= PATCH_SEARCH_MAX_CANDIDATES:
+        raise HTTPException(status_code=400, detail=f"candidates must be between 1 and {PATCH_SEARCH_MAX_CANDIDATES}")
+    try:
+        return await search_patch(request, candidates)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Background jobs: POST returns a job id immediately, stage workers do the work.
+# Worker counts per stage: JOB_CONCURRENCY_ANALYZE, JOB_CONCURRENCY_GENERATE_TEST,
+# JOB_CONCURRENCY_RUN_TEST, JOB_CONCURRENCY_GENERATE_PATCH
+job_queue = JobQueue()
+
+async def analyze_job(payload: dict) -> dict:
+    return (await run_analysis(payload["videoPath"], payload["digest"], payload.get("mode"))).model_dump()
+
+async def generate_test_job(payload: dict) -> dict:
+    return (await generate_test(AnalysisResponse(**payload["analysis"]))).model_dump()
+
+async def run_test_job(payload: dict) -> dict:
+    return await run_playwright_test(payload["test"]["playwrightSpec"])
+
+async def generate_patch_job(payload: dict) -> dict:
+    return (await generate_patch(PatchRequest(**payload["request"]))).model_dump()
+
+def pipeline_next_step(stage: str, payload: dict, result: dict):
+    """analyze -> generate-test -> run-test -> generate-patch (only when the test failed)."""
+    if stage == "analyze":
+        return "generate-test", {"analysis": result}
+    if stage == "generate-test":
+        return "run-test", {"analysis": payload["analysis"], "test": result}
+    if stage == "run-test" and result.get("status") != "passed":
+        error_log = "\n\n--- Output ---\n\n".join(filter(None, [result.get("stderr"), result.get("stdout")]))
+        return "generate-patch", {"request": {
+            "analysis": payload["analysis"],
+            "error_log": error_log or "No error log available",
+            "run_result": result,
+            "failing_test": payload["test"]["playwrightSpec"],
+        }}
+    return None
+
+job_queue.register("analyze", analyze_job, stage_concurrency("analyze", 2))
+job_queue.register("generate-test", generate_test_job, stage_concurrency("generate-test", 4))
+job_queue.register("run-test", run_test_job, stage_concurrency("run-test", 2))
+job_queue.register("generate-patch", generate_patch_job, stage_concurrency("generate-patch", 4))
+job_queue.set_next_step(pipeline_next_step)
+
+@app.on_event("startup")
+async def start_job_queue():
+    await job_queue.start()
+
+@app.on_event("shutdown")
+async def stop_job_queue():
+    await job_queue.stop()
+    await playwright_pool.stop()
+
+@app.post("/jobs/analyze", status_code=202, openapi_extra=UPLOAD_BODY)
+async def submit_analyze_job(request: Request, pipeline: bool = False, mode: Optional[str] = None):
+    """Queue an analysis. With pipeline=true the job chains through test, run and patch."""
+    check_analysis_mode(mode)
+    video_path, digest = await ingest_upload(request, UPLOAD_DIR)
+    return await job_queue.submit("analyze", {"videoPath": video_path, "digest": digest, "mode": mode}, pipeline=pipeline)
+
+@app.post("/jobs/generate-test", status_code=202)
+async def submit_generate_test_job(analysis: AnalysisResponse, pipeline: bool = False):
+    return await job_queue.submit("generate-test", {"analysis": analysis.model_dump()}, pipeline=pipeline)
+
+@app.post("/jobs/run-test", status_code=202)
+async def submit_run_test_job(test: TestResponse):
+    return await job_queue.submit("run-test", {"test": test.model_dump()})
+
+@app.post("/jobs/generate-patch", status_code=202)
+async def submit_generate_patch_job(request: PatchRequest):
+    return await job_queue.submit("generate-patch", {"request": request.model_dump()})
+
+@app.get("/jobs/stats")
+async def job_stats():
+    """Per-stage worker count, queue depth and job counts by status."""
+    return await job_queue.stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """Job status and result. wait=N long-polls up to N seconds (max 60) for completion."""
+    job = await job_queue.wait(job_id, min(max(wait, 0), 60))
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, follow: bool = True):
+    """
+    Server-Sent Events stream of a job's progress.
+    With follow=true (default) the stream continues into the next pipeline job.
+    """
+    if await job_queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+
+    async def stream():
+        current = job_id
+        while current:
+            channel = progress.get_channel(current)
+            job = await job_queue.get(current)
+            if channel is None and job["status"] in ("succeeded", "failed"):
+                # Finished before this process started: replay the stored outcome
+                yield progress.format_sse({"id": 0, "event": "job.status", "data": job})
+            else:
+                async for record in progress.open_channel(current).subscribe():
+                    yield progress.format_sse(record)
+            if not follow:
+                break
+            current = (await job_queue.get(current))["nextJobId"]
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,164 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import List, Optional
+
+# Artifact store location - can be overridden via env
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", os.path.join(os.getenv("UPLOAD_DIR", "temp"), "artifacts"))
+ARTIFACT_MAX_BYTES = int(float(os.getenv("ARTIFACT_MAX_MB", "1024")) * 1024 * 1024)
+ARTIFACT_MAX_AGE_SECONDS = float(os.getenv("ARTIFACT_MAX_AGE_HOURS", "72")) * 3600
+# Eviction walks the whole store, so it runs at most this often
+EVICT_INTERVAL_SECONDS = 60
+URL_PREFIX = "/artifacts"
+
+CHUNK_SIZE = 1024 * 1024
+EXTENSIONS = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "video/webm": ".webm",
+    "application/zip": ".zip",
+    "application/json": ".json",
+    "text/plain": ".txt",
+}
+# <sha256><ext>; anything else is rejected before touching the filesystem
+NAME_PATTERN = re.compile(r"^[0-9a-f]{64}\.[a-z0-9]{1,8}$")
+
+
+class ArtifactStore:
+    """
+    Content-addressed store for test artifacts (screenshots, traces, videos).
+
+    Files are named by the SHA-256 of their content, so identical screenshots
+    are stored once and a name never changes meaning, which lets clients
+    cache them forever. Disk use is bounded by age and total size; the
+    least recently stored files go first.
+    """
+
+    def __init__(self, root: str = ARTIFACT_DIR, max_bytes: int = ARTIFACT_MAX_BYTES,
+                 max_age_seconds: float = ARTIFACT_MAX_AGE_SECONDS):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._last_evicted = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, name: str) -> Optional[str]:
+        if not NAME_PATTERN.match(name):
+            return None
+        return os.path.join(self.root, name[:2], name)
+
+    def put_file(self, path: str, content_type: str) -> dict:
+        """Move a file into the store. Returns {"name", "url", "size", "contentType"}."""
+        digest = hashlib.sha256()
+        size = 0
+        with open(path, "rb") as f:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+                size += len(chunk)
+        extension = EXTENSIONS.get(content_type) or os.path.splitext(path)[1].lower() or ".bin"
+        name = digest.hexdigest() + extension
+        dest = self.path_for(name)
+
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.exists(dest):
+            # Already stored; count it as fresh so eviction keeps it
+            os.utime(dest)
+            os.remove(path)
+        else:
+            # Move next to the destination first so the final rename is atomic
+            partial = os.path.join(os.path.dirname(dest), f".incoming-{uuid.uuid4().hex}")
+            shutil.move(path, partial)
+            os.replace(partial, dest)
+
+        self.maybe_evict()
+        return {"name": name, "url": f"{URL_PREFIX}/{name}", "size": size, "contentType": content_type}
+
+    def _entries(self) -> List[os.DirEntry]:
+        entries = []
+        for shard in os.scandir(self.root):
+            if shard.is_dir():
+                entries.extend(e for e in os.scandir(shard.path) if e.is_file() and NAME_PATTERN.match(e.name))
+        return entries
+
+    def _stat_entries(self) -> List[tuple]:
+        """(stat, path) for every stored file; files removed since the scan are skipped."""
+        stats = []
+        for entry in self._entries():
+            try:
+                stats.append((entry.stat(), entry.path))
+            except FileNotFoundError:
+                pass  # evicted (or deduplicated) between the scan and the stat
+        return stats
+
+    def evict(self) -> dict:
+        """Drop artifacts older than max_age, then the oldest until under max_bytes."""
+        with self._lock:
+            self._last_evicted = time.time()
+            entries = sorted((st.st_mtime, st.st_size, path) for st, path in self._stat_entries())
+            cutoff = self._last_evicted - self.max_age_seconds
+            total = sum(size for _, size, _ in entries)
+            removed = freed = 0
+            for mtime, size, path in entries:
+                if mtime >= cutoff and total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                removed += 1
+                freed += size
+        if removed:
+            print(f"[Artifacts] Evicted {removed} files ({freed // 1024} KB), {total // 1024} KB left")
+        return {"removed": removed, "freedBytes": freed, "remainingBytes": total}
+
+    def maybe_evict(self):
+        if time.time() - self._last_evicted >= EVICT_INTERVAL_SECONDS:
+            self.evict()
+
+    def stats(self) -> dict:
+        # Not under the eviction lock, so a long eviction never stalls /artifacts/stats
+        entries = self._stat_entries()
+        return {
+            "files": len(entries),
+            "bytes": sum(st.st_size for st, _ in entries),
+            "maxBytes": self.max_bytes,
+            "maxAgeHours": self.max_age_seconds / 3600,
+        }
+
+
+artifact_store = ArtifactStore()
+
+
+def store_report_artifacts(store: ArtifactStore, report: Optional[dict]) -> Optional[str]:
+    """
+    Move every attachment referenced by a summarized run report into the
+    store, replacing its local path with a URL. Returns the URL of the
+    screenshot to show for the run: the first failing test's, else the first.
+    """
+    if not report:
+        return None
+    failed_shot = any_shot = None
+    for test in report.get("tests", []):
+        stored = []
+        for attachment in test.get("attachments", []):
+            path = attachment.get("path")
+            if not path or not os.path.isfile(path):
+                continue
+            try:
+                artifact = store.put_file(path, attachment.get("contentType") or "application/octet-stream")
+            except OSError as e:
+                print(f"[Artifacts] Could not store {path}: {e}")
+                continue
+            stored.append({"name": attachment.get("name"), **{k: artifact[k] for k in ("url", "size", "contentType")}})
+            if attachment.get("name") == "screenshot":
+                any_shot = any_shot or artifact["url"]
+                if test.get("status") != "passed":
+                    failed_shot = failed_shot or artifact["url"]
+        test["attachments"] = stored
+    return failed_shot or any_shot
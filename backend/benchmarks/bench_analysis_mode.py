@@ -0,0 +1,155 @@
+"""
+Benchmark: video mode against frame mode for /analyze.
+
+For synthetic recordings of each --lengths, prepares the Gemini input both
+ways (extract_frames vs transcode_clip) and sends it through analyze_video
+/ analyze_clip. Reports per mode:
+- prep: local extraction or transcoding time (best of --repeat)
+- KB: payload sent to Gemini
+- est tok: input token estimate (image tiles per frame, or the clip's
+  sampled frames at video_clip.clip_fps)
+- analyze: analyze_video / analyze_clip wall time
+and which mode auto selection picks for that recording.
+
+By default Gemini is the fake server from bench_pipeline (fixed
+--latency-ms), which shows local and transfer overhead only. With --live
+the real API is called: prompt tokens come from the response usage
+metadata and the returned timeline is printed next to the recording's real
+change times so timestamp accuracy can be compared. Video mode needs
+ffmpeg on PATH; without it only frame mode is measured.
+
+Usage (from backend/):
+    python benchmarks/bench_analysis_mode.py --lengths 5 10 20 30 60
+    python benchmarks/bench_analysis_mode.py --lengths 10 30 --repeat 1 --live
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# Same file gemini.py reads; --live needs the real key, the fake server accepts any
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", ".env"))
+os.environ.setdefault("GENAI_API_KEY", "benchmark")
+
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+
+import bench_pipeline  # noqa: E402
+import gemini  # noqa: E402
+import metrics  # noqa: E402
+import video_clip  # noqa: E402
+import video_utils  # noqa: E402
+from bench_extract_frames import make_recording  # noqa: E402
+
+
+def frame_tokens(frames: list) -> int:
+    total = 0
+    for frame in frames:
+        height, width = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_GRAYSCALE).shape
+        total += video_utils.image_tokens(width, height)
+    return total
+
+
+def prompt_tokens() -> int:
+    return metrics.gemini_tokens._values.get(("analyze", "prompt"), 0)
+
+
+def best_of(repeat: int, work):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = work()
+        timings.append(time.perf_counter() - start)
+    return result, min(timings)
+
+
+async def measure(mode: str, video_path: str, info: dict, repeat: int) -> dict:
+    if mode == "frames":
+        payload, prep = best_of(repeat, lambda: video_utils.extract_frames(video_path))
+        size, estimate = sum(len(f) for f in payload), frame_tokens(payload)
+        analyze = lambda: gemini.analyze_video(payload, request_id="bench-frames")  # noqa: E731
+    else:
+        payload, prep = best_of(repeat, lambda: video_clip.transcode_clip(video_path, info))
+        fps = video_clip.clip_fps(info)
+        size, estimate = len(payload), video_clip.clip_tokens(info["durationSeconds"], fps)
+        analyze = lambda: gemini.analyze_clip(payload, fps, request_id="bench-video")  # noqa: E731
+
+    tokens_before = prompt_tokens()
+    start = time.perf_counter()
+    analysis = await analyze()
+    return {
+        "prep": prep,
+        "kb": size / 1024,
+        "estimate": estimate,
+        "prompt": prompt_tokens() - tokens_before,
+        "analyze": time.perf_counter() - start,
+        "timeline": [entry.t for entry in analysis.timeline],
+    }
+
+
+async def run(args):
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    modes = ["frames"] + (["video"] if video_clip.ffmpeg_available() else [])
+    if len(modes) == 1:
+        print(f"{video_clip.FFMPEG_BINARY!r} not found; measuring frame mode only\n")
+
+    print(f"{'length':>6} {'mode':<7} {'auto':>5} {'prep (s)':>9} {'KB':>7} {'est tok':>8} {'prompt tok':>11} "
+          f"{'analyze (s)':>12} {'total (s)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for seconds in args.lengths:
+            video_path = os.path.join(tmp, f"{seconds}s.mp4")
+            changes = max(1, round(args.changes_per_minute * seconds / 60))
+            change_points = make_recording(video_path, seconds, args.fps, width, height,
+                                           changes=changes, seed=args.seed)
+            info = video_clip.probe_recording(video_path)
+            if video_clip.needs_state_scan(info, "auto"):
+                info["shortestStateSeconds"] = video_clip.scan_states(video_path)
+            auto, reason = video_clip.choose_mode(info, "auto")
+            for mode in modes:
+                r = await measure(mode, video_path, info, args.repeat)
+                prompt = f"{r['prompt']:.0f}" if args.live else "-"
+                print(f"{seconds:>5}s {mode:<7} {'*' if mode == auto else '':>5} {r['prep']:>9.3f} {r['kb']:>7.0f} "
+                      f"{r['estimate']:>8} {prompt:>11} {r['analyze']:>12.3f} {r['prep'] + r['analyze']:>10.3f}")
+                if args.live:
+                    print(f"{'':>14}timeline t: {r['timeline']}")
+            if args.live:
+                print(f"{'':>14}real changes at: {[round(p / args.fps, 1) for p in change_points]}")
+            print(f"{'':>14}auto: {auto} ({reason})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[5, 10, 20, 30, 60], help="Recording lengths in seconds")
+    parser.add_argument("--resolution", default="1280x720")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--changes-per-minute", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed preparations per mode; the fastest counts")
+    parser.add_argument("--latency-ms", type=float, default=800, help="Fake Gemini latency per call")
+    parser.add_argument("--live", action="store_true", help="Call the real Gemini API instead of the fake server")
+    args = parser.parse_args()
+
+    fake = None
+    if not args.live:
+        fake = bench_pipeline.FakeGemini("http://localhost:3000", args.latency_ms / 1000, 0)
+        threading.Thread(target=fake.serve_forever, daemon=True).start()
+        gemini.client = genai.Client(api_key="benchmark", http_options=types.HttpOptions(base_url=fake.url))
+    try:
+        asyncio.run(run(args))
+    finally:
+        if fake is not None:
+            fake.shutdown()
+        shutil.rmtree(bench_pipeline._tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
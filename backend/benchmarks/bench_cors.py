@@ -0,0 +1,134 @@
+"""
+Microbenchmark: requests/sec on /health through the CORS layer.
+
+Compares the old stack (a BaseHTTPMiddleware that re-read the allowed
+origins on every request, wrapped in Starlette's CORSMiddleware) with the
+compiled pure-ASGI CORSHeaderMiddleware in cors.py. Both wrap the same
+minimal FastAPI app with only /health, and requests are fed straight into
+the ASGI app so the numbers are not dominated by an HTTP client.
+
+Usage (from backend/):
+    python benchmarks/bench_cors.py --requests 20000 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi import FastAPI, Request  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+import cors  # noqa: E402
+
+ALLOW_METHODS = "GET, POST, PUT, DELETE, OPTIONS"
+
+
+def legacy_origins():
+    # What app.py did on every request before the policy was compiled
+    env_origins = os.getenv("CORS_ALLOWED_ORIGINS", "").strip()
+    origins = [origin.strip().rstrip("/") for origin in env_origins.replace(",", " ").split() if origin.strip()]
+    return list(set(list(cors.DEFAULT_ORIGINS) + origins))
+
+
+class LegacyCORSHeaderMiddleware(BaseHTTPMiddleware):
+    async def dispatch(self, request: Request, call_next):
+        origin = request.headers.get("origin", "")
+        allowed_origins = legacy_origins()
+        if origin and origin.rstrip("/") in legacy_origins():
+            cors_origin = origin.rstrip("/")
+        else:
+            cors_origin = allowed_origins[0] if allowed_origins else "*"
+        try:
+            response = await call_next(request)
+        except Exception as e:
+            response = JSONResponse(status_code=500, content={"detail": str(e), "type": type(e).__name__})
+        response.headers["Access-Control-Allow-Origin"] = cors_origin
+        response.headers["Access-Control-Allow-Credentials"] = "true"
+        response.headers["Access-Control-Allow-Methods"] = ALLOW_METHODS
+        response.headers["Access-Control-Allow-Headers"] = "*"
+        return response
+
+
+def make_app(compiled: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health():
+        return {"ok": True}
+
+    if compiled:
+        app.add_middleware(cors.CORSHeaderMiddleware)
+    else:
+        app.add_middleware(LegacyCORSHeaderMiddleware)
+        app.add_middleware(CORSMiddleware, allow_origins=legacy_origins(), allow_credentials=True,
+                           allow_methods=ALLOW_METHODS.split(", "), allow_headers=["*"], expose_headers=["*"])
+    return app
+
+
+def scope_for(origin: bytes) -> dict:
+    return {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": "/health", "raw_path": b"/health", "root_path": "", "query_string": b"",
+        "headers": [(b"host", b"bench"), (b"origin", origin), (b"accept", b"*/*")],
+        "client": ("127.0.0.1", 50000), "server": ("bench", 80),
+    }
+
+
+async def call(app, scope) -> int:
+    status = 0
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(dict(scope), receive, send)
+    return status
+
+
+async def measure(app, scope, requests: int, concurrency: int) -> float:
+    for _ in range(200):  # warm up routing and middleware stack
+        await call(app, scope)
+
+    remaining = requests
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            assert await call(app, scope) == 200
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - start)
+
+
+async def run(args):
+    scope = scope_for(args.origin.encode("latin-1"))
+    print(f"{args.requests} GET /health, concurrency {args.concurrency}, Origin: {args.origin}")
+    print(f"{'stack':<36} {'req/s':>10}")
+    results = {}
+    for label, compiled in (("BaseHTTPMiddleware + CORSMiddleware", False), ("compiled ASGI", True)):
+        results[compiled] = await measure(make_app(compiled), scope, args.requests, args.concurrency)
+        print(f"{label:<36} {results[compiled]:>10.0f}")
+    print(f"speedup: {results[True] / results[False]:.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--origin", default="http://localhost:3000")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: frame extraction decode time against recording length.
+
+Generates synthetic screen recordings with OpenCV and compares the
+seek-based sampler in video_utils.extract_frames against decoding every
+frame (what the previous implementation did).
+
+Usage (from backend/):
+    python benchmarks/bench_extract_frames.py --lengths 10 30 60 120 --fps 60
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from typing import List, Optional
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from video_utils import extract_frames, _open_reader  # noqa: E402
+
+
+def make_recording(path: str, seconds: int, fps: int, width: int, height: int, changes: int = 6,
+                   seed: Optional[int] = None) -> List[int]:
+    """
+    Write a synthetic screen recording with a few discrete UI changes.
+    Returns the frame indices where the content changes.
+    """
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+    total = seconds * fps
+    change_points = set(int(i) for i in np.linspace(0, total, num=changes + 2, dtype=int)[1:-1])
+    frame = np.full((height, width, 3), 235, dtype=np.uint8)
+    for i in range(total):
+        if i in change_points:
+            x = int(rng.integers(0, width // 2))
+            y = int(rng.integers(0, height // 2))
+            color = tuple(int(c) for c in rng.integers(0, 255, 3))
+            cv2.rectangle(frame, (x, y), (x + width // 3, y + height // 3), color, -1)
+        # Blinking cursor: small per-frame noise like a real recording
+        out = frame.copy()
+        if (i // (fps // 2 or 1)) % 2 == 0:
+            cv2.line(out, (20, 20), (20, 40), (0, 0, 0), 2)
+        writer.write(out)
+    writer.release()
+    return sorted(change_points)
+
+
+def decode_all(video_path: str) -> int:
+    """Baseline: decode and grayscale every frame."""
+    vr = _open_reader(video_path)
+    for i in range(len(vr)):
+        cv2.cvtColor(vr[i].asnumpy(), cv2.COLOR_RGB2GRAY)
+    return len(vr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 30, 60, 120], help="Recording lengths in seconds")
+    parser.add_argument("--fps", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--max-frames", type=int, default=12)
+    parser.add_argument("--skip-baseline", action="store_true", help="Only time the sampler")
+    args = parser.parse_args()
+
+    print(f"{'length':>8} {'frames':>8} {'decode-all (s)':>16} {'sampler (s)':>12} {'speedup':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for seconds in args.lengths:
+            video_path = os.path.join(tmp, f"rec_{seconds}s.mp4")
+            make_recording(video_path, seconds, args.fps, args.width, args.height)
+
+            baseline = float("nan")
+            if not args.skip_baseline:
+                start = time.perf_counter()
+                total = decode_all(video_path)
+                baseline = time.perf_counter() - start
+            else:
+                total = len(_open_reader(video_path))
+
+            start = time.perf_counter()
+            extract_frames(video_path, max_frames=args.max_frames)
+            sampled = time.perf_counter() - start
+
+            print(f"{seconds:>7}s {total:>8} {baseline:>16.2f} {sampled:>12.2f} {baseline / sampled:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+Regression suite for extract_frames on synthetic screen recordings.
+
+Generates recordings with OpenCV over a matrix of length, resolution and
+change density (UI changes per minute, at known frame indices), then
+measures for each one:
+- time: wall time of extract_frames (best of --repeat)
+- peak memory: growth of the process's peak RSS during extraction; every
+  case runs in a fresh process so the high-water mark is its own
+- coverage: share of known change points with a selected frame at or
+  shortly after them (within --tolerance-ms), and the mean lag of those hits
+
+Results can be saved as a baseline JSON file and compared on later runs;
+a slower, hungrier or less accurate case is reported as a regression and
+the exit status is 1.
+
+Usage (from backend/):
+    python benchmarks/bench_frame_suite.py                      # compare with the stored baseline
+    python benchmarks/bench_frame_suite.py --save-baseline      # overwrite it
+    python benchmarks/bench_frame_suite.py --lengths 10 --resolutions 1280x720 --compare none
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import video_utils  # noqa: E402
+from bench_extract_frames import make_recording  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baselines", "extract_frames.json")
+# Allowed slowdown / memory growth against the baseline before a case counts as a regression
+DEFAULT_THRESHOLD = 0.25
+# Peak RSS deltas below this are allocator noise
+MEMORY_FLOOR_MB = 16
+
+
+def case_id(seconds: int, width: int, height: int, changes_per_minute: int) -> str:
+    return f"{seconds}s-{width}x{height}-{changes_per_minute}cpm"
+
+
+def measure_case(video_path: str, change_points: list, fps: int, max_frames: int, repeat: int,
+                 tolerance_frames: int) -> dict:
+    """Runs in a fresh worker process; see module docstring for what is measured."""
+    vr = video_utils._open_reader(video_path)
+    total_frames = len(vr)
+    del vr
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    timings = []
+    with contextlib.redirect_stdout(io.StringIO()):  # per-call [Frames] log lines
+        for _ in range(repeat):
+            start = time.perf_counter()
+            frames = video_utils.extract_frames(video_path, max_frames=max_frames)
+            timings.append(time.perf_counter() - start)
+    peak_mb = max(0, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before) / 1024
+
+    # extract_frames does not return indices; the planner is deterministic, so ask it directly
+    selected = video_utils.plan_extraction(video_utils._open_reader(video_path), max_frames=max_frames)["indices"]
+    lags = []
+    for point in change_points:
+        hits = [index - point for index in selected if 0 <= index - point <= tolerance_frames]
+        if hits:
+            lags.append(min(hits))
+
+    return {
+        "totalFrames": total_frames,
+        "selectedFrames": len(frames),
+        "changePoints": len(change_points),
+        "seconds": round(min(timings), 4),
+        "peakMemoryMb": round(peak_mb, 1),
+        "coverage": round(len(lags) / len(change_points), 4) if change_points else 1.0,
+        "meanLagMs": round(sum(lags) / len(lags) * 1000 / fps, 1) if lags else None,
+        "jpegKb": round(sum(len(f) for f in frames) / 1024, 1),
+    }
+
+
+def run_suite(args) -> dict:
+    results = {}
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        for seconds in args.lengths:
+            for resolution in args.resolutions:
+                width, height = (int(v) for v in resolution.lower().split("x"))
+                for density in args.changes_per_minute:
+                    name = case_id(seconds, width, height, density)
+                    video_path = os.path.join(tmp, f"{name}.mp4")
+                    changes = max(1, round(density * seconds / 60))
+                    # Seeded so every run (and every version) sees the same recording
+                    change_points = make_recording(video_path, seconds, args.fps, width, height,
+                                                   changes=changes, seed=args.seed)
+                    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        results[name] = executor.submit(
+                            measure_case, video_path, change_points, args.fps, args.max_frames, args.repeat,
+                            int(args.tolerance_ms * args.fps / 1000)
+                        ).result()
+                    os.remove(video_path)
+                    print_row(name, results[name])
+    return results
+
+
+def print_header():
+    print(f"{'case':<28} {'frames':>7} {'sent':>5} {'time (s)':>9} {'peak MB':>8} {'coverage':>9} {'lag (ms)':>9} "
+          f"{'JPEG KB':>8}")
+
+
+def print_row(name: str, r: dict):
+    lag = f"{r['meanLagMs']:.0f}" if r["meanLagMs"] is not None else "-"
+    print(f"{name:<28} {r['totalFrames']:>7} {r['selectedFrames']:>5} {r['seconds']:>9.3f} {r['peakMemoryMb']:>8.1f} "
+          f"{r['coverage']:>9.0%} {lag:>9} {r['jpegKb']:>8.0f}")
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Print per-case deltas against the baseline; returns the list of regressions."""
+    regressions = []
+    print(f"\nAgainst baseline from {baseline.get('created', '?')} ({baseline.get('machine', {}).get('platform', '?')}):")
+    print(f"{'case':<28} {'time':>9} {'peak MB':>9} {'coverage':>9}")
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before is None:
+            print(f"{name:<28} {'(new case)':>9}")
+            continue
+        time_ratio = current["seconds"] / before["seconds"] if before["seconds"] else 1.0
+        memory_delta = current["peakMemoryMb"] - before["peakMemoryMb"]
+        coverage_delta = current["coverage"] - before["coverage"]
+        print(f"{name:<28} {time_ratio - 1:>+9.0%} {memory_delta:>+9.1f} {coverage_delta:>+9.0%}")
+        if time_ratio > 1 + threshold:
+            regressions.append(f"{name}: {time_ratio:.2f}x slower")
+        if memory_delta > max(MEMORY_FLOOR_MB, before["peakMemoryMb"] * threshold):
+            regressions.append(f"{name}: peak memory +{memory_delta:.1f} MB")
+        if coverage_delta < 0:
+            regressions.append(f"{name}: coverage {before['coverage']:.0%} -> {current['coverage']:.0%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lengths", type=int, nargs="+", default=[10, 60], help="Recording lengths in seconds")
+    parser.add_argument("--resolutions", nargs="+", default=["1280x720", "1920x1080"])
+    parser.add_argument("--changes-per-minute", type=int, nargs="+", default=[6, 30])
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--max-frames", type=int, default=None, help="Fixed frame count (default: adaptive budget)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case; the fastest counts")
+    parser.add_argument("--tolerance-ms", type=float, default=500,
+                        help="How long after a change a selected frame still counts as covering it")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results to --baseline")
+    parser.add_argument("--compare", choices=["baseline", "none"], default="baseline")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Relative slowdown / memory growth that counts as a regression")
+    args = parser.parse_args()
+
+    print_header()
+    results = run_suite(args)
+
+    regressions = []
+    if args.compare == "baseline" and not args.save_baseline:
+        if os.path.exists(args.baseline):
+            with open(args.baseline, "r", encoding="utf-8") as f:
+                regressions = compare(results, json.load(f), args.threshold)
+        else:
+            print(f"\nNo baseline at {args.baseline}; run with --save-baseline to create one")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.baseline)), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+                "machine": {"platform": platform.platform(), "python": platform.python_version(),
+                            "cpus": os.cpu_count()},
+                "params": {"fps": args.fps, "maxFrames": args.max_frames, "repeat": args.repeat,
+                           "toleranceMs": args.tolerance_ms, "seed": args.seed,
+                           "sampling": video_utils.sampling_params(args.max_frames)},
+                "results": results,
+            }, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline written to {args.baseline}")
+
+    if regressions:
+        print("\nRegressions:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Benchmark: Files API frame upload/delete, serial vs. concurrent.
+
+Replaces the Gemini client with a stub that sleeps for a configurable
+round-trip latency, then prints a per-phase timing breakdown for the old
+serial loop and for gemini._frame_parts with bounded concurrent uploads.
+
+Usage (from backend/):
+    python benchmarks/bench_frame_uploads.py --frames 12 --latency-ms 300
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+os.environ.setdefault("GENAI_API_KEY", "benchmark")
+os.environ["FRAME_TRANSPORT"] = "files"
+
+import gemini  # noqa: E402
+
+
+class StubFiles:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def upload(self, file, config=None):
+        await asyncio.sleep(self.latency)
+        return SimpleNamespace(name=config["display_name"])
+
+    async def delete(self, name):
+        await asyncio.sleep(self.latency)
+
+
+async def run(args):
+    files = StubFiles(args.latency_ms / 1000)
+    gemini.client = SimpleNamespace(aio=SimpleNamespace(files=files))
+    frames = [b"\xff\xd8" + bytes(50_000) for _ in range(args.frames)]
+
+    # Serial: what analyze_video used to do
+    start = time.perf_counter()
+    uploaded = [await files.upload(file=f, config={"display_name": f"serial-{i}"}) for i, f in enumerate(frames)]
+    serial_upload = time.perf_counter() - start
+    start = time.perf_counter()
+    for u in uploaded:
+        await files.delete(name=u.name)
+    serial_delete = time.perf_counter() - start
+
+    # Concurrent uploads; deletes are scheduled in the background
+    start = time.perf_counter()
+    uploaded = []
+    await gemini._frame_parts(frames, "bench", uploaded)
+    pooled_upload = time.perf_counter() - start
+    start = time.perf_counter()
+    gemini._delete_files_in_background(uploaded)
+    pooled_delete_blocking = time.perf_counter() - start
+    await asyncio.gather(*gemini._background_tasks)
+
+    print(f"frames={args.frames} latency={args.latency_ms:.0f}ms concurrency={gemini.UPLOAD_CONCURRENCY}")
+    print(f"{'phase':<22} {'serial (ms)':>12} {'pooled (ms)':>12}")
+    print(f"{'upload':<22} {serial_upload * 1000:>12.0f} {pooled_upload * 1000:>12.0f}")
+    print(f"{'delete (blocking)':<22} {serial_delete * 1000:>12.0f} {pooled_delete_blocking * 1000:>12.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=12)
+    parser.add_argument("--latency-ms", type=float, default=300)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Load test: /health latency while analyses and test generation are running.
+
+Drives the FastAPI app in-process with a stub Gemini client that takes
+--latency-ms per call, fires --concurrency /analyze and /generate-test
+requests in the background, and samples /health every 20ms. With
+--simulate-blocking the stub sleeps synchronously, which is what the
+backend did before Gemini/Playwright calls were moved off the event loop.
+
+Usage (from backend/):
+    python benchmarks/bench_health_latency.py --concurrency 8 --latency-ms 1500
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+_tmp = tempfile.mkdtemp(prefix="patchpilot-bench-")
+os.environ.setdefault("GENAI_API_KEY", "benchmark")
+os.environ["UPLOAD_DIR"] = _tmp
+os.environ["CACHE_PATH"] = os.path.join(_tmp, "cache.sqlite3")
+
+import httpx  # noqa: E402
+
+import app as backend  # noqa: E402
+import gemini  # noqa: E402
+from bench_extract_frames import make_recording  # noqa: E402
+
+ANALYSIS = {"title": "Bug", "timeline": [{"t": 0, "event": "click"}], "reproSteps": ["Open page"],
+            "expected": "Total updates", "actual": "Total stays $0.00"}
+TEST = {"filename": "bug.spec.ts", "playwrightSpec": "test('x', async () => {});"}
+
+
+class StubModels:
+    def __init__(self, latency: float, blocking: bool):
+        self.latency = latency
+        self.blocking = blocking
+
+    async def generate_content(self, model, contents, config=None):
+        if self.blocking:
+            time.sleep(self.latency)
+        else:
+            await asyncio.sleep(self.latency)
+        payload = TEST if isinstance(contents, str) else ANALYSIS
+        return SimpleNamespace(text=json.dumps(payload))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+async def sample_health(client, stop, samples):
+    # Latency is measured from when the probe was due, so time spent waiting
+    # for a blocked event loop counts, as it would for an external client
+    while not stop.is_set():
+        due = time.perf_counter() + 0.02
+        await asyncio.sleep(0.02)
+        await client.get("/health")
+        samples.append((time.perf_counter() - due) * 1000)
+
+
+async def run(args):
+    gemini.client = SimpleNamespace(aio=SimpleNamespace(models=StubModels(args.latency_ms / 1000, args.simulate_blocking)))
+    backend.analysis_cache.get = lambda key: None  # every request does the full work
+
+    video_path = os.path.join(_tmp, "recording.mp4")
+    make_recording(video_path, seconds=10, fps=30, width=1280, height=720)
+    with open(video_path, "rb") as f:
+        video = f.read()
+
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        idle = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_health(client, stop, idle))
+        await asyncio.sleep(1)
+        stop.set()
+        await sampler
+
+        loaded = []
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(sample_health(client, stop, loaded))
+        start = time.perf_counter()
+        work = []
+        for i in range(args.concurrency):
+            if i % 2 == 0:
+                work.append(client.post("/analyze", files={"file": ("recording.mp4", video, "video/mp4")}))
+            else:
+                work.append(client.post("/generate-test?bypass_cache=true", json=ANALYSIS))
+        responses = await asyncio.gather(*work)
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+
+    failed = [r.status_code for r in responses if r.status_code != 200]
+    mode = "blocking stub" if args.simulate_blocking else "async stub"
+    print(f"{mode}: {args.concurrency} requests in {elapsed:.2f}s ({len(failed)} failed)")
+    print(f"{'/health':<8} {'samples':>8} {'p50 (ms)':>9} {'p95 (ms)':>9} {'max (ms)':>9}")
+    for label, samples in (("idle", idle), ("loaded", loaded)):
+        print(f"{label:<8} {len(samples):>8} {statistics.median(samples):>9.1f} "
+              f"{percentile(samples, 95):>9.1f} {max(samples):>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-ms", type=float, default=1500)
+    parser.add_argument("--simulate-blocking", action="store_true")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
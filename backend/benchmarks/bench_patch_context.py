@@ -0,0 +1,154 @@
+"""
+Benchmark: generate_patch prompt size and latency with and without context
+selection.
+
+Builds the patch request for neonmart's checkout bug (subtotal shows
+$0.00) from real sources: the checkout page alone, and the checkout page
+pasted together with the store page and its data module. For each
+PATCH_CONTEXT_TOKENS budget in --budgets (0 sends the whole source, as
+before) it reports:
+- select (ms): time to build the prompt, including chunking and ranking
+- prompt tok: estimated prompt tokens (4 characters each)
+- bug / selector: whether the line with the bug (searchParams?.subtotal)
+  and the element the test asserts on (data-testid="subtotal") were kept
+- patch (s): generate_patch wall time
+
+By default Gemini is the fake server from bench_pipeline, charging
+--ms-per-1k-tokens of prompt on top of --latency-ms, so latency follows
+the prompt-size model only. With --live the real API is called and the
+prompt tokens reported are Gemini's own count.
+
+Usage (from backend/):
+    python benchmarks/bench_patch_context.py --budgets 0 500 1000 1500 2000
+    python benchmarks/bench_patch_context.py --budgets 0 1000 --live
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import threading
+import time
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+# Same file gemini.py reads; --live needs the real key, the fake server accepts any
+load_dotenv(os.path.join(os.path.dirname(__file__), "..", "..", ".env"))
+os.environ.setdefault("GENAI_API_KEY", "benchmark")
+
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+
+import bench_pipeline  # noqa: E402
+import gemini  # noqa: E402
+import metrics  # noqa: E402
+import patch_context  # noqa: E402
+from schemas import PatchRequest  # noqa: E402
+
+APP_DIR = os.path.join(bench_pipeline.NEONMART_DIR, "app")
+SOURCES = {
+    "checkout page": ["checkout/page.tsx"],
+    "checkout + store + data": ["checkout/page.tsx", "page.tsx", "lib/data.ts"],
+}
+# What a failing toHaveText reports, as failure_excerpt renders it
+FAILURE = """1 of 1 tests failed
+
+✘ checkout keeps the cart subtotal [failed] (5123ms)
+  at checkout-subtotal.spec.ts:7
+Error: expect(locator).toHaveText(expected) failed
+
+Locator: getByTestId('subtotal')
+Expected: "$89.00"
+Received: "$0.00"
+Timeout: 5000ms
+
+Call log:
+  - Expect "toHaveText" with timeout 5000ms
+  - waiting for getByTestId('subtotal')
+    9 × locator resolved to <span data-testid="subtotal">$0.00</span>
+      - unexpected value "$0.00"
+"""
+BUG_LINE = "searchParams?.subtotal"
+ASSERTED_ELEMENT = 'data-testid="subtotal"'
+
+
+def read_source(files: list) -> str:
+    parts = []
+    for name in files:
+        with open(os.path.join(APP_DIR, name), "r", encoding="utf-8") as f:
+            text = f.read()
+        # How a user pasting several files would label them
+        parts.append(f"// app/{name}\n{text}" if len(files) > 1 else text)
+    return "\n".join(parts)
+
+
+def prompt_tokens() -> int:
+    return metrics.gemini_tokens._values.get(("generate_patch", "prompt"), 0)
+
+
+async def measure(request: PatchRequest, budget: int, repeat: int, live: bool) -> dict:
+    patch_context.CONTEXT_TOKENS = budget
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        prompt = gemini.build_patch_prompt(request)
+        timings.append(time.perf_counter() - start)
+
+    tokens_before = prompt_tokens()
+    start = time.perf_counter()
+    await gemini.generate_patch(request, use_cache=False)
+    elapsed = time.perf_counter() - start
+    return {
+        "select": min(timings),
+        "tokens": prompt_tokens() - tokens_before if live else patch_context.estimate_tokens(prompt),
+        # Only the source section: the failure log quotes the asserted element too
+        "bug": BUG_LINE in prompt.split("ORIGINAL SOURCE CODE", 1)[1],
+        "selector": ASSERTED_ELEMENT in prompt.split("ORIGINAL SOURCE CODE", 1)[1],
+        "patch": elapsed,
+    }
+
+
+async def run(args):
+    spec = bench_pipeline.test_payload(args.app_url)["playwrightSpec"]
+    print(f"{'source':<26} {'budget':>7} {'select (ms)':>12} {'prompt tok':>11} {'bug':>4} {'selector':>9} "
+          f"{'patch (s)':>10}")
+    for label, files in SOURCES.items():
+        request = PatchRequest(error_log=FAILURE, failing_test=spec, original_code=read_source(files))
+        baseline = None
+        for budget in args.budgets:
+            r = await measure(request, budget, args.repeat, args.live)
+            baseline = baseline or r
+            print(f"{label:<26} {budget or 'all':>7} {r['select'] * 1000:>12.2f} {r['tokens']:>11} "
+                  f"{'yes' if r['bug'] else 'NO':>4} {'yes' if r['selector'] else 'NO':>9} {r['patch']:>10.3f}"
+                  + (f"  ({r['tokens'] / baseline['tokens'] - 1:+.0%} tokens, "
+                     f"{r['patch'] / baseline['patch'] - 1:+.0%} latency)" if r is not baseline else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[0, 500, 1000, 1500, 2000],
+                        help="PATCH_CONTEXT_TOKENS values; 0 sends the whole source")
+    parser.add_argument("--repeat", type=int, default=20, help="Prompt builds per budget; the fastest counts")
+    parser.add_argument("--app-url", default="http://localhost:3001")
+    parser.add_argument("--latency-ms", type=float, default=800, help="Fake Gemini latency per call")
+    parser.add_argument("--ms-per-1k-tokens", type=float, default=150,
+                        help="Fake Gemini latency per 1000 prompt tokens")
+    parser.add_argument("--live", action="store_true", help="Call the real Gemini API instead of the fake server")
+    args = parser.parse_args()
+
+    fake = None
+    if not args.live:
+        fake = bench_pipeline.FakeGemini(args.app_url, args.latency_ms / 1000, 0, args.ms_per_1k_tokens / 1000)
+        threading.Thread(target=fake.serve_forever, daemon=True).start()
+        gemini.client = genai.Client(api_key="benchmark", http_options=types.HttpOptions(base_url=fake.url))
+    try:
+        asyncio.run(run(args))
+    finally:
+        if fake is not None:
+            fake.shutdown()
+        shutil.rmtree(bench_pipeline._tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
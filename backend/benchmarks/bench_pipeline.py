@@ -0,0 +1,289 @@
+"""
+End-to-end benchmark: /analyze -> /generate-test -> /run-test -> /generate-patch.
+
+Gemini is replaced by a local fake server that speaks the REST API
+(generateContent and streamGenerateContent), waits --latency-ms (+/-
+--jitter-ms) per call and answers with canned AnalysisResponse,
+TestResponse and PatchResponse payloads. The google-genai client in
+gemini.py is pointed at it, so request building, retries and response
+parsing all run as in production. The canned test targets the bundled
+neonmart store and reproduces its checkout bug (subtotal shows $0.00), so
+/run-test really drives a browser against it.
+
+Each concurrency level runs --sessions full pipelines with that many in
+flight at once and reports p50/p95/p99 client latency per stage. Caches
+are bypassed so every session does the full work. Server-side stage
+timings are on GET /metrics.
+
+Needs a working runner directory (npm install + Chromium, as for /run-test)
+and neonmart running on --app-url, or --start-app to launch `next dev`
+from ../neonmart.
+
+Usage (from backend/):
+    python benchmarks/bench_pipeline.py --concurrency 1 4 8 --sessions 16 --latency-ms 800 --start-app
+"""
+import argparse
+import asyncio
+import http.server
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+_tmp = tempfile.mkdtemp(prefix="patchpilot-bench-")
+os.environ.setdefault("GENAI_API_KEY", "benchmark")
+os.environ["UPLOAD_DIR"] = _tmp
+os.environ["CACHE_PATH"] = os.path.join(_tmp, "cache.sqlite3")
+
+import httpx  # noqa: E402
+from google import genai  # noqa: E402
+from google.genai import types  # noqa: E402
+
+import app as backend  # noqa: E402
+import gemini  # noqa: E402
+from bench_extract_frames import make_recording  # noqa: E402
+
+NEONMART_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "neonmart")
+CHECKOUT_PAGE = os.path.join(NEONMART_DIR, "app", "checkout", "page.tsx")
+STAGES = ("analyze", "generate-test", "run-test", "generate-patch")
+
+
+def analysis_payload(app_url: str) -> dict:
+    return {
+        "title": "Checkout subtotal resets to $0.00",
+        "timeline": [{"t": 0, "event": "Open store"}, {"t": 2, "event": "Add Neon Hoodie to cart"},
+                     {"t": 4, "event": "Go to checkout"}, {"t": 6, "event": "Subtotal shows $0.00"}],
+        "reproSteps": ["Open the store", "Click 'Add to cart' on Neon Hoodie", "Click 'Go to checkout'"],
+        "expected": "Checkout subtotal is $89.00",
+        "actual": "Checkout subtotal is $0.00",
+        "targetUrl": app_url,
+    }
+
+
+def test_payload(app_url: str) -> dict:
+    # Plain JavaScript so it can run on the warm worker pool
+    return {
+        "filename": "checkout-subtotal.spec.ts",
+        "playwrightSpec": f"""import {{ test, expect }} from '@playwright/test';
+
+test('checkout keeps the cart subtotal', async ({{ page }}) => {{
+  await page.goto('{app_url}');
+  await page.getByTestId('add-to-cart-hoodie').click();
+  await page.getByTestId('go-to-checkout').click();
+  await expect(page.getByTestId('subtotal')).toHaveText('$89.00');
+}});
+""",
+    }
+
+
+PATCH = {
+    "diff": (
+        "--- a/neonmart/app/checkout/page.tsx\n+++ b/neonmart/app/checkout/page.tsx\n"
+        "@@ -3,16 +3,12 @@\n import { useEffect, useMemo, useState } from \"react\";\n"
+        " import Link from \"next/link\";\n+import { useSearchParams } from \"next/navigation\";\n"
+        " import { fmt } from \"../lib/data\";\n"
+        "-export default function Checkout({\n-  searchParams,\n-}: {\n-  searchParams: { subtotal?: string };\n-}) {\n"
+        "-  const baseSubtotal = Number(searchParams?.subtotal || 0);\n+export default function Checkout() {\n"
+        "+  const searchParams = useSearchParams();\n+  const baseSubtotal = Number(searchParams.get(\"subtotal\") || 0);\n"
+    ),
+    "rationale": ["Client components do not receive searchParams as props; read them with useSearchParams()"],
+    "risks": ["useSearchParams requires a Suspense boundary for static rendering"],
+}
+
+
+class FakeGemini(http.server.ThreadingHTTPServer):
+    """
+    Threaded stand-in for the Gemini REST API with a fixed per-call latency,
+    plus an optional per-prompt-token cost (prompt tokens estimated at 4
+    characters each) for benchmarks where prompt size matters.
+    """
+    daemon_threads = True
+
+    def __init__(self, app_url: str, latency: float, jitter: float, seconds_per_1k_tokens: float = 0.0):
+        super().__init__(("127.0.0.1", 0), FakeGeminiHandler)
+        self.payloads = {"analysis": analysis_payload(app_url), "test": test_payload(app_url), "patch": PATCH}
+        self.latency = latency
+        self.jitter = jitter
+        self.seconds_per_1k_tokens = seconds_per_1k_tokens
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class FakeGeminiHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode("utf-8", errors="replace")
+        server = self.server
+        with server._lock:
+            server.calls += 1
+        prefill = len(body) / 4 / 1000 * server.seconds_per_1k_tokens
+        time.sleep(max(0.0, server.latency + prefill + random.uniform(-server.jitter, server.jitter)))
+
+        # The prompts name their output fields, which is enough to pick the payload
+        if "playwrightSpec" in body:
+            kind = "test"
+        elif "unified diff" in body:
+            kind = "patch"
+        else:
+            kind = "analysis"
+        text = json.dumps(server.payloads[kind])
+        usage = {"promptTokenCount": len(body) // 4, "candidatesTokenCount": len(text) // 4,
+                 "totalTokenCount": (len(body) + len(text)) // 4}
+
+        def response(chunk: str, with_usage: bool) -> dict:
+            candidate = {"content": {"role": "model", "parts": [{"text": chunk}]}, "index": 0}
+            if with_usage:
+                candidate["finishReason"] = "STOP"
+            return {"candidates": [candidate], **({"usageMetadata": usage} if with_usage else {})}
+
+        if ":streamGenerateContent" in self.path:
+            size = max(1, len(text) // 4)
+            chunks = [text[i:i + size] for i in range(0, len(text), size)]
+            payload = "".join(f"data: {json.dumps(response(c, i == len(chunks) - 1))}\r\n\r\n"
+                              for i, c in enumerate(chunks)).encode("utf-8")
+            content_type = "text/event-stream"
+        else:
+            payload = json.dumps(response(text, True)).encode("utf-8")
+            content_type = "application/json"
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def start_neonmart(app_url: str) -> subprocess.Popen:
+    port = app_url.rstrip("/").rsplit(":", 1)[-1]
+    proc = subprocess.Popen(["npx", "next", "dev", "-p", port], cwd=NEONMART_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        try:
+            # First request compiles the pages; warm both before timing anything
+            urllib.request.urlopen(app_url, timeout=60).read()
+            urllib.request.urlopen(app_url.rstrip("/") + "/checkout?subtotal=1", timeout=60).read()
+            return proc
+        except OSError:
+            if proc.poll() is not None:
+                raise RuntimeError("neonmart exited during startup (run npm install in neonmart/)")
+            time.sleep(1)
+    proc.kill()
+    raise RuntimeError(f"neonmart did not come up on {app_url}")
+
+
+async def session(client, video: bytes, original_code: str, timings: dict, statuses: dict):
+    async def timed(stage, request):
+        start = time.perf_counter()
+        response = await request
+        timings[stage].append((time.perf_counter() - start) * 1000)
+        statuses[stage][response.status_code] = statuses[stage].get(response.status_code, 0) + 1
+        response.raise_for_status()
+        return response.json()
+
+    analysis = await timed("analyze", client.post("/analyze", files={"file": ("recording.mp4", video, "video/mp4")}))
+    test = await timed("generate-test", client.post("/generate-test?bypass_cache=true", json=analysis))
+    run = await timed("run-test", client.post("/run-test", json=test))
+    statuses["run-result"][run["status"]] = statuses["run-result"].get(run["status"], 0) + 1
+    await timed("generate-patch", client.post("/generate-patch?bypass_cache=true", json={
+        "analysis": analysis,
+        "error_log": run.get("stderr") or run.get("stdout") or "No error log available",
+        "run_result": run,
+        "failing_test": test["playwrightSpec"],
+        "original_code": original_code,
+    }))
+
+
+async def run_level(client, concurrency: int, sessions: int, video: bytes, original_code: str):
+    timings = {stage: [] for stage in STAGES}
+    statuses = {stage: {} for stage in (*STAGES, "run-result")}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded():
+        async with semaphore:
+            try:
+                await session(client, video, original_code, timings, statuses)
+            except httpx.HTTPStatusError:
+                pass
+
+    start = time.perf_counter()
+    await asyncio.gather(*(bounded() for _ in range(sessions)))
+    return time.perf_counter() - start, timings, statuses
+
+
+async def run(args, fake: FakeGemini):
+    gemini.client = genai.Client(api_key="benchmark", http_options=types.HttpOptions(base_url=fake.url))
+    backend.analysis_cache.get = lambda key: None  # every session does the full work
+
+    video_path = os.path.join(_tmp, "recording.mp4")
+    make_recording(video_path, seconds=args.video_seconds, fps=30, width=1280, height=720)
+    with open(video_path, "rb") as f:
+        video = f.read()
+    with open(CHECKOUT_PAGE, "r", encoding="utf-8") as f:
+        original_code = f.read()
+
+    print(f"Fake Gemini on {fake.url}: {args.latency_ms:.0f}ms +/- {args.jitter_ms:.0f}ms per call; "
+          f"neonmart on {args.app_url}")
+    transport = httpx.ASGITransport(app=backend.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for concurrency in args.concurrency:
+            elapsed, timings, statuses = await run_level(client, concurrency, args.sessions, video, original_code)
+            completed = len(timings["generate-patch"])
+            print(f"\nconcurrency {concurrency}: {completed}/{args.sessions} pipelines in {elapsed:.1f}s "
+                  f"({completed / elapsed:.2f}/s), run-test results {statuses['run-result']}")
+            print(f"{'stage':<16} {'n':>4} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10} {'max (ms)':>10}  status")
+            for stage in STAGES:
+                samples = timings[stage]
+                if not samples:
+                    print(f"{stage:<16} {0:>4} {'-':>10} {'-':>10} {'-':>10} {'-':>10}  {statuses[stage]}")
+                    continue
+                print(f"{stage:<16} {len(samples):>4} {statistics.median(samples):>10.0f} "
+                      f"{percentile(samples, 95):>10.0f} {percentile(samples, 99):>10.0f} {max(samples):>10.0f}  "
+                      f"{statuses[stage]}")
+    await backend.playwright_pool.stop()
+    print(f"\n{fake.calls} fake Gemini calls")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--sessions", type=int, default=16, help="pipelines per concurrency level")
+    parser.add_argument("--latency-ms", type=float, default=800, help="fake Gemini latency per call")
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--video-seconds", type=int, default=10)
+    parser.add_argument("--app-url", default="http://localhost:3001/")
+    parser.add_argument("--start-app", action="store_true", help="run `next dev` in ../neonmart on --app-url")
+    args = parser.parse_args()
+
+    fake = FakeGemini(args.app_url, args.latency_ms / 1000, args.jitter_ms / 1000)
+    threading.Thread(target=fake.serve_forever, daemon=True).start()
+    app_proc = start_neonmart(args.app_url) if args.start_app else None
+    try:
+        asyncio.run(run(args, fake))
+    finally:
+        fake.shutdown()
+        if app_proc is not None:
+            app_proc.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark: cold `npx playwright test` vs. the warm worker pool.
+
+Serves a small page from a local http.server, then runs the same short spec
+--runs times through run_playwright_test with the pool disabled (one npx
+process per run) and with it enabled. The first pooled run includes worker
+startup and is reported separately.
+
+Needs a working runner directory (npm install + Chromium), the same as
+/run-test.
+
+Usage (from backend/):
+    python benchmarks/bench_playwright_pool.py --runs 10 --pool-size 2
+"""
+import argparse
+import asyncio
+import functools
+import http.server
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import playwright_runner  # noqa: E402
+from playwright_pool import PlaywrightPool  # noqa: E402
+
+PAGE = """<!doctype html>
+<title>Bench</title>
+<button id="add" onclick="document.getElementById('total').textContent = '$19.99'">Add</button>
+<span id="total">$0.00</span>
+"""
+
+# Plain JavaScript so the warm worker can load it without a TS transform
+SPEC = """import { test, expect } from '@playwright/test';
+
+test('total updates after add', async ({ page }) => {
+  await page.goto('%s');
+  await page.click('#add');
+  await expect(page.locator('#total')).toHaveText('$19.99');
+});
+"""
+
+
+def serve(directory: str) -> http.server.ThreadingHTTPServer:
+    with open(os.path.join(directory, "index.html"), "w") as f:
+        f.write(PAGE)
+    handler = functools.partial(http.server.SimpleHTTPRequestHandler, directory=directory)
+    handler.log_message = lambda *args: None
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def timed_runs(spec: str, runs: int):
+    timings, statuses = [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        result = await playwright_runner.run_playwright_test(spec)
+        timings.append((time.perf_counter() - started) * 1000)
+        statuses.append(result["status"])
+    return timings, statuses
+
+
+def summary(label: str, timings, statuses):
+    passed = statuses.count("passed")
+    print(f"{label:<14} runs={len(timings):<3} passed={passed:<3} "
+          f"mean={statistics.mean(timings):7.0f}ms  median={statistics.median(timings):7.0f}ms  "
+          f"min={min(timings):7.0f}ms")
+
+
+async def run(args):
+    site = tempfile.mkdtemp(prefix="patchpilot-bench-site-")
+    server = serve(site)
+    spec = SPEC % f"http://127.0.0.1:{server.server_address[1]}/index.html"
+
+    try:
+        # Cold: pool disabled, every run spawns npx
+        playwright_runner.pool = PlaywrightPool(size=0)
+        cold, cold_status = await timed_runs(spec, args.runs)
+
+        # Warm: the first run also starts the workers
+        pool = PlaywrightPool(size=args.pool_size, max_runs=args.max_runs, health_interval=0)
+        playwright_runner.pool = pool
+        first, first_status = await timed_runs(spec, 1)
+        warm, warm_status = await timed_runs(spec, args.runs)
+        stats = pool.stats()
+        await pool.stop()
+    finally:
+        server.shutdown()
+
+    summary("cold npx", cold, cold_status)
+    summary("pool startup", first, first_status)
+    summary("warm pool", warm, warm_status)
+    print(f"speedup (median): {statistics.median(cold) / statistics.median(warm):.1f}x")
+    print(f"pool: {stats}")
+    if stats["fallbacks"]:
+        print("warning: some pooled runs fell back to npx; warm timings include them")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--pool-size", type=int, default=2)
+    parser.add_argument("--max-runs", type=int, default=50)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
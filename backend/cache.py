@@ -0,0 +1,187 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+# Cache database location - can be overridden via env
+CACHE_PATH = os.getenv("CACHE_PATH", os.path.join(os.getenv("UPLOAD_DIR", "temp"), "cache.sqlite3"))
+# Hits only record their access time in memory; the LRU timestamps are
+# written in one batch at most this often, and before every eviction
+ACCESS_FLUSH_SECONDS = 30
+
+
+def make_key(*parts: Any) -> str:
+    """Stable SHA-256 key for any JSON-serializable combination of values."""
+    payload = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Persistent key/value cache for JSON responses, backed by SQLite.
+
+    Entries older than ttl_seconds are treated as misses and removed. Once a
+    namespace holds more than max_entries, the least recently read entries
+    are evicted. Several namespaces can share one database file.
+
+    With memory_entries > 0, a bounded in-process LRU sits in front of
+    SQLite so hot keys are served without touching the database.
+
+    Calls are blocking (SQLite, and a commit on every set); async callers
+    run them in a thread.
+    """
+
+    def __init__(self, namespace: str, max_entries: int = 500, ttl_seconds: Optional[float] = None,
+                 path: str = CACHE_PATH, memory_entries: int = 0):
+        self.namespace = namespace
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()  # key -> (created_at, value)
+        self._accessed = {}  # key -> accessed_at not yet written
+        self._flushed_at = time.time()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS cache_entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (namespace, accessed_at)"
+        )
+        self._conn.commit()
+
+    def _remember(self, key: str, created_at: float, value: Any):
+        if self.memory_entries <= 0:
+            return
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _flush_access(self):
+        """Write pending access times; the caller holds the lock and commits."""
+        if self._accessed:
+            self._conn.executemany(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                [(accessed_at, self.namespace, key) for key, accessed_at in self._accessed.items()],
+            )
+            self._accessed.clear()
+        self._flushed_at = time.time()
+
+    def _touch(self, key: str, now: float):
+        self._accessed[key] = now
+        if now - self._flushed_at >= ACCESS_FLUSH_SECONDS:
+            self._flush_access()
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self.ttl_seconds is None or now - entry[0] <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._touch(key, now)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key),
+            ).fetchone()
+
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+                )
+                self._conn.commit()
+                self._accessed.pop(key, None)
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._touch(key, now)
+            self.hits += 1
+            value = json.loads(row[0])
+            self._remember(key, row[1], value)
+            return value
+
+    def set(self, key: str, value: Any):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now),
+            )
+            self._accessed.pop(key, None)
+            # Eviction goes by accessed_at, so it must see the batched hits
+            self._flush_access()
+            # LRU eviction: keep only the most recently read max_entries
+            self._conn.execute(
+                """
+                DELETE FROM cache_entries WHERE namespace = ? AND key NOT IN (
+                    SELECT key FROM cache_entries WHERE namespace = ?
+                    ORDER BY accessed_at DESC LIMIT ?
+                )
+                """,
+                (self.namespace, self.namespace, self.max_entries),
+            )
+            self._conn.commit()
+            self._remember(key, now, value)
+
+    def invalidate(self, key: Optional[str] = None) -> int:
+        """Drop one entry, or the whole namespace when key is None. Returns rows removed."""
+        with self._lock:
+            if key is None:
+                self._memory.clear()
+                self._accessed.clear()
+            else:
+                self._memory.pop(key, None)
+                self._accessed.pop(key, None)
+
+            if key is None:
+                cur = self._conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+            else:
+                cur = self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+                )
+            self._conn.commit()
+            return cur.rowcount
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hitRate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "entries": entries,
+            "memoryEntries": len(self._memory),
+            "maxEntries": self.max_entries,
+            "ttlSeconds": self.ttl_seconds,
+        }
@@ -0,0 +1,190 @@
+import json
+import os
+import traceback
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+# Default origins for local development
+DEFAULT_ORIGINS = (
+    "http://localhost:3000",
+    "http://localhost:3001",
+    "http://127.0.0.1:3000",
+    "http://127.0.0.1:3001",
+)
+ALLOW_METHODS = "GET, POST, PUT, DELETE, OPTIONS"
+PREFLIGHT_MAX_AGE = "600"
+
+Headers = List[Tuple[bytes, bytes]]
+# Response headers this layer owns; any set by the app are replaced
+_OWNED = frozenset({
+    b"access-control-allow-origin",
+    b"access-control-allow-credentials",
+    b"access-control-allow-methods",
+    b"access-control-allow-headers",
+    b"access-control-expose-headers",
+})
+
+
+def parse_origins(value: Optional[str]) -> Tuple[str, ...]:
+    """
+    Allowed origins: the defaults plus CORS_ALLOWED_ORIGINS, which is comma-
+    or space-separated (e.g. "http://localhost:3000,https://example.com").
+    Trailing slashes are dropped; order is kept, duplicates removed.
+    """
+    extra = [origin.strip().rstrip("/") for origin in (value or "").replace(",", " ").split() if origin.strip()]
+    return tuple(dict.fromkeys([*DEFAULT_ORIGINS, *extra]))
+
+
+class CORSPolicy:
+    """
+    Immutable CORS decision table, built once.
+
+    Every allowed origin maps to its complete, pre-encoded header list, so
+    answering a request is one dict lookup. Disallowed or missing origins
+    get the first allowed origin, which keeps headers present on every
+    response (browsers then reject it, as before).
+    """
+
+    def __init__(self, origins: Tuple[str, ...]):
+        self.origins: Tuple[str, ...] = origins
+        self.origin_set: FrozenSet[str] = frozenset(origins)
+        common = [
+            (b"access-control-allow-credentials", b"true"),
+            (b"access-control-allow-methods", ALLOW_METHODS.encode("latin-1")),
+            (b"access-control-allow-headers", b"*"),
+            (b"access-control-expose-headers", b"*"),
+        ]
+        self._headers: Dict[bytes, Headers] = {
+            origin.encode("latin-1"): [(b"access-control-allow-origin", origin.encode("latin-1")), *common]
+            for origin in origins
+        }
+        fallback = origins[0].encode("latin-1") if origins else b"*"
+        self._fallback: Headers = [(b"access-control-allow-origin", fallback), *common]
+
+    @classmethod
+    def from_env(cls) -> "CORSPolicy":
+        return cls(parse_origins(os.getenv("CORS_ALLOWED_ORIGINS", "")))
+
+    def is_allowed(self, origin: Optional[str]) -> bool:
+        return bool(origin) and origin.rstrip("/") in self.origin_set
+
+    def headers_for(self, origin: Optional[bytes]) -> Headers:
+        if origin:
+            headers = self._headers.get(origin)
+            if headers is None and origin.endswith(b"/"):
+                headers = self._headers.get(origin.rstrip(b"/"))
+            if headers is not None:
+                return headers
+        return self._fallback
+
+    def header_dict(self, origin: Optional[str]) -> Dict[str, str]:
+        """Headers for responses built outside the middleware (exception handlers)."""
+        encoded = origin.encode("latin-1") if origin else None
+        return {name.decode("latin-1"): value.decode("latin-1") for name, value in self.headers_for(encoded)}
+
+
+_policy = CORSPolicy.from_env()
+
+
+def current_policy() -> CORSPolicy:
+    return _policy
+
+
+def reload_policy() -> CORSPolicy:
+    """Rebuild the policy from the environment; requests already in flight keep the old one."""
+    global _policy
+    _policy = CORSPolicy.from_env()
+    print(f"[CORS] Allowed origins: {list(_policy.origins)}")
+    return _policy
+
+
+class CORSHeaderMiddleware:
+    """
+    Pure ASGI CORS layer.
+
+    Answers preflight requests itself and adds CORS headers to every other
+    response, including 500s for exceptions that escape the app. Unlike
+    BaseHTTPMiddleware it does not run the app in a separate task or buffer
+    the response, so streaming responses pass straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        origin = None
+        preflight_method = None
+        request_headers = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                preflight_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+        policy = _policy
+        cors_headers = policy.headers_for(origin)
+
+        if scope["method"] == "OPTIONS" and origin is not None and preflight_method is not None:
+            await self._preflight(policy, origin, request_headers, cors_headers, send)
+            return
+
+        started = False
+
+        async def send_with_cors(message):
+            nonlocal started
+            if message["type"] == "http.response.start":
+                started = True
+                headers = [h for h in message.get("headers", []) if h[0] not in _OWNED and h[0] != b"vary"]
+                vary = [v for k, v in message.get("headers", []) if k == b"vary"]
+                headers.extend(cors_headers)
+                headers.append((b"vary", b", ".join(vary + [b"Origin"]) if vary else b"Origin"))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_cors)
+        except Exception as e:
+            if started:
+                raise
+            # Even on exceptions, return CORS headers so the browser shows the error
+            traceback.print_exc()
+            body = json.dumps({"detail": str(e), "type": type(e).__name__}).encode("utf-8")
+            await send({
+                "type": "http.response.start",
+                "status": 500,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                    *cors_headers,
+                    (b"vary", b"Origin"),
+                ],
+            })
+            await send({"type": "http.response.body", "body": body})
+
+    async def _preflight(self, policy: CORSPolicy, origin: bytes, request_headers: Optional[bytes],
+                         cors_headers: Headers, send):
+        if not policy.is_allowed(origin.decode("latin-1")):
+            body = b"Disallowed CORS origin"
+            await send({
+                "type": "http.response.start",
+                "status": 400,
+                "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                            (b"content-length", str(len(body)).encode("latin-1")), (b"vary", b"Origin")],
+            })
+            await send({"type": "http.response.body", "body": body})
+            return
+        headers = [h for h in cors_headers if h[0] != b"access-control-allow-headers"]
+        # "*" is not honoured for credentialed requests, so echo what was asked for
+        headers.append((b"access-control-allow-headers", request_headers or b"*"))
+        headers.extend([
+            (b"access-control-max-age", PREFLIGHT_MAX_AGE.encode("latin-1")),
+            (b"content-length", b"2"),
+            (b"content-type", b"text/plain; charset=utf-8"),
+            (b"vary", b"Origin"),
+        ])
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": b"OK"})
@@ -1,7 +1,21 @@
 import re
+import io
+import time
+import uuid
+import random
+import asyncio
 from google import genai
+from google.genai import types, errors
+from pydantic import ValidationError
+import httpx
 import json
 from schemas import AnalysisResponse, TestResponse, PatchResponse
+from cache import ResponseCache, make_key
+import progress
+import metrics
+from json_stream import IncrementalJSONParser
+from run_report import failure_excerpt, clip_log
+import patch_context
 import os
 from dotenv import load_dotenv
 
@@ -20,6 +34,37 @@ if not api_key:
 
 client = genai.Client(api_key=api_key)
 
+# Prompt-level cache for generate_test / generate_patch responses
+prompt_cache = ResponseCache(
+    "prompt",
+    max_entries=int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "1000")),
+    ttl_seconds=float(os.getenv("PROMPT_CACHE_TTL_HOURS", "24")) * 3600,
+    memory_entries=int(os.getenv("PROMPT_CACHE_MEMORY_ENTRIES", "128")),
+)
+
+# Requests above ~20MB are rejected when media is sent inline; larger frame
+# sets go through the Files API instead. FRAME_TRANSPORT forces one mode:
+# "auto" (default), "inline" or "files".
+INLINE_BYTES_LIMIT = 18 * 1024 * 1024
+FRAME_TRANSPORT = os.getenv("FRAME_TRANSPORT", "auto")
+
+# Files API uploads run concurrently on the async client, bounded by a semaphore
+UPLOAD_CONCURRENCY = int(os.getenv("GEMINI_UPLOAD_CONCURRENCY", "8"))
+_upload_semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+
+# Uploaded videos must finish server-side processing before generate_content
+# accepts them
+VIDEO_PROCESSING_TIMEOUT = float(os.getenv("GEMINI_VIDEO_PROCESSING_TIMEOUT", "120"))
+VIDEO_POLL_INTERVAL = 1.0
+
+# Strong references to fire-and-forget tasks (background deletes)
+_background_tasks = set()
+
+# Retry policy for transient Gemini failures (rate limits, 5xx, network)
+MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))
+RETRY_BASE_DELAY = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "1.0"))
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
 #genai.configure(api_key=os.getenv("GENAI_API_KEY"))
 #model = client.models.get("gemini-3-flash-preview")
 
@@ -30,12 +75,202 @@ def clear_json_response(text):
         return match.group(1).strip()
     return text.strip()
 
-def analyze_video(frames):
-    prompt = """
-    You are a senior QA automation engineer.
+def _prompt_cache_key(prompt, response_schema, config):
+    # The exact prompt: it embeds user source and specs, where indentation is
+    # meaningful (Python, YAML, JSX nesting) and must not share an entry
+    return make_key(prompt, response_schema, MODEL_ID, config)
+
+def _is_transient(exc):
+    if isinstance(exc, errors.APIError):
+        return exc.code in TRANSIENT_STATUS_CODES
+    return isinstance(exc, (httpx.TransportError, ConnectionError, TimeoutError))
+
+def _is_schema_error(exc):
+    # Output that is not valid JSON / does not match the model, or the API rejecting response_schema
+    if isinstance(exc, (json.JSONDecodeError, ValidationError)):
+        return True
+    return isinstance(exc, errors.ClientError) and exc.code == 400
+
+async def _call_with_retries(call):
+    """Await call(), retrying transient failures with exponential backoff and jitter."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= MAX_RETRIES or not _is_transient(e):
+                raise
+            delay = RETRY_BASE_DELAY * (2 ** attempt) * random.uniform(0.5, 1.0)
+            print(f"[Gemini] Transient error ({type(e).__name__}: {e}); retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+async def _generate_json(contents, response_schema, config, response_model, operation):
+    """
+    Generate a JSON response and validate it into response_model.
+
+    Structured output (response_schema) is tried first. Transient errors are
+    retried with backoff; only schema-related failures fall back to plain
+    JSON mode. contents is reused as-is across attempts, so uploaded file
+    handles stay valid and are never uploaded twice. operation labels the
+    call in /metrics.
+
+    When an attempt that already streamed text is retried or falls back, a
+    model.reset event tells listeners to drop that text and its fields
+    before the new attempt streams from the start.
+    """
+    streamed = False   # the last attempt emitted model.delta events
+    restart = "retry"  # why the next attempt starts over
+
+    async def attempt(extra_config):
+        nonlocal streamed, restart
+        if streamed:
+            progress.emit("model.reset", reason=restart)
+            streamed = False
+        restart = "retry"
+        request_config = {**config, "response_mime_type": "application/json", **extra_config}
+        progress.emit("model.started", model=MODEL_ID, structured="response_schema" in extra_config)
+        start = time.perf_counter()
+        usage = None
+        if progress.streaming():
+            # Someone is listening: stream tokens as they are generated and
+            # surface top-level JSON fields (diff, rationale, ...) as they fill in
+            text = ""
+            parser = IncrementalJSONParser()
+            stream = await client.aio.models.generate_content_stream(
+                model=MODEL_ID, contents=contents, config=request_config
+            )
+            async for chunk in stream:
+                # Usage metadata is cumulative; the last chunk has the totals
+                usage = chunk.usage_metadata or usage
+                if chunk.text:
+                    text += chunk.text
+                    streamed = True
+                    progress.emit("model.delta", text=chunk.text)
+                    for update in parser.feed(chunk.text):
+                        progress.emit("model.field", **update)
+        else:
+            response = await client.aio.models.generate_content(
+                model=MODEL_ID, contents=contents, config=request_config
+            )
+            text = response.text
+            usage = response.usage_metadata
+        metrics.observe_stage("gemini_generate", time.perf_counter() - start)
+        metrics.record_usage(operation, usage)
+        result = response_model(**json.loads(clear_json_response(text)))
+        progress.emit("model.completed", chars=len(text))
+        return result
+
+    metrics.gemini_requests.inc(operation=operation)
+    try:
+        return await _call_with_retries(lambda: attempt({"response_schema": response_schema}))
+    except Exception as e:
+        if not _is_schema_error(e):
+            raise
+        # Fallback: try without response schema
+        print(f"[Gemini] Structured output failed ({type(e).__name__}); retrying without response schema")
+        progress.emit("model.fallback", reason=type(e).__name__)
+        metrics.gemini_fallbacks.inc(operation=operation)
+        restart = "fallback"
+        return await _call_with_retries(lambda: attempt({}))
+
+async def _upload_frame(frame, display_name):
+    async with _upload_semaphore:
+        return await _call_with_retries(lambda: client.aio.files.upload(
+            file=io.BytesIO(frame),
+            config={"mime_type": "image/jpeg", "display_name": display_name}
+        ))
+
+async def _delete_file(name):
+    try:
+        with metrics.stage("gemini_delete"):
+            await client.aio.files.delete(name=name)
+    except Exception as e:
+        print(f"[Gemini] Warning: failed to delete uploaded file {name}: {e}")
+
+def _delete_files_in_background(uploaded_files):
+    """Schedule deletes as tasks so the response does not wait for them."""
+    for uploaded_file in uploaded_files:
+        task = asyncio.create_task(_delete_file(uploaded_file.name))
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+async def _frame_parts(frames, request_id, uploaded_files):
+    """
+    Build content parts for in-memory JPEG frames.
+
+    Frames are sent inline as bytes parts when they fit in one request.
+    Otherwise they are uploaded concurrently through the Files API; uploaded
+    handles are appended to uploaded_files (in frame order) so the caller can
+    delete them, even when some of the uploads failed.
+    """
+    use_inline = FRAME_TRANSPORT == "inline" or (
+        FRAME_TRANSPORT != "files" and sum(len(frame) for frame in frames) <= INLINE_BYTES_LIMIT
+    )
+    if use_inline:
+        progress.emit("frames.uploaded", count=len(frames), transport="inline")
+        return [types.Part.from_bytes(data=frame, mime_type="image/jpeg") for frame in frames]
+
+    results = await asyncio.gather(
+        *(_upload_frame(frame, f"{request_id}-frame-{i:03d}") for i, frame in enumerate(frames)),
+        return_exceptions=True
+    )
+    first_error = None
+    for result in results:
+        if isinstance(result, BaseException):
+            first_error = first_error or result
+        else:
+            uploaded_files.append(result)
+    if first_error is not None:
+        raise first_error
+    progress.emit("frames.uploaded", count=len(uploaded_files), transport="files")
+    return list(uploaded_files)
+
+def _log_timings(request_id, media, uploaded_files, timings):
+    # media describes what was sent, e.g. "12 frames" or "340 KB clip at 1 fps"
+    transport = "files" if uploaded_files else "inline"
+    phases = ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in timings.items())
+    print(f"[Analyze {request_id}] {media} via {transport}: {phases}")
+
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "timeline": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "t": {"type": "integer"},
+                    "event": {"type": "string"}
+                },
+                "required": ["t", "event"]
+            }
+        },
+        "reproSteps": {
+            "type": "array",
+            "items": {"type": "string"}
+        },
+        "expected": {"type": "string"},
+        "actual": {"type": "string"},
+        "targetUrl": {"type": "string"}
+    },
+    "required": ["title", "timeline", "reproSteps", "expected", "actual"]
+}
 
+FRAMES_INPUT = """
     Your task is to analyze a sequence of UI screenshots from a bug recording.
+    The first screenshot shows the full screen; later ones may be cropped to
+    the part of the UI that changed during the recording.
+"""
+
+VIDEO_INPUT = """
+    Your task is to analyze a screen recording of a bug.
+    Each timeline "t" is the time in seconds from the start of the video.
+"""
 
+def _analysis_prompt(media_description):
+    return f"""
+    You are a senior QA automation engineer.
+    {media_description}
     You MUST:
     - Infer user intent
     - Identify UI transitions
@@ -44,104 +279,111 @@ def analyze_video(frames):
 
     You MUST return ONLY valid JSON matching this schema:
 
-    {
+    {{
     "title": string,
-    "timeline": [{"t": number, "event": string}],
+    "timeline": [{{"t": number, "event": string}}],
     "reproSteps": string[],
     "expected": string,
     "actual": string,
     "targetUrl": string (optional)
-    }
+    }}
     Do not include markdown or explanation.
     """
-    
-    # Define JSON schema for structured output
-    response_schema = {
-        "type": "object",
-        "properties": {
-            "title": {"type": "string"},
-            "timeline": {
-                "type": "array",
-                "items": {
-                    "type": "object",
-                    "properties": {
-                        "t": {"type": "integer"},
-                        "event": {"type": "string"}
-                    },
-                    "required": ["t", "event"]
-                }
-            },
-            "reproSteps": {
-                "type": "array",
-                "items": {"type": "string"}
-            },
-            "expected": {"type": "string"},
-            "actual": {"type": "string"},
-            "targetUrl": {"type": "string"}
-        },
-        "required": ["title", "timeline", "reproSteps", "expected", "actual"]
-    }
 
+async def _generate_analysis(prompt, parts):
+    return await _generate_json(
+        [prompt] + parts,
+        ANALYSIS_SCHEMA,
+        {"temperature": 0.1, "top_p": 0.5},
+        AnalysisResponse,
+        "analyze"
+    )
+
+async def _timed_analysis(prompt, build_parts, request_id, media):
+    """
+    Build the content parts (build_parts(uploaded_files) appends any Files
+    API handles), run the analysis and log both phases. Uploaded files are
+    deleted afterwards, also on failure.
+    """
+    timings = {}
+    uploaded_files = []
     try:
-        # Upload files using the files API
-        uploaded_files = []
-        try:
-            # Use client.files.upload() method - takes 'file' parameter, not 'path'
-            for frame_path in frames:
-                uploaded_file = client.files.upload(file=frame_path)
-                uploaded_files.append(uploaded_file)
-            
-            # Uploaded files can be used directly in contents
-            response = client.models.generate_content(
-                model=MODEL_ID,
-                contents=[prompt] + uploaded_files,
-                config={
-                    "temperature": 0.1,
-                    "top_p": 0.5,
-                    "response_mime_type": "application/json",
-                    "response_schema": response_schema
-                }
-            )
-        finally:
-            # Cleanup uploaded files
-            for uploaded_file in uploaded_files:
-                try:
-                    client.files.delete(uploaded_file.name)
-                except:
-                    pass
-
-        clean_data = clear_json_response(response.text)
-        data = json.loads(clean_data)
-
-        return AnalysisResponse(**data)
-    except Exception as e:
-        # Fallback: try without response schema
-        uploaded_files = []
-        try:
-            for frame_path in frames:
-                uploaded_file = client.files.upload(file=frame_path)
-                uploaded_files.append(uploaded_file)
-            
-            response = client.models.generate_content(
-                model=MODEL_ID,
-                contents=[prompt] + uploaded_files,
-                config={
-                    "temperature": 0.1,
-                    "top_p": 0.5,
-                    "response_mime_type": "application/json"
-                }
-            )
-            clean_data = clear_json_response(response.text)
-            data = json.loads(clean_data)
-            return AnalysisResponse(**data)
-        finally:
-            for uploaded_file in uploaded_files:
-                try:
-                    client.files.delete(uploaded_file.name)
-                except:
-                    pass
-
-def generate_test(analysis):
+        start = time.perf_counter()
+        parts = await build_parts(uploaded_files)
+        timings["upload"] = time.perf_counter() - start
+        if uploaded_files:
+            metrics.observe_stage("gemini_upload", timings["upload"])
+
+        start = time.perf_counter()
+        result = await _generate_analysis(prompt, parts)
+        timings["generate"] = time.perf_counter() - start
+    finally:
+        # Cleanup uploaded files without holding up the response
+        _delete_files_in_background(uploaded_files)
+
+    _log_timings(request_id, media, uploaded_files, timings)
+    return result
+
+async def analyze_video(frames, request_id=None):
+    """Analyze in-memory JPEG frames (as returned by extract_frames)."""
+    request_id = request_id or uuid.uuid4().hex[:8]
+    return await _timed_analysis(
+        _analysis_prompt(FRAMES_INPUT),
+        lambda uploaded_files: _frame_parts(frames, request_id, uploaded_files),
+        request_id,
+        f"{len(frames)} frames"
+    )
+
+async def _wait_until_active(uploaded_file):
+    """Uploaded videos are processed before they can be used; poll until that is done."""
+    deadline = time.monotonic() + VIDEO_PROCESSING_TIMEOUT
+    while uploaded_file.state == types.FileState.PROCESSING:
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Uploaded video {uploaded_file.name} still processing after {VIDEO_PROCESSING_TIMEOUT:g}s")
+        await asyncio.sleep(VIDEO_POLL_INTERVAL)
+        uploaded_file = await _call_with_retries(lambda: client.aio.files.get(name=uploaded_file.name))
+    if uploaded_file.state == types.FileState.FAILED:
+        raise RuntimeError(f"Gemini could not process uploaded video {uploaded_file.name}")
+    return uploaded_file
+
+async def _clip_part(clip, fps, request_id, uploaded_files):
+    """
+    Build the content part for a transcoded MP4 clip: inline when it fits in
+    one request (and FRAME_TRANSPORT allows it), otherwise through the Files
+    API. fps tells Gemini how densely to sample the clip.
+    """
+    video_metadata = types.VideoMetadata(fps=fps)
+    if FRAME_TRANSPORT == "inline" or (FRAME_TRANSPORT != "files" and len(clip) <= INLINE_BYTES_LIMIT):
+        progress.emit("clip.uploaded", bytes=len(clip), transport="inline")
+        return types.Part(inline_data=types.Blob(data=clip, mime_type="video/mp4"), video_metadata=video_metadata)
+
+    uploaded_file = await _call_with_retries(lambda: client.aio.files.upload(
+        file=io.BytesIO(clip),
+        config={"mime_type": "video/mp4", "display_name": f"{request_id}-clip"}
+    ))
+    uploaded_files.append(uploaded_file)
+    uploaded_file = await _wait_until_active(uploaded_file)
+    progress.emit("clip.uploaded", bytes=len(clip), transport="files")
+    return types.Part(
+        file_data=types.FileData(file_uri=uploaded_file.uri, mime_type=uploaded_file.mime_type),
+        video_metadata=video_metadata
+    )
+
+async def analyze_clip(clip, fps, request_id=None):
+    """Analyze one transcoded MP4 clip (as returned by video_clip.transcode_clip)."""
+    request_id = request_id or uuid.uuid4().hex[:8]
+
+    async def clip_parts(uploaded_files):
+        return [await _clip_part(clip, fps, request_id, uploaded_files)]
+
+    return await _timed_analysis(
+        _analysis_prompt(VIDEO_INPUT),
+        clip_parts,
+        request_id,
+        f"{len(clip) // 1024} KB clip at {fps:g} fps"
+    )
+
+async def generate_test(analysis, use_cache=True):
     target_url = analysis.targetUrl or 'http://localhost:3001/'
     prompt = f"""
     You are a senior SDET. Write a robust Playwright test from these steps: {analysis.reproSteps}
@@ -189,41 +431,58 @@ def generate_test(analysis):
         },
         "required": ["filename", "playwrightSpec"]
     }
-    try:
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt,
-            config={
-                "temperature": 0.1,
-                "top_p": 0.5,
-                "response_mime_type": "application/json",
-                "response_schema": response_schema
-            }
-        )
-        data = json.loads(clear_json_response(response.text))
-        return TestResponse(**data)
-    except Exception as e:
-        # Fallback: try without response schema
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt,
-            config={
-                "temperature": 0.1,
-                "top_p": 0.5,
-                "response_mime_type": "application/json"
-            }
-        )
-        data = json.loads(clear_json_response(response.text))
-        return TestResponse(**data)
 
-def generate_patch(request):
+    config = {"temperature": 0.1, "top_p": 0.5}
+    cache_key = _prompt_cache_key(prompt, response_schema, config)
+    if use_cache:
+        # SQLite reads and commits block; keep them off the event loop
+        cached = await asyncio.to_thread(prompt_cache.get, cache_key)
+        if cached is not None:
+            return TestResponse(**cached)
+
+    with metrics.stage("test_generation"):
+        result = await _generate_json(prompt, response_schema, config, TestResponse, "generate_test")
+    await asyncio.to_thread(prompt_cache.set, cache_key, result.model_dump())
+    return result
+
+def _failure_log(request) -> str:
+    """Only the failing tests from the structured run report; the clipped raw log when there is none."""
+    report = (request.run_result or {}).get("report")
+    excerpt = failure_excerpt(report) if report else ""
+    return excerpt or clip_log(request.error_log)
+
+def _patch_context(request, failure_log):
+    """
+    The failing spec and original source, cut down to what is relevant to
+    the failure when they exceed their token budgets (see patch_context).
+    """
     failing_test = request.failing_test or (request.run_result and request.run_result.get("playwrightSpec", "")) or ""
-    original_code_section = ""
+    query = patch_context.failure_query(failure_log, failing_test)
+    spec = patch_context.select_context(failing_test, query, patch_context.SPEC_TOKENS)
+    source = None
     if request.original_code:
+        source = patch_context.select_context(request.original_code, query, patch_context.CONTEXT_TOKENS)
+    if spec["trimmed"] or (source and source["trimmed"]):
+        parts = [f"{name} {c['sourceTokens']} -> {c['tokens']} tokens ({c['selected']}/{c['chunks']} chunks)"
+                 for name, c in (("spec", spec), ("source", source)) if c and c["trimmed"]]
+        print(f"[Patch] Context: {', '.join(parts)}")
+    return spec, source
+
+def build_patch_prompt(request):
+    """The generate_patch prompt; returned separately so its size can be measured."""
+    failure_log = _failure_log(request)
+    spec, source = _patch_context(request, failure_log)
+    original_code_section = ""
+    if source:
+        shown = ""
+        if source["trimmed"]:
+            shown = """
+    Only the parts relevant to the failure are shown; omitted lines are marked
+    "... lines X-Y omitted". Keep the diff within the lines shown."""
         original_code_section = f"""
     
-    ORIGINAL SOURCE CODE (the application code being tested):
-    {request.original_code}
+    ORIGINAL SOURCE CODE (the application code being tested):{shown}
+    {source["text"]}
     
     IMPORTANT: The fix should be applied to the ORIGINAL SOURCE CODE, NOT the test code.
     The diff should show changes to the application source file (e.g., checkout page component).
@@ -233,10 +492,10 @@ def generate_patch(request):
     You are a senior Software Engineer. You must provide a fix for a failing Playwright test.
     
     FAILURE LOGS:
-    {request.error_log}
+    {failure_log}
 
     FAILING TEST CODE:
-    {failing_test}
+    {spec["text"]}
     {original_code_section}
     TASK:
     1. Analyze the failure logs and test code to identify the root cause of the bug.
@@ -268,7 +527,10 @@ def generate_patch(request):
     - The diff should fix the APPLICATION CODE, not the test code.
     - Analyze the error logs and source code to determine the appropriate fix - do not assume a specific solution.
     """
-    
+    return prompt
+
+async def generate_patch(request, use_cache=True, temperature=0.1, store_result=True):
+    prompt = build_patch_prompt(request)
     response_schema = {
         "type": "object",
         "properties": {
@@ -284,39 +546,20 @@ def generate_patch(request):
         },
         "required": ["diff", "rationale"]
     }
-    try:
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt,
-            config={
-                "temperature": 0.1,
-                "response_mime_type": "application/json",
-                "response_schema": response_schema
-            }
-        )
-        clean_data = clear_json_response(response.text)
-        data = json.loads(clean_data)
-        
-        # Ensure risks is always a list
-        if "risks" not in data:
-            data["risks"] = []
-
-        return PatchResponse(**data)
-    
-    except Exception as e:
-        # Fallback: try without response schema
-        response = client.models.generate_content(
-            model=MODEL_ID,
-            contents=prompt,
-            config={
-                "temperature": 0.1,
-                "response_mime_type": "application/json"
-            }
-        )
-        clean_data = clear_json_response(response.text)
-        data = json.loads(clean_data)
-        
-        if "risks" not in data:
-            data["risks"] = []
-
-        return PatchResponse(**data)
\ No newline at end of file
+
+    # Patch search asks for alternative candidates at higher temperatures
+    config = {"temperature": temperature}
+    cache_key = _prompt_cache_key(prompt, response_schema, config)
+    if use_cache:
+        cached = await asyncio.to_thread(prompt_cache.get, cache_key)
+        if cached is not None:
+            return PatchResponse(**cached)
+
+    # risks is optional in the schema; PatchResponse defaults it to []
+    with metrics.stage("patch_generation"):
+        result = await _generate_json(prompt, response_schema, config, PatchResponse, "generate_patch")
+    # Search candidates are one-off samples; caching them would make later
+    # searches (and /generate-patch at their temperature) repeat them
+    if store_result:
+        await asyncio.to_thread(prompt_cache.set, cache_key, result.model_dump())
+    return result
@@ -0,0 +1,162 @@
+import hashlib
+import os
+import re
+import uuid
+from typing import Tuple
+
+from fastapi import HTTPException, Request
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+from starlette.concurrency import run_in_threadpool
+
+import metrics
+
+# Upload limits - can be overridden via env
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_MB", "200")) * 1024 * 1024
+# Boundaries, part headers and any small form fields on top of the file
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _safe_extension(filename: str) -> str:
+    """Keep a short alphanumeric extension from the client filename, nothing else."""
+    ext = os.path.splitext(filename or "")[1].lower()
+    return ext if re.fullmatch(r"\.[a-z0-9]{1,8}", ext) else ".bin"
+
+
+def _write_chunk(buffer, hasher, chunk: bytes):
+    buffer.write(chunk)
+    hasher.update(chunk)
+
+
+def _discard(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _FileField:
+    """
+    MultipartParser callbacks that pick out one file field. Parsing is
+    synchronous, so its data is queued in pending and written by the caller
+    between network reads.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.found = False
+        self.filename = ""
+        self.pending = []
+        self._in_field = False
+        self._header_field = b""
+        self._header_value = b""
+        self._headers = {}
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self._part_begin,
+            "on_header_field": lambda data, start, end: self._append("_header_field", data[start:end]),
+            "on_header_value": lambda data, start, end: self._append("_header_value", data[start:end]),
+            "on_header_end": self._header_end,
+            "on_headers_finished": self._headers_finished,
+            "on_part_data": self._part_data,
+            "on_part_end": self._part_end,
+        }
+
+    def _append(self, name: str, data: bytes):
+        setattr(self, name, getattr(self, name) + data)
+
+    def _part_begin(self):
+        self._headers = {}
+
+    def _header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _headers_finished(self):
+        _, params = parse_options_header(self._headers.get(b"content-disposition", b""))
+        # Only the first part with the field's name counts
+        self._in_field = not self.found and params.get(b"name") == self.field.encode()
+        if self._in_field:
+            self.found = True
+            self.filename = params.get(b"filename", b"").decode("utf-8", errors="replace")
+
+    def _part_data(self, data: bytes, start: int, end: int):
+        if self._in_field:
+            self.pending.append(data[start:end])
+
+    def _part_end(self):
+        self._in_field = False
+
+
+def _too_large() -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit")
+
+
+async def ingest_upload(request: Request, upload_dir: str, field: str = "file") -> Tuple[str, str]:
+    """
+    Stream the `field` file of a multipart/form-data request to disk in
+    chunks while computing its SHA-256.
+
+    The body is parsed as it arrives from the client, so the recording is
+    written to disk once (not spooled by the form parser first), and the size
+    limit is enforced from Content-Length before anything is read, or as soon
+    as it is exceeded. Disk writes and hashing run in the threadpool so the
+    event loop is never blocked. The file ends up at
+    <upload_dir>/videos/<sha256><ext>, so identical recordings are stored once.
+
+    Returns (video_path, sha256 hex digest).
+    """
+    with metrics.stage("upload"):
+        return await _ingest(request, upload_dir, field)
+
+
+async def _ingest(request: Request, upload_dir: str, field: str) -> Tuple[str, str]:
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD:
+        raise _too_large()
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise HTTPException(status_code=400, detail=f"Expected multipart/form-data with a {field!r} file field")
+
+    video_dir = os.path.join(upload_dir, "videos")
+    os.makedirs(video_dir, exist_ok=True)
+    partial_path = os.path.join(video_dir, f".incoming-{uuid.uuid4().hex}.part")
+
+    upload = _FileField(field)
+    parser = MultipartParser(params[b"boundary"], upload.callbacks())
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        with open(partial_path, "wb") as buffer:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                if not upload.pending:
+                    continue
+                data = b"".join(upload.pending)
+                upload.pending.clear()
+                size += len(data)
+                if size > MAX_UPLOAD_BYTES:
+                    raise _too_large()
+                await run_in_threadpool(_write_chunk, buffer, hasher, data)
+            parser.finalize()
+    except BaseException:
+        _discard(partial_path)
+        raise
+
+    if not upload.found:
+        _discard(partial_path)
+        raise HTTPException(status_code=400, detail=f"No {field!r} file in the upload")
+    if size == 0:
+        _discard(partial_path)
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+    digest = hasher.hexdigest()
+    video_path = os.path.join(video_dir, f"{digest}{_safe_extension(upload.filename)}")
+    if os.path.exists(video_path):
+        # Same recording already stored: keep the existing copy
+        _discard(partial_path)
+    else:
+        os.replace(partial_path, video_path)
+
+    return video_path, digest
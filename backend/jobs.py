@@ -0,0 +1,238 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import progress
+
+# Job database location - can be overridden via env
+JOBS_PATH = os.getenv("JOBS_PATH", os.path.join(os.getenv("UPLOAD_DIR", "temp"), "jobs.sqlite3"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+Handler = Callable[[dict], Awaitable[Any]]
+# (stage, payload, result) -> (next stage, next payload), or None to end the pipeline
+NextStep = Callable[[str, dict, Any], Optional[Tuple[str, dict]]]
+
+
+def stage_concurrency(stage: str, default: int) -> int:
+    """Worker count for a stage, e.g. JOB_CONCURRENCY_RUN_TEST for "run-test"."""
+    return int(os.getenv(f"JOB_CONCURRENCY_{stage.upper().replace('-', '_')}", str(default)))
+
+
+class JobQueue:
+    """
+    Background jobs for the pipeline stages, persisted in SQLite.
+
+    Each stage has its own queue and worker pool, so Gemini-bound and
+    browser-bound stages are sized independently. Jobs still queued or
+    running when the process stopped are picked up again on start().
+    A pipeline job enqueues the next stage itself when it succeeds.
+
+    Every SQLite query and commit runs in a thread (asyncio.to_thread), so
+    polls and job transitions never block the event loop on disk I/O.
+    """
+
+    def __init__(self, path: str = JOBS_PATH):
+        self._lock = threading.Lock()
+        self._handlers: Dict[str, Tuple[Handler, int]] = {}
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers = []
+        self._events: Dict[str, asyncio.Event] = {}
+        self._next_step: Optional[NextStep] = None
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                stage TEXT NOT NULL,
+                status TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                pipeline INTEGER NOT NULL DEFAULT 0,
+                parent_id TEXT,
+                next_job_id TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+        self._conn.commit()
+
+    def register(self, stage: str, handler: Handler, concurrency: int = 1):
+        self._handlers[stage] = (handler, max(1, concurrency))
+
+    def set_next_step(self, next_step: NextStep):
+        self._next_step = next_step
+
+    async def start(self):
+        for stage, (_, concurrency) in self._handlers.items():
+            self._queues[stage] = asyncio.Queue()
+            for _ in range(concurrency):
+                self._workers.append(asyncio.create_task(self._worker(stage)))
+
+        # Resume work interrupted by a restart
+        rows = await asyncio.to_thread(self._requeue_unfinished)
+        for job_id, stage in rows:
+            if stage in self._queues:
+                self._queues[stage].put_nowait(job_id)
+        if rows:
+            print(f"[Jobs] Resumed {len(rows)} unfinished jobs")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def _requeue_unfinished(self) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, stage FROM jobs WHERE status IN (?, ?) ORDER BY created_at", (QUEUED, RUNNING)
+            ).fetchall()
+            self._conn.execute("UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?", (QUEUED, RUNNING))
+            self._conn.commit()
+        return rows
+
+    async def submit(self, stage: str, payload: dict, pipeline: bool = False, parent_id: Optional[str] = None) -> dict:
+        if stage not in self._handlers:
+            raise ValueError(f"Unknown job stage: {stage}")
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._insert, job_id, stage, json.dumps(payload), pipeline, parent_id)
+        if stage in self._queues:
+            self._queues[stage].put_nowait(job_id)
+        return await self.get(job_id)
+
+    def _insert(self, job_id: str, stage: str, payload: str, pipeline: bool, parent_id: Optional[str]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO jobs (id, stage, status, payload, pipeline, parent_id, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, stage, QUEUED, payload, int(pipeline), parent_id, time.time()),
+            )
+            self._conn.commit()
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self._fetch, job_id)
+
+    def _fetch(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, stage, status, result, error, pipeline, parent_id, next_job_id, "
+                "created_at, started_at, finished_at FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "jobId": row[0],
+            "stage": row[1],
+            "status": row[2],
+            "result": json.loads(row[3]) if row[3] is not None else None,
+            "error": row[4],
+            "pipeline": bool(row[5]),
+            "parentJobId": row[6],
+            "nextJobId": row[7],
+            "createdAt": row[8],
+            "startedAt": row[9],
+            "finishedAt": row[10],
+        }
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[dict]:
+        """Return the job once it finishes, or its current state after timeout seconds."""
+        if timeout <= 0:
+            return await self.get(job_id)
+        # Registered before the read: a job finishing while it runs still sets the event
+        event = self._events.setdefault(job_id, asyncio.Event())
+        job = await self.get(job_id)
+        if job is None or job["status"] in (SUCCEEDED, FAILED):
+            if self._events.get(job_id) is event:
+                del self._events[job_id]
+            return job
+        try:
+            await asyncio.wait_for(event.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+        return await self.get(job_id)
+
+    async def stats(self) -> dict:
+        rows = await asyncio.to_thread(self._count_by_status)
+        counts: Dict[str, Dict[str, int]] = {}
+        for stage, status, count in rows:
+            counts.setdefault(stage, {})[status] = count
+        return {
+            stage: {"concurrency": concurrency, "queued": self._queues[stage].qsize() if stage in self._queues else 0,
+                    "counts": counts.get(stage, {})}
+            for stage, (_, concurrency) in self._handlers.items()
+        }
+
+    def _count_by_status(self) -> list:
+        with self._lock:
+            return self._conn.execute("SELECT stage, status, COUNT(*) FROM jobs GROUP BY stage, status").fetchall()
+
+    def _update(self, job_id: str, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+            self._conn.commit()
+
+    def _load(self, job_id: str) -> Optional[Tuple[dict, bool]]:
+        with self._lock:
+            row = self._conn.execute("SELECT payload, pipeline, status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row[2] != QUEUED:
+            return None
+        return json.loads(row[0]), bool(row[1])
+
+    async def _worker(self, stage: str):
+        handler, _ = self._handlers[stage]
+        queue = self._queues[stage]
+        while True:
+            job_id = await queue.get()
+            try:
+                loaded = await asyncio.to_thread(self._load, job_id)
+                if loaded is None:
+                    continue
+                payload, pipeline = loaded
+                await asyncio.to_thread(self._update, job_id, status=RUNNING, started_at=time.time())
+                channel = progress.open_channel(job_id)
+                channel.publish("job.status", {"jobId": job_id, "stage": stage, "status": RUNNING})
+                try:
+                    with progress.bind(channel):
+                        result = await handler(payload)
+                except Exception as e:
+                    traceback.print_exc()
+                    await asyncio.to_thread(self._update, job_id, status=FAILED, error=f"{type(e).__name__}: {e}",
+                                            finished_at=time.time())
+                    channel.publish("job.status", await self.get(job_id))
+                    continue
+
+                next_job_id = None
+                if pipeline and self._next_step is not None:
+                    step = self._next_step(stage, payload, result)
+                    if step is not None:
+                        next_job_id = (await self.submit(step[0], step[1], pipeline=True, parent_id=job_id))["jobId"]
+                await asyncio.to_thread(self._update, job_id, status=SUCCEEDED, result=json.dumps(result),
+                                        next_job_id=next_job_id, finished_at=time.time())
+                channel.publish("job.status", await self.get(job_id))
+            finally:
+                channel = progress.get_channel(job_id)
+                if channel is not None:
+                    channel.close()
+                event = self._events.pop(job_id, None)
+                if event is not None:
+                    event.set()
+                queue.task_done()
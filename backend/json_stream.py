@@ -0,0 +1,319 @@
+import json
+import re
+from typing import Any, List, Tuple
+
+_FENCE = re.compile(r"^\s*```(?:json)?\s*")
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_LITERALS = {"true": True, "false": False, "null": None}
+_PLAIN = re.compile(r'[^"\\]+')
+
+
+class _Incomplete(Exception):
+    """Raised when the text ends before the value does."""
+
+    def __init__(self, partial: Any = None):
+        self.partial = partial
+
+
+def _skip_ws(text: str, i: int) -> int:
+    while i < len(text) and text[i] in " \t\r\n":
+        i += 1
+    return i
+
+
+def _parse_string(text: str, i: int) -> Tuple[str, int]:
+    # text[i] is the opening quote
+    out = []
+    i += 1
+    while i < len(text):
+        ch = text[i]
+        if ch == '"':
+            return "".join(out), i + 1
+        if ch == "\\":
+            if i + 1 >= len(text):
+                break
+            esc = text[i + 1]
+            if esc == "u":
+                if i + 6 > len(text):
+                    break
+                out.append(chr(int(text[i + 2:i + 6], 16)))
+                i += 6
+                continue
+            out.append(_ESCAPES.get(esc, esc))
+            i += 2
+            continue
+        out.append(ch)
+        i += 1
+    raise _Incomplete("".join(out))
+
+
+def _parse_value(text: str, i: int) -> Tuple[Any, int]:
+    i = _skip_ws(text, i)
+    if i >= len(text):
+        raise _Incomplete(None)
+    ch = text[i]
+    if ch == '"':
+        return _parse_string(text, i)
+    if ch == "{":
+        return _parse_object(text, i)
+    if ch == "[":
+        return _parse_array(text, i)
+    for literal, value in _LITERALS.items():
+        if text.startswith(literal, i):
+            return value, i + len(literal)
+        if literal.startswith(text[i:]):
+            raise _Incomplete(None)
+    match = re.compile(r"-?\d+(\.\d+)?([eE][+-]?\d+)?").match(text, i)
+    if match is None:
+        raise ValueError(f"Unexpected character {ch!r} at {i}")
+    if match.end() == len(text):
+        # A number at the very end may still be growing
+        raise _Incomplete(None)
+    return json.loads(match.group(0)), match.end()
+
+
+def _parse_array(text: str, i: int) -> Tuple[list, int]:
+    items = []
+    i = _skip_ws(text, i + 1)
+    if i < len(text) and text[i] == "]":
+        return items, i + 1
+    while True:
+        try:
+            value, i = _parse_value(text, i)
+        except _Incomplete:
+            # Only completed items are reported for arrays
+            raise _Incomplete(items)
+        items.append(value)
+        i = _skip_ws(text, i)
+        if i >= len(text):
+            raise _Incomplete(items)
+        if text[i] == ",":
+            i += 1
+        elif text[i] == "]":
+            return items, i + 1
+        else:
+            raise ValueError(f"Expected ',' or ']' at {i}")
+
+
+def _parse_object(text: str, i: int) -> Tuple[dict, int]:
+    obj = {}
+    i = _skip_ws(text, i + 1)
+    if i < len(text) and text[i] == "}":
+        return obj, i + 1
+    while True:
+        i = _skip_ws(text, i)
+        if i >= len(text):
+            raise _Incomplete(obj)
+        if text[i] != '"':
+            raise ValueError(f"Expected key at {i}")
+        try:
+            key, i = _parse_string(text, i)
+        except _Incomplete:
+            raise _Incomplete(obj)
+        i = _skip_ws(text, i)
+        if i >= len(text):
+            raise _Incomplete(obj)
+        if text[i] != ":":
+            raise ValueError(f"Expected ':' at {i}")
+        try:
+            value, i = _parse_value(text, i + 1)
+        except _Incomplete as e:
+            if e.partial is not None:
+                obj[key] = e.partial
+            raise _Incomplete(obj)
+        obj[key] = value
+        i = _skip_ws(text, i)
+        if i >= len(text):
+            raise _Incomplete(obj)
+        if text[i] == ",":
+            i += 1
+        elif text[i] == "}":
+            return obj, i + 1
+        else:
+            raise ValueError(f"Expected ',' or '}}' at {i}")
+
+
+def parse_partial(text: str) -> Tuple[Any, bool]:
+    """
+    Parse a possibly truncated JSON document.
+
+    Returns (value, complete). For a truncated document the value holds what
+    has arrived so far: strings cut where the text ends and arrays with only
+    their completed items. A leading ```json fence is ignored.
+    """
+    text = _FENCE.sub("", text, count=1)
+    try:
+        value, _ = _parse_value(text, 0)
+        return value, True
+    except _Incomplete as e:
+        return e.partial, False
+
+
+class IncrementalJSONParser:
+    """
+    Turn a streamed JSON object into per-field updates.
+
+    feed() returns a list of updates for top-level fields:
+    - {"field", "delta"} for new text in a string field
+    - {"field", "index", "item"} for each newly completed array item
+    - {"field", "value"} once any other value is complete
+    - {"field", "done": True} once a string or array field is complete
+
+    Parsing resumes where the previous feed stopped: finished fields, the
+    decoded part of a string and completed array items are never scanned
+    again, so a whole response costs time linear in its length. Only a
+    single unfinished array item or non-string value is re-read per feed.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._pos = 0           # next character to read in self.text
+        self._state = "start"   # start, key, colon, value, string, array, scalar, next, end
+        self._field = None      # top-level field being read
+        self._items = 0         # completed items of the current array field
+        self._failed = False
+
+    def feed(self, chunk: str) -> List[dict]:
+        self.text += chunk
+        if self._failed:
+            return []
+        updates = []
+        try:
+            self._advance(updates)
+        except ValueError:
+            # Not JSON; the final validation will report it
+            self._failed = True
+        return updates
+
+    def _advance(self, updates: List[dict]):
+        text = self.text
+        while True:
+            state = self._state
+            if state == "end":
+                return
+            if state == "string":
+                if not self._read_string(updates):
+                    return
+                continue
+            if state == "array":
+                if not self._read_items(updates):
+                    return
+                continue
+            if state == "scalar":
+                try:
+                    value, end = _parse_value(text, self._pos)
+                except _Incomplete:
+                    return
+                after = _skip_ws(text, end)
+                if after >= len(text) or text[after] not in ",}":
+                    return  # "12" may still become "12.5"
+                updates.append({"field": self._field, "value": value})
+                self._pos = end
+                self._state = "next"
+                continue
+
+            i = _skip_ws(text, self._pos)
+            if i >= len(text):
+                return
+            ch = text[i]
+            if state == "start":
+                if "```json".startswith(text[i:]):
+                    return  # A fence may still be arriving
+                fence = _FENCE.match(text)
+                if fence is not None:
+                    i = _skip_ws(text, fence.end())
+                    if i >= len(text):
+                        return
+                    ch = text[i]
+                if ch != "{":
+                    raise ValueError(f"Expected '{{' at {i}")
+                self._pos = i + 1
+                self._state = "key"
+            elif state == "key":
+                if ch == "}":
+                    self._pos, self._state = i + 1, "end"
+                    continue
+                if ch != '"':
+                    raise ValueError(f"Expected key at {i}")
+                try:
+                    self._field, self._pos = _parse_string(text, i)
+                except _Incomplete:
+                    return
+                self._state = "colon"
+            elif state == "colon":
+                if ch != ":":
+                    raise ValueError(f"Expected ':' at {i}")
+                self._pos, self._state = i + 1, "value"
+            elif state == "value":
+                if ch == '"':
+                    self._pos, self._state = i + 1, "string"
+                elif ch == "[":
+                    self._pos, self._state, self._items = i + 1, "array", 0
+                else:
+                    self._pos, self._state = i, "scalar"
+            elif state == "next":
+                if ch == ",":
+                    self._pos, self._state = i + 1, "key"
+                elif ch == "}":
+                    self._pos, self._state = i + 1, "end"
+                else:
+                    raise ValueError(f"Expected ',' or '}}' at {i}")
+
+    def _read_string(self, updates: List[dict]) -> bool:
+        """Decode the string field from _pos; True once its closing quote was read."""
+        text = self.text
+        i = self._pos
+        out = []
+        closed = False
+        while i < len(text):
+            ch = text[i]
+            if ch == '"':
+                closed = True
+                i += 1
+                break
+            if ch == "\\":
+                # An escape split across chunks is decoded on the next feed
+                if i + 1 >= len(text) or (text[i + 1] == "u" and i + 6 > len(text)):
+                    break
+                if text[i + 1] == "u":
+                    out.append(chr(int(text[i + 2:i + 6], 16)))
+                    i += 6
+                else:
+                    out.append(_ESCAPES.get(text[i + 1], text[i + 1]))
+                    i += 2
+                continue
+            # Plain runs are copied in one slice
+            run = _PLAIN.match(text, i)
+            out.append(run.group(0))
+            i = run.end()
+        self._pos = i
+        if out:
+            updates.append({"field": self._field, "delta": "".join(out)})
+        if closed:
+            updates.append({"field": self._field, "done": True})
+            self._state = "next"
+        return closed
+
+    def _read_items(self, updates: List[dict]) -> bool:
+        """Report completed items of the array field; True once it is closed."""
+        text = self.text
+        while True:
+            i = _skip_ws(text, self._pos)
+            if i >= len(text):
+                return False
+            if text[i] == "]":
+                self._pos = i + 1
+                updates.append({"field": self._field, "done": True})
+                self._state = "next"
+                return True
+            if self._items:
+                if text[i] != ",":
+                    raise ValueError(f"Expected ',' or ']' at {i}")
+                i += 1
+            try:
+                item, end = _parse_value(text, i)
+            except _Incomplete:
+                return False
+            updates.append({"field": self._field, "index": self._items, "item": item})
+            self._items += 1
+            self._pos = end
@@ -0,0 +1,323 @@
+import math
+import os
+import re
+from typing import Dict, List, Optional, Set
+
+# Context budget for generate_patch: the submitted source and the failing
+# spec are sent whole when they fit PATCH_CONTEXT_TOKENS / PATCH_SPEC_TOKENS
+# (estimated at CHARS_PER_TOKEN). Larger ones are cut into chunks at
+# declaration and statement boundaries (at most MAX_CHUNK_CHARS each),
+# ranked against the failure, and only the best chunks are sent, in source
+# order, with omitted lines marked. A budget of 0 always sends everything.
+CONTEXT_TOKENS = int(os.getenv("PATCH_CONTEXT_TOKENS", "1500"))
+SPEC_TOKENS = int(os.getenv("PATCH_SPEC_TOKENS", "1000"))
+CHARS_PER_TOKEN = 4
+MAX_CHUNK_CHARS = 1200
+_MARKER_CHARS = 32
+
+# Ranking weights per query term, multiplied by the term's IDF over chunks:
+# - selectors: test ids, names and text the failing locators and the
+#   spec's assertions use, and the failing test's title (finds its block in
+#   the spec); selectors in the spec's other steps count as STEP_WEIGHT
+# - strings: quoted text from assertions and error messages
+# - frames: function names from stack frames outside the spec
+# - identifiers: any other identifier in the error messages
+# A chunk containing a line a stack frame points at gets LINE_WEIGHT. Chunks
+# defining a name that a matching chunk uses get DEFINITION_WEIGHT of that
+# chunk's score, so `{fmt(subtotal)}` also pulls in where subtotal is computed.
+SELECTOR_WEIGHT = 4.0
+STEP_WEIGHT = 1.5
+STRING_WEIGHT = 2.0
+FRAME_WEIGHT = 3.0
+IDENTIFIER_WEIGHT = 1.0
+LINE_WEIGHT = 4.0
+DEFINITION_WEIGHT = 0.5
+
+_IDENTIFIER = re.compile(r"[A-Za-z_$][\w$]*")
+_WORD_PARTS = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])")
+_SELECTOR_CALL = re.compile(r"getBy(?:TestId|Text|Label|Placeholder|AltText|Title)\(\s*(['\"`])(.+?)\1")
+_ROLE_NAME = re.compile(r"name:\s*(['\"`])(.+?)\1")
+_LOCATOR = re.compile(r"locator\(\s*(['\"`])(.+?)\1")
+_CSS_PART = re.compile(r"[#.]([\w-]{3,})|\[[\w-]+=['\"]?([^'\"\]]+)")
+_QUOTED = re.compile(r"(['\"`])([^'\"`\n]{2,80})\1")
+_EXPECTED = re.compile(r"^\s*(?:Expected|Received)(?: string| substring| pattern| value)?:\s*(.+?)\s*$", re.MULTILINE)
+_FAILED_TITLE = re.compile(r"^✘ (.+?) \[\w+\]", re.MULTILINE)
+_FRAME = re.compile(r"\bat (?:(?:async )?([\w$.<>]+) \()?((?:[A-Za-z]:)?[^\s():]+):(\d+)(?::\d+)?\)?")
+_PATH = re.compile(r"[\w./\\-]+\.\w+:\d+(?::\d+)?")
+_DEFINITION = re.compile(r"\b(?:const|let|var|function|class|interface|type|enum|def)\s+([A-Za-z_$][\w$]*)")
+_DESTRUCTURED = re.compile(r"\b(?:const|let|var)\s*[\[{]([^\]}=]+)[\]}]\s*=")
+_PREAMBLE = re.compile(r"""^\s*(?:import\b|from\b|export\s+\*|['"]use \w+['"];?$|#!|//|/\*|\*|$)""")
+# "// app/checkout/page.tsx": how pasted files are usually labelled
+_FILE_LABEL = re.compile(r"^(?://|#)\s*\S+\.\w{1,5}\s*$")
+_COMMENT = re.compile(r"^\s*(?://|/\*|\*|#|\{/\*)")
+# Lines that continue the previous statement rather than start a new one
+_CONTINUATIONS = ("}", ")", "]", "</", "/>", ".", "?", ":", "&&", "||", "+", ">", ",")
+
+_STOPWORDS = {
+    "async", "await", "const", "let", "var", "function", "return", "true", "false", "null", "undefined",
+    "new", "this", "expect", "page", "locator", "test", "error", "expected", "received", "string", "call",
+    "log", "waiting", "timeout", "tobe", "tohavetext", "tobevisible", "getbytestid", "getbyrole", "getbytext",
+    "click", "goto", "fill", "the", "and", "for", "with", "not", "was", "from", "failed", "tests", "step",
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _words(text: str) -> Set[str]:
+    """Lower-cased identifiers plus their camelCase / snake_case parts."""
+    words = set()
+    for identifier in _IDENTIFIER.findall(text):
+        words.add(identifier.lower())
+        words.update(part.lower() for part in _WORD_PARTS.findall(identifier) if len(part) > 2)
+    return words
+
+
+def _add(terms: Dict[str, float], term: str, weight: float):
+    term = term.strip().strip("'\"`").lower()
+    if len(term) > 1 and terms.get(term, 0) < weight:
+        terms[term] = weight
+
+
+def failure_query(failure_log: str, failing_test: str = "") -> dict:
+    """
+    Terms to rank chunks with, from the failure excerpt and the failing
+    spec: {"phrases": {text: weight}, "words": {word: weight}, "lines": {line: weight}}.
+    Phrases match as case-insensitive substrings, words as whole identifiers
+    (or their parts).
+    """
+    phrases: Dict[str, float] = {}
+    words: Dict[str, float] = {}
+    lines: Dict[int, float] = {}
+
+    assertions = "\n".join(line for line in failing_test.splitlines() if "expect(" in line)
+    for text, weight in ((failure_log, SELECTOR_WEIGHT), (assertions, SELECTOR_WEIGHT), (failing_test, STEP_WEIGHT)):
+        for match in _SELECTOR_CALL.finditer(text):
+            _add(phrases, match.group(2), weight)
+        for match in _ROLE_NAME.finditer(text):
+            _add(phrases, match.group(2), weight)
+        for match in _LOCATOR.finditer(text):
+            for part in _CSS_PART.finditer(match.group(2)):
+                _add(phrases, part.group(1) or part.group(2), weight)
+    for match in _QUOTED.finditer(assertions):
+        _add(phrases, match.group(2), STRING_WEIGHT)
+
+    for match in _FAILED_TITLE.finditer(failure_log):
+        for part in match.group(1).split(" › "):
+            _add(phrases, part, SELECTOR_WEIGHT)
+    for match in _EXPECTED.finditer(failure_log):
+        _add(phrases, match.group(1), STRING_WEIGHT)
+    for match in _QUOTED.finditer(failure_log):
+        _add(phrases, match.group(2), STRING_WEIGHT)
+
+    for match in _FRAME.finditer(failure_log):
+        name, path, line = match.group(1), match.group(2), int(match.group(3))
+        # Frames in the spec, the test runner or dependencies say nothing about the app code
+        if re.search(r"\.(?:spec|test)\.|node_modules|playwright|^node:|^internal/", path):
+            continue
+        lines[line] = LINE_WEIGHT
+        if name:
+            _add(words, name.rsplit(".", 1)[-1], FRAME_WEIGHT)
+
+    for identifier in _IDENTIFIER.findall(_PATH.sub(" ", failure_log)):
+        lowered = identifier.lower()
+        if len(lowered) > 2 and lowered not in _STOPWORDS and lowered not in words and re.search("[a-z]", lowered):
+            words[lowered] = IDENTIFIER_WEIGHT
+
+    return {"phrases": phrases, "words": words, "lines": lines}
+
+
+def _indent(line: str) -> int:
+    return len(line) - len(line.lstrip())
+
+
+def _cuts(lines: List[str], start: int, end: int, indent: int) -> List[int]:
+    """Lines in [start, end) at `indent` that start a new statement; a comment block starts with its statement."""
+    cuts = []
+    for i in range(start, end):
+        stripped = lines[i].strip()
+        if not stripped or _indent(lines[i]) != indent or stripped.startswith(_CONTINUATIONS):
+            continue
+        previous = i - 1
+        while previous >= start and not lines[previous].strip():
+            previous -= 1
+        if previous >= start and _indent(lines[previous]) == indent and _COMMENT.match(lines[previous]):
+            continue
+        cuts.append(i)
+    return cuts
+
+
+def _size(lines: List[str], start: int, end: int) -> int:
+    return sum(len(line) + 1 for line in lines[start:end])
+
+
+def _split(lines: List[str], start: int, end: int, scope: List[int], cuts: List[int], chunks: List[dict]):
+    """Group the segments between cuts into chunks of at most MAX_CHUNK_CHARS; recurse into longer ones."""
+    if start not in cuts:
+        cuts = [start] + cuts
+    bounds = cuts + [end]
+    chunk_start = start
+    for seg_start, seg_end in zip(bounds, bounds[1:]):
+        if seg_end - seg_start > 1 and _size(lines, seg_start, seg_end) > MAX_CHUNK_CHARS:
+            if seg_start > chunk_start:
+                chunks.append({"start": chunk_start, "end": seg_start, "scope": scope})
+            _split_block(lines, seg_start, seg_end, scope, chunks)
+            chunk_start = seg_end
+        elif _size(lines, chunk_start, seg_end) > MAX_CHUNK_CHARS:
+            chunks.append({"start": chunk_start, "end": seg_start, "scope": scope})
+            chunk_start = seg_start
+    if chunk_start < end:
+        chunks.append({"start": chunk_start, "end": end, "scope": scope})
+
+
+def _split_block(lines: List[str], start: int, end: int, scope: List[int], chunks: List[dict]):
+    """Split one long statement (a component, a function, a JSX element) along its body."""
+    header_indent = _indent(lines[start])
+    body = [i for i in range(start + 1, end) if lines[i].strip() and _indent(lines[i]) > header_indent]
+    cuts = _cuts(lines, start + 1, end, min(_indent(lines[i]) for i in body)) if body else []
+    if not cuts:
+        # No statement boundaries (one long expression): pieces of whole lines
+        piece = start
+        for i in range(start + 1, end + 1):
+            if i == end or _size(lines, piece, i + 1) > MAX_CHUNK_CHARS:
+                chunks.append({"start": piece, "end": i, "scope": scope})
+                piece = i
+        return
+    _split(lines, start, end, scope + [start], cuts, chunks)
+
+
+def chunk_source(lines: List[str], start: int = 0) -> List[dict]:
+    """
+    Chunks of lines[start:], each {"start", "end", "scope"} (end exclusive).
+    Top-level statements are the first boundaries; a statement longer than
+    MAX_CHUNK_CHARS is split along its own body, recursively. scope holds
+    the header lines of the enclosing statements (e.g. the component's
+    signature) so a chunk can be shown in context.
+    """
+    chunks: List[dict] = []
+    _split(lines, start, len(lines), [], _cuts(lines, start, len(lines), 0), chunks)
+    return chunks
+
+
+def _definitions(text: str) -> Set[str]:
+    names = set(_DEFINITION.findall(text))
+    for group in _DESTRUCTURED.findall(text):
+        for name in re.split(r"[,:\s]+", group):
+            if _IDENTIFIER.fullmatch(name):
+                names.add(name)
+    return names
+
+
+def rank_chunks(lines: List[str], chunks: List[dict], query: dict) -> List[float]:
+    """Score each chunk against the query; see the weights above."""
+    texts = ["\n".join(lines[c["start"]:c["end"]]) for c in chunks]
+    lowered = [text.lower() for text in texts]
+    words = [_words(text) for text in texts]
+    n = len(chunks)
+    scores = [0.0] * n
+
+    def add(hits: List[int], weight: float):
+        if hits:
+            idf = math.log(1 + n / len(hits))
+            for i in hits:
+                scores[i] += weight * idf
+
+    for phrase, weight in query["phrases"].items():
+        add([i for i in range(n) if phrase in lowered[i]], weight)
+        # Counted again where it is a whole literal: data-testid="subtotal", not baseSubtotal
+        quoted = (f'"{phrase}"', f"'{phrase}'", f">{phrase}<")
+        add([i for i in range(n) if any(q in lowered[i] for q in quoted)], weight)
+    for word, weight in query["words"].items():
+        add([i for i in range(n) if word in words[i]], weight)
+    for line, weight in query["lines"].items():
+        for i, chunk in enumerate(chunks):
+            if chunk["start"] < line <= chunk["end"]:  # stack lines are 1-based
+                scores[i] += weight
+
+    # One hop along definitions: where the names used by matching chunks come from
+    owners: Dict[str, int] = {}
+    for i, text in enumerate(texts):
+        for name in _definitions(text):
+            owners.setdefault(name, i)
+    bonus = [0.0] * n
+    for i, text in enumerate(texts):
+        if scores[i] <= 0:
+            continue
+        for name in set(_IDENTIFIER.findall(text)):
+            owner = owners.get(name)
+            if owner is not None and owner != i:
+                bonus[owner] = max(bonus[owner], DEFINITION_WEIGHT * scores[i])
+    return [score + extra for score, extra in zip(scores, bonus)]
+
+
+def _comment_prefix(source: str) -> str:
+    python = re.search(r"^\s*(?:async\s+)?def \w+\(.*:\s*$", source, re.MULTILINE)
+    return "#" if python and not re.search(r";\s*$", source, re.MULTILINE) else "//"
+
+
+def select_context(source: str, query: dict, budget_tokens: int) -> dict:
+    """
+    The parts of source most relevant to the failure, within budget_tokens.
+
+    Returns {"text", "trimmed", "chunks", "selected", "sourceTokens", "tokens"}.
+    Leading imports and directives are always kept, as are the header lines
+    of the statements enclosing a selected chunk and, when several files
+    are pasted together, the label line of the file it is in. When nothing in the source
+    matches the failure, the chunks are taken from the top.
+    """
+    source_tokens = estimate_tokens(source)
+    if budget_tokens <= 0 or source_tokens <= budget_tokens:
+        return {"text": source, "trimmed": False, "chunks": 1, "selected": 1,
+                "sourceTokens": source_tokens, "tokens": source_tokens}
+
+    lines = source.splitlines()
+    preamble = 0
+    while preamble < len(lines) and _PREAMBLE.match(lines[preamble]):
+        preamble += 1
+    chunks = chunk_source(lines, preamble)
+    scores = rank_chunks(lines, chunks, query)
+    labels = [i for i, line in enumerate(lines) if _FILE_LABEL.match(line)]
+
+    budget = budget_tokens * CHARS_PER_TOKEN
+    kept = set(range(preamble))
+    used = sum(len(lines[i]) + 1 for i in kept)
+    selected = 0
+    ranked = sorted(range(len(chunks)), key=lambda i: (-scores[i], chunks[i]["start"]))
+    if not any(score > 0 for score in scores):
+        ranked = list(range(len(chunks)))
+    for i in ranked:
+        if scores[i] <= 0 and selected:
+            break
+        chunk = chunks[i]
+        label = [max(i for i in labels if i <= chunk["start"])] if any(i <= chunk["start"] for i in labels) else []
+        new = [line for line in [*label, *chunk["scope"], *range(chunk["start"], chunk["end"])] if line not in kept]
+        # Plus a "... lines omitted" marker per separate run of new lines
+        runs = sum(1 for a, b in zip([-2] + sorted(new), sorted(new)) if b != a + 1)
+        cost = sum(len(lines[line]) + 1 for line in new) + runs * _MARKER_CHARS
+        if used + cost > budget or not any(lines[line].strip() for line in new):
+            continue
+        kept.update(new)
+        used += cost
+        selected += 1
+
+    prefix = _comment_prefix(source)
+    if not selected:
+        # Not even one chunk fits (minified code, one huge statement): the head of the source
+        text = source[:budget - _MARKER_CHARS].rsplit("\n", 1)[0] + f"\n{prefix} ... truncated"
+        return {"text": text, "trimmed": True, "chunks": len(chunks), "selected": 0,
+                "sourceTokens": source_tokens, "tokens": estimate_tokens(text)}
+    out = []
+    gap_start: Optional[int] = None
+    for i, line in enumerate(lines + [None]):
+        if i < len(lines) and i not in kept:
+            gap_start = i if gap_start is None else gap_start
+            continue
+        if gap_start is not None:
+            out.append(f"{prefix} ... lines {gap_start + 1}-{i} omitted")
+            gap_start = None
+        if line is not None:
+            out.append(line)
+    text = "\n".join(out)
+    return {"text": text, "trimmed": True, "chunks": len(chunks), "selected": selected,
+            "sourceTokens": source_tokens, "tokens": estimate_tokens(text)}
@@ -0,0 +1,418 @@
+import asyncio
+import os
+import re
+import shlex
+import shutil
+import signal
+import socket
+import time
+import uuid
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import httpx
+
+import metrics
+import progress
+from gemini import generate_patch
+from playwright_runner import IS_WINDOWS, default_run_slots, find_executable, normalize_spec, run_playwright_test
+from run_report import clip_log, failure_excerpt
+
+# Patch search: PATCH_SEARCH_CANDIDATES diffs are requested at once. The
+# first uses generate_patch's usual temperature (it is the diff
+# /generate-patch returns), the others are spread up to
+# PATCH_SEARCH_MAX_TEMPERATURE so they try different fixes. Each candidate
+# is verified as soon as it arrives; the first one whose failing spec passes
+# wins and the rest are cancelled. A control run of the spec against the
+# unpatched app runs alongside them: when it passes too, the spec cannot
+# tell a fix from no fix and the search is "unverifiable".
+CANDIDATES = int(os.getenv("PATCH_SEARCH_CANDIDATES", "3"))
+MAX_CANDIDATES = 8
+BASE_TEMPERATURE = 0.1
+MAX_TEMPERATURE = float(os.getenv("PATCH_SEARCH_MAX_TEMPERATURE", "1.0"))
+
+# Verification sandboxes: a copy of PATCH_TARGET_APP_DIR with the diff
+# applied, served by PATCH_APP_COMMAND ({port} is replaced by a free port)
+# and tested with the failing spec pointed at that port. Copies are made
+# next to the app (as .patchpilot-<app>-<id>, gitignored), so relative
+# node_modules links (pnpm workspaces) still resolve; node_modules itself is
+# hard-linked, not copied. Specs always run under `npx playwright test`, not
+# the warm pool, so a verdict never depends on the pool's test shim. At most
+# PATCH_SEARCH_SANDBOXES dev servers run at once; their browsers also count
+# against the shared run limiter.
+TARGET_APP_DIR = os.path.abspath(os.getenv(
+    "PATCH_TARGET_APP_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "neonmart")
+))
+APP_COMMAND = os.getenv("PATCH_APP_COMMAND", "npx next dev -p {port}")
+APP_STARTUP_TIMEOUT = float(os.getenv("PATCH_APP_STARTUP_TIMEOUT", "120"))
+SANDBOXES = int(os.getenv("PATCH_SEARCH_SANDBOXES", str(default_run_slots())))
+SANDBOX_IGNORE = ("node_modules", ".next", ".git")
+# Dev server output kept for "app_failed" errors
+APP_LOG_LINES = 40
+
+sandbox_slots = asyncio.Semaphore(max(1, SANDBOXES))
+
+# Origins a generated spec may point at when the analysis has no targetUrl
+_LOCAL_ORIGIN = re.compile(r"https?://(?:localhost|127\.0\.0\.1|0\.0\.0\.0)(?::\d+)?")
+
+
+def target_app_problem() -> Optional[str]:
+    """Why patch search cannot run here, or None."""
+    if not os.path.isdir(TARGET_APP_DIR):
+        return f"Target app not found at {TARGET_APP_DIR} (set PATCH_TARGET_APP_DIR)"
+    if not find_executable("git"):
+        return "git not found in PATH; it is needed to apply candidate diffs"
+    return None
+
+
+def app_origin(spec: str, target_url: Optional[str] = None) -> Optional[str]:
+    """The origin the spec tests: the analysis targetUrl's, else the first localhost URL in the spec."""
+    if target_url:
+        parts = urlsplit(target_url)
+        if parts.scheme and parts.netloc:
+            return f"{parts.scheme}://{parts.netloc}"
+    match = _LOCAL_ORIGIN.search(spec)
+    return match.group(0) if match else None
+
+
+def retarget(text: str, origin: str, port: int) -> str:
+    """Point every URL on origin at the sandbox on port."""
+    return re.sub(re.escape(origin) + r"(?!\d)", f"http://localhost:{port}", text)
+
+
+def candidate_temperature(index: int, count: int) -> float:
+    if index == 0 or count <= 1:
+        return BASE_TEMPERATURE
+    return round(BASE_TEMPERATURE + (MAX_TEMPERATURE - BASE_TEMPERATURE) * index / (count - 1), 2)
+
+
+def _diff_key(diff: str) -> str:
+    # Candidates differing only in whitespace or hunk headers make the same change
+    return "\n".join(line.rstrip() for line in diff.strip().splitlines() if not line.startswith("@@"))
+
+
+def _free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _link_or_copy(src: str, dst: str):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _create_sandbox(sandbox: str):
+    shutil.copytree(TARGET_APP_DIR, sandbox, symlinks=True, ignore=shutil.ignore_patterns(*SANDBOX_IGNORE))
+    modules = os.path.join(TARGET_APP_DIR, "node_modules")
+    if os.path.isdir(modules):
+        # Bundlers resolve a symlinked node_modules to its real path, outside
+        # the sandbox; hard links keep it inside at almost no cost
+        shutil.copytree(modules, os.path.join(sandbox, "node_modules"), symlinks=True,
+                        copy_function=_link_or_copy)
+
+
+async def _git(args: List[str], cwd: str, stdin: str) -> Tuple[int, str]:
+    # Stop git from finding the enclosing repository: paths in the diff are
+    # relative to the sandbox, not to whatever checkout it sits in
+    env = {**os.environ, "GIT_CEILING_DIRECTORIES": os.path.dirname(cwd)}
+    proc = await asyncio.create_subprocess_exec(
+        find_executable("git"), *args,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        cwd=cwd,
+        env=env
+    )
+    output, _ = await proc.communicate(stdin.encode("utf-8"))
+    return proc.returncode, output.decode("utf-8", errors="replace").strip()
+
+
+async def apply_diff(diff: str, sandbox: str) -> Optional[str]:
+    """
+    Apply a unified diff to the sandbox. Returns None on success, otherwise
+    git's error. Paths may be relative to the app (a/app/page.tsx), to the
+    repository holding it (a/neonmart/app/page.tsx) or carry no prefix;
+    hunk line counts are recounted since model-written hunks are often off.
+    """
+    if not diff.endswith("\n"):
+        diff += "\n"
+    errors = []
+    for strip in (1, 2, 0):
+        args = ["apply", f"-p{strip}", "--recount", "--whitespace=nowarn"]
+        code, output = await _git(args + ["--check", "-"], sandbox, diff)
+        if code == 0:
+            code, output = await _git(args + ["-"], sandbox, diff)
+            if code == 0:
+                return None
+        errors.append(output)
+    # Prefer the strip level that found the files: its error says why the hunks did not fit
+    return next((e for e in errors if e and "No such file" not in e), errors[0]) or "git apply failed"
+
+
+async def _read_log(stream, log: deque):
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        log.append(line.decode("utf-8", errors="replace").rstrip())
+
+
+async def _start_app(sandbox: str, port: int):
+    cmd = [arg.format(port=port) for arg in shlex.split(APP_COMMAND)]
+    proc = await asyncio.create_subprocess_exec(
+        find_executable(cmd[0]) or cmd[0], *cmd[1:],
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        cwd=sandbox,
+        env={**os.environ, "PORT": str(port), "NEXT_TELEMETRY_DISABLED": "1"},
+        # npx -> node -> next workers: a process group lets _stop_app kill them all
+        start_new_session=not IS_WINDOWS
+    )
+    log = deque(maxlen=APP_LOG_LINES)
+    return proc, log, asyncio.create_task(_read_log(proc.stdout, log))
+
+
+async def _wait_until_serving(proc, url: str) -> bool:
+    """Poll url until the app answers at all; the first request also compiles the page."""
+    deadline = time.monotonic() + APP_STARTUP_TIMEOUT
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if proc.returncode is not None:
+                return False
+            try:
+                await client.get(url, timeout=max(1.0, deadline - time.monotonic()))
+                return True
+            except httpx.TransportError:
+                await asyncio.sleep(0.5)
+    return False
+
+
+def _signal_app(proc, sig):
+    try:
+        if IS_WINDOWS:
+            proc.kill()
+        else:
+            os.killpg(proc.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+async def _stop_app(proc, reader: asyncio.Task):
+    _signal_app(proc, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=10)
+    except asyncio.TimeoutError:
+        _signal_app(proc, signal.SIGKILL)
+        await proc.wait()
+    reader.cancel()
+    await asyncio.gather(reader, return_exceptions=True)
+
+
+async def verify_patch(diff: Optional[str], spec: str, origin: str, warm_url: str,
+                       attempt: dict) -> Tuple[str, Optional[str]]:
+    """
+    Apply diff to a fresh copy of the target app, serve it and run spec
+    against it; without a diff the copy is left unpatched (the control run).
+    Returns (status, error) with status passed, failed, apply_failed or
+    app_failed. The server and the copy are always removed, also when the
+    search is cancelled.
+    """
+    async with sandbox_slots:
+        sandbox = os.path.join(os.path.dirname(TARGET_APP_DIR),
+                               f".patchpilot-{os.path.basename(TARGET_APP_DIR)}-{uuid.uuid4().hex[:8]}")
+        copying = proc = reader = None
+        try:
+            with metrics.stage("patch_sandbox_setup"):
+                copying = asyncio.ensure_future(asyncio.to_thread(_create_sandbox, sandbox))
+                await asyncio.shield(copying)
+                error = await apply_diff(diff, sandbox) if diff else None
+            if error:
+                return "apply_failed", error
+
+            port = _free_port()
+            proc, log, reader = await _start_app(sandbox, port)
+            with metrics.stage("patch_app_startup"):
+                serving = await _wait_until_serving(proc, retarget(warm_url, origin, port))
+            if not serving:
+                reason = (f"exited with code {proc.returncode}" if proc.returncode is not None
+                          else f"not serving after {APP_STARTUP_TIMEOUT:g}s")
+                return "app_failed", f"{APP_COMMAND} {reason}\n" + "\n".join(log)
+
+            result = await run_playwright_test(retarget(spec, origin, port), use_pool=False)
+            attempt["run"] = {"durationMs": result["durationMs"], "screenshotUrl": result["screenshotUrl"]}
+            if result["status"] == "passed":
+                return "passed", None
+            report = result.get("report")
+            excerpt = failure_excerpt(report) if report else ""
+            return "failed", excerpt or clip_log(result["stderr"] or result["stdout"], 2000)
+        finally:
+            if proc is not None:
+                await _stop_app(proc, reader)
+            if copying is not None:
+                # A cancelled search may still be copying in its thread; let it finish first
+                await asyncio.gather(copying, return_exceptions=True)
+            await asyncio.to_thread(shutil.rmtree, sandbox, True)
+
+
+def _finish(attempt: dict, status: str, error: Optional[str], started: float) -> dict:
+    attempt["status"] = status
+    attempt["error"] = error
+    attempt["durationMs"] = int((time.perf_counter() - started) * 1000)
+    metrics.patch_candidates.inc(status=status)
+    progress.emit("patch.candidate", candidate=attempt["candidate"], status=status)
+    print(f"[Patch Search] Candidate {attempt['candidate']} (t={attempt['temperature']}): {status} "
+          f"in {attempt['durationMs']}ms" + (f" - {error.splitlines()[0][:200]}" if error else ""))
+    return attempt
+
+
+def _spec_passes_unpatched(control: asyncio.Task) -> bool:
+    return control.done() and not control.cancelled() and control.result()["status"] == "passed"
+
+
+async def _run_control(spec: str, origin: str, warm_url: str) -> dict:
+    """Run spec against an unpatched copy: {"status", "error", "durationMs"}."""
+    started = time.perf_counter()
+    control = {}
+    try:
+        status, error = await verify_patch(None, spec, origin, warm_url, control)
+    except Exception as e:
+        status, error = "error", f"Verification failed: {type(e).__name__}: {e}"
+    control.update(status=status, error=error, durationMs=int((time.perf_counter() - started) * 1000))
+    progress.emit("patch.control", status=status)
+    print(f"[Patch Search] Control run without a patch: {status} in {control['durationMs']}ms")
+    return control
+
+
+async def _run_candidate(request, attempt: dict, spec: str, origin: str, warm_url: str, seen: Dict[str, int],
+                         control: asyncio.Task) -> dict:
+    started = time.perf_counter()
+    index = attempt["candidate"]
+    try:
+        # Only the first candidate is the cacheable /generate-patch answer;
+        # cached alternatives would make every search try the same fixes
+        patch = await generate_patch(request, use_cache=index == 0, temperature=attempt["temperature"],
+                                     store_result=index == 0)
+    except Exception as e:
+        return _finish(attempt, "error", f"Patch generation failed: {type(e).__name__}: {e}", started)
+    attempt["patch"] = patch.model_dump()
+    attempt["generateMs"] = int((time.perf_counter() - started) * 1000)
+
+    key = _diff_key(patch.diff)
+    if not key:
+        return _finish(attempt, "error", "Empty diff", started)
+    if key in seen:
+        return _finish(attempt, "duplicate", f"Same diff as candidate {seen[key]}", started)
+    seen[key] = index
+    if _spec_passes_unpatched(control):
+        return _finish(attempt, "skipped", "The spec passes without a patch", started)
+    progress.emit("patch.candidate", candidate=index, status="verifying")
+    try:
+        status, error = await verify_patch(patch.diff, spec, origin, warm_url, attempt)
+    except Exception as e:
+        status, error = "error", f"Verification failed: {type(e).__name__}: {e}"
+    return _finish(attempt, status, error, started)
+
+
+async def search_patch(request, candidates: Optional[int] = None) -> dict:
+    """
+    Generate up to `candidates` patches concurrently and verify each against
+    the failing spec in its own sandbox, next to one control run of the spec
+    without a patch. A pass is verified only when the control run failed.
+    Returns the first verified patch; else unverified with a passing
+    candidate's patch (the control run did not fail) or the first generated
+    one (none passed); else unverifiable when the control run passes:
+
+        {
+            "status": "verified" | "unverified" | "unverifiable",
+            "candidate": Optional[int],  # index of the verified candidate
+            "reason": Optional[str],     # why the result is not verified
+            "patch": Optional[dict],     # PatchResponse of that candidate
+            "attempts": [{"candidate", "temperature", "status", "error", "patch", "durationMs", ...}],
+            "control": {"status", "error", "durationMs"},  # the unpatched run
+            "durationMs": int
+        }
+
+    Raises ValueError when the request has no failing spec, or the spec's app
+    URL cannot be determined.
+    """
+    count = max(1, min(candidates or CANDIDATES, MAX_CANDIDATES))
+    spec = normalize_spec(request.failing_test or "")
+    if not spec.strip():
+        raise ValueError("Patch search needs failing_test: the spec that verifies each candidate")
+    target_url = request.analysis.targetUrl if request.analysis else None
+    origin = app_origin(spec, target_url)
+    if origin is None:
+        raise ValueError("Could not tell which URL the failing spec tests; set analysis.targetUrl")
+    warm_url = target_url if target_url and target_url.startswith(origin) else origin + "/"
+
+    started = time.perf_counter()
+    attempts = [{"candidate": i, "temperature": candidate_temperature(i, count), "status": "pending"}
+                for i in range(count)]
+    seen: Dict[str, int] = {}
+    print(f"[Patch Search] {count} candidates against {TARGET_APP_DIR} ({origin}), "
+          f"{SANDBOXES} sandboxes")
+    progress.emit("patch_search.started", candidates=count)
+
+    # The control run starts first, so it gets the first sandbox slot
+    control = asyncio.create_task(_run_control(spec, origin, warm_url))
+    tasks = [asyncio.create_task(_run_candidate(request, attempt, spec, origin, warm_url, seen, control))
+             for attempt in attempts]
+    winner = None
+    try:
+        with metrics.stage("patch_search"):
+            # A pass only counts once the control run has failed
+            pending = {control, *tasks}
+            while pending and not (winner and control.done()):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if _spec_passes_unpatched(control):
+                    break
+                winner = winner or next((task.result() for task in tasks
+                                         if task in done and task.result()["status"] == "passed"), None)
+            if _spec_passes_unpatched(control) and not attempts[0].get("patch"):
+                # Still return /generate-patch's answer; candidate 0 skips verification now
+                await asyncio.gather(tasks[0], return_exceptions=True)
+    finally:
+        # Generation calls, dev servers and browsers still running are stopped here
+        for task in (control, *tasks):
+            task.cancel()
+        await asyncio.gather(control, *tasks, return_exceptions=True)
+
+    for attempt in attempts:
+        if attempt["status"] == "pending":
+            attempt["status"] = "cancelled"
+            metrics.patch_candidates.inc(status="cancelled")
+
+    # A pass proves the fix only if the same spec failed without it
+    baseline = control.result() if control.done() and not control.cancelled() else None
+    control_status = baseline["status"] if baseline else "cancelled"
+    reason = None
+    if control_status == "passed":
+        status, reason, winner = "unverifiable", "The spec passes without a patch", None
+    elif winner and control_status != "failed":
+        status = "unverified"
+        reason = (f"Candidate {winner['candidate']} passed, but the control run without a patch "
+                  f"ended {control_status} instead of failing")
+    elif winner:
+        status = "verified"
+    else:
+        status, reason = "unverified", "No candidate made the spec pass"
+    fallback = next((a for a in attempts if a.get("patch")), None)
+    chosen = winner or fallback
+    candidate = winner["candidate"] if status == "verified" else None
+    duration_ms = int((time.perf_counter() - started) * 1000)
+    print(f"[Patch Search] {status}" + (f" by candidate {candidate}" if status == "verified" else f": {reason}")
+          + f" in {duration_ms}ms")
+    progress.emit("patch_search.finished", status=status, candidate=candidate, reason=reason)
+    return {
+        "status": status,
+        "candidate": candidate,
+        "reason": reason,
+        "patch": chosen["patch"] if chosen else None,
+        "attempts": attempts,
+        "control": baseline,
+        "durationMs": duration_ms,
+    }
@@ -0,0 +1,392 @@
+import asyncio
+import contextvars
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+import metrics
+
+# Number of warm Node workers; 0 disables the pool and every run uses npx
+POOL_SIZE = int(os.getenv("PLAYWRIGHT_POOL_SIZE", "2"))
+# Recycle a worker after this many runs to bound browser memory growth
+POOL_MAX_RUNS = int(os.getenv("PLAYWRIGHT_POOL_MAX_RUNS", "50"))
+# Idle workers are pinged this often; dead ones are replaced
+HEALTH_CHECK_SECONDS = float(os.getenv("PLAYWRIGHT_POOL_HEALTH_SECONDS", "30"))
+# Node startup plus Chromium launch
+STARTUP_TIMEOUT = 60
+
+PROTOCOL_PREFIX = b"@@patchpilot "
+WORKER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "playwright_worker.mjs")
+# Copied into the runner directory so '@playwright/test' resolves from its node_modules
+WORKER_NAME = "patchpilot_worker.mjs"
+
+
+class WorkerError(Exception):
+    """The worker process died or could not be started."""
+
+
+class PlaywrightWorker:
+    """
+    One long-lived Node process with Chromium already launched.
+
+    Talks newline-delimited JSON over stdin/stdout (see playwright_worker.mjs)
+    and runs one spec at a time.
+    """
+
+    def __init__(self, runner_dir: str, node_path: str):
+        self.runner_dir = runner_dir
+        self.node_path = node_path
+        self.proc: Optional[asyncio.subprocess.Process] = None
+        self.runs = 0
+        self.pid: Optional[int] = None
+        self._pending: Dict[str, asyncio.Future] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._stderr_tail = deque(maxlen=50)
+        self._capture: Optional[List[str]] = None
+        self._on_line: Optional[Callable[[str, str], None]] = None
+
+    @property
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+    async def start(self):
+        started = time.perf_counter()
+        self.proc = await asyncio.create_subprocess_exec(
+            self.node_path,
+            WORKER_NAME,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.runner_dir,
+            limit=16 * 1024 * 1024  # Results carry full error stacks
+        )
+        ready = asyncio.get_running_loop().create_future()
+        self._pending["ready"] = ready
+        self._tasks = [
+            asyncio.create_task(self._read_stdout()),
+            asyncio.create_task(self._read_stderr()),
+        ]
+        try:
+            message = await asyncio.wait_for(ready, timeout=STARTUP_TIMEOUT)
+        except (asyncio.TimeoutError, WorkerError) as e:
+            await self.stop()
+            tail = "\n".join(self._stderr_tail)
+            raise WorkerError(f"Worker failed to start: {e or 'timed out'}\n{tail}".rstrip())
+        self.pid = message.get("pid")
+        # Node startup, module load and browser launch, until the worker says ready
+        metrics.observe_stage("playwright_spawn", time.perf_counter() - started)
+
+    async def _read_stdout(self):
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                break
+            if not line.startswith(PROTOCOL_PREFIX):
+                continue
+            try:
+                message = json.loads(line[len(PROTOCOL_PREFIX):])
+            except ValueError:
+                continue
+            future = self._pending.pop(message.get("id") or message.get("type"), None)
+            if future is not None and not future.done():
+                future.set_result(message)
+        # EOF: the process is gone, fail whoever is still waiting
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(WorkerError("Worker exited"))
+        self._pending.clear()
+
+    async def _read_stderr(self):
+        while True:
+            line = await self.proc.stderr.readline()
+            if not line:
+                break
+            text = line.decode("utf-8", errors="replace").rstrip()
+            self._stderr_tail.append(text)
+            if self._capture is not None:
+                self._capture.append(text)
+            if self._on_line is not None:
+                self._on_line("stderr", text)
+
+    async def request(self, message: dict, timeout: float) -> dict:
+        if not self.alive:
+            raise WorkerError("Worker is not running")
+        request_id = uuid.uuid4().hex
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self.proc.stdin.write(json.dumps({**message, "id": request_id}).encode("utf-8") + b"\n")
+            await self.proc.stdin.drain()
+            return await asyncio.wait_for(future, timeout=timeout)
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise WorkerError(f"Worker pipe closed: {e}")
+        finally:
+            self._pending.pop(request_id, None)
+
+    async def ping(self, timeout: float = 5) -> bool:
+        try:
+            reply = await self.request({"type": "ping"}, timeout=timeout)
+        except (WorkerError, asyncio.TimeoutError):
+            return False
+        return bool(reply.get("connected"))
+
+    async def run(
+        self,
+        spec_path: str,
+        timeout: float,
+        on_line: Optional[Callable[[str, str], None]] = None,
+        artifacts_dir: Optional[str] = None,
+        capture: Optional[dict] = None,
+        test_timeout_ms: Optional[int] = None
+    ) -> dict:
+        """
+        Run one spec file: each test gets test_timeout_ms (the worker's 30 s
+        default when None), the whole spec timeout seconds. Raises WorkerError
+        if the process dies, TimeoutError if it hangs.
+        """
+        self.runs += 1
+        self._capture = []
+        if on_line is not None:
+            # Output is read by a background task; run the callback in the caller's context
+            self._on_line = lambda stream, line, run=contextvars.copy_context().run: run(on_line, stream, line)
+        try:
+            # The worker enforces the test timeout itself; the margin covers context teardown
+            with metrics.stage("playwright_execution"):
+                result = await self.request(
+                    {"type": "run", "spec": spec_path, "timeoutMs": int(timeout * 1000),
+                     "testTimeoutMs": test_timeout_ms, "artifactsDir": artifacts_dir, "capture": capture or {}},
+                    timeout=timeout + 10
+                )
+            result["stderr"] = "\n".join(self._capture)
+            return result
+        finally:
+            self._capture = None
+            self._on_line = None
+
+    async def stop(self):
+        if self.alive:
+            try:
+                self.proc.stdin.write(b'{"type": "shutdown"}\n')
+                await self.proc.stdin.drain()
+                await asyncio.wait_for(self.proc.wait(), timeout=5)
+            except (asyncio.TimeoutError, BrokenPipeError, ConnectionResetError):
+                self.proc.kill()
+                await self.proc.wait()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+def to_report(spec_name: str, result: dict) -> dict:
+    """A worker result in the shape of Playwright's JSON reporter."""
+    specs = []
+    counts = {"expected": 0, "unexpected": 0, "skipped": 0}
+    for test in result.get("tests", []):
+        status = test["status"]
+        if status == "passed":
+            counts["expected"] += 1
+        elif status == "skipped":
+            counts["skipped"] += 1
+        else:
+            counts["unexpected"] += 1
+        run = {"status": status, "duration": test.get("durationMs", 0), "errors": [],
+               "attachments": test.get("attachments", [])}
+        if test.get("error"):
+            run["error"] = test["error"]
+            run["errors"] = [test["error"]]
+        specs.append({
+            "title": test["title"],
+            "ok": status in ("passed", "skipped"),
+            "file": spec_name,
+            "tests": [{"projectName": "chromium", "status": "expected" if status == "passed" else status,
+                       "results": [run]}],
+        })
+    return {
+        "suites": [{"title": spec_name, "file": spec_name, "specs": specs, "suites": []}],
+        "errors": [result["error"]] if result.get("error") else [],
+        "stats": {**counts, "flaky": 0, "duration": result.get("durationMs", 0)},
+    }
+
+
+class PlaywrightPool:
+    """
+    Pre-warmed Playwright workers.
+
+    Workers start lazily on the first run. Each slot holds a worker (or None
+    after a failed start, which is retried on next use). A worker is replaced
+    after max_runs runs, after a hang or crash, and when it fails a periodic
+    health check. run() returns None whenever the caller should use npx
+    instead: pool disabled, no worker available, or a spec the worker cannot
+    load.
+    """
+
+    def __init__(self, size: int = POOL_SIZE, max_runs: int = POOL_MAX_RUNS,
+                 health_interval: float = HEALTH_CHECK_SECONDS):
+        self.size = size
+        self.max_runs = max(1, max_runs)
+        self.health_interval = health_interval
+        self._slots: Optional[asyncio.Queue] = None
+        self._start_lock = asyncio.Lock()
+        self._runner_dir: Optional[str] = None
+        self._node_path: Optional[str] = None
+        self._workers = set()
+        self._background = set()
+        self._health_task: Optional[asyncio.Task] = None
+        self._counters = {"runs": 0, "recycled": 0, "crashed": 0, "fallbacks": 0, "startFailures": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.size > 0
+
+    async def _ensure_started(self, runner_dir: str, node_path: str):
+        async with self._start_lock:
+            if self._slots is not None:
+                return
+            # Refresh the script on every start so edits are picked up
+            shutil.copyfile(WORKER_SOURCE, os.path.join(runner_dir, WORKER_NAME))
+            self._runner_dir = runner_dir
+            self._node_path = node_path
+            self._slots = asyncio.Queue()
+            started = time.time()
+            workers = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+            for worker in workers:
+                self._slots.put_nowait(worker)
+            ready = sum(worker is not None for worker in workers)
+            print(f"[Playwright Pool] {ready}/{self.size} workers ready in {int((time.time() - started) * 1000)}ms")
+            if self.health_interval > 0:
+                self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _spawn(self) -> Optional[PlaywrightWorker]:
+        worker = PlaywrightWorker(self._runner_dir, self._node_path)
+        try:
+            await worker.start()
+        except (WorkerError, OSError) as e:
+            self._counters["startFailures"] += 1
+            print(f"[Playwright Pool] {e}")
+            return None
+        self._workers.add(worker)
+        return worker
+
+    async def _retire(self, worker: PlaywrightWorker):
+        self._workers.discard(worker)
+        await worker.stop()
+
+    def _recycle(self, worker: PlaywrightWorker):
+        """Stop a worker and refill its slot in the background."""
+        async def replace():
+            await self._retire(worker)
+            self._slots.put_nowait(await self._spawn())
+        task = asyncio.create_task(replace())
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def run(
+        self,
+        runner_dir: str,
+        node_path: str,
+        spec_path: str,
+        timeout: float,
+        on_line: Optional[Callable[[str, str], None]] = None,
+        artifacts_dir: Optional[str] = None,
+        capture: Optional[dict] = None,
+        test_timeout_ms: Optional[int] = None
+    ) -> Optional[dict]:
+        """
+        Run spec_path on a warm worker.
+
+        Returns the worker result ({"status", "tests", "stderr", "durationMs",
+        ...}) or None if the caller should fall back to npx.
+        """
+        if not self.enabled:
+            return None
+        await self._ensure_started(runner_dir, node_path)
+
+        worker = await self._slots.get()
+        if worker is None or not worker.alive:
+            if worker is not None:
+                await self._retire(worker)
+            worker = await self._spawn()
+            if worker is None:
+                self._slots.put_nowait(None)
+                self._counters["fallbacks"] += 1
+                return None
+
+        result = None
+        try:
+            result = await worker.run(spec_path, timeout, on_line=on_line, artifacts_dir=artifacts_dir,
+                                      capture=capture, test_timeout_ms=test_timeout_ms)
+        except asyncio.TimeoutError:
+            self._counters["crashed"] += 1
+            result = {
+                "status": "failed",
+                "tests": [],
+                "timedOut": True,
+                "stderr": f"Worker did not answer within {int(timeout)}s",
+                "durationMs": int(timeout * 1000),
+            }
+        except WorkerError as e:
+            self._counters["crashed"] += 1
+            print(f"[Playwright Pool] Worker {worker.pid} crashed: {e}")
+        finally:
+            if result is None or result.get("timedOut") or not worker.alive:
+                self._recycle(worker)
+            elif worker.runs >= self.max_runs:
+                self._counters["recycled"] += 1
+                self._recycle(worker)
+            else:
+                self._slots.put_nowait(worker)
+
+        if result is None or result.get("status") == "unsupported":
+            if result is not None:
+                print(f"[Playwright Pool] Spec not runnable in worker ({result.get('reason')}); using npx")
+            self._counters["fallbacks"] += 1
+            return None
+        self._counters["runs"] += 1
+        return result
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            # Only idle workers are checked; busy ones are covered by their run timeout
+            for _ in range(self._slots.qsize()):
+                try:
+                    worker = self._slots.get_nowait()
+                except asyncio.QueueEmpty:
+                    break
+                if worker is not None and await worker.ping():
+                    self._slots.put_nowait(worker)
+                    continue
+                if worker is not None:
+                    print(f"[Playwright Pool] Worker {worker.pid} failed health check; replacing")
+                    self._counters["crashed"] += 1
+                    self._recycle(worker)
+                else:
+                    self._slots.put_nowait(await self._spawn())
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "maxRuns": self.max_runs,
+            "started": self._slots is not None,
+            "live": len(self._workers),
+            "idle": self._slots.qsize() if self._slots is not None else 0,
+            **self._counters,
+        }
+
+    async def stop(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        await asyncio.gather(*self._background, return_exceptions=True)
+        await asyncio.gather(*(worker.stop() for worker in list(self._workers)), return_exceptions=True)
+        self._workers.clear()
+        self._slots = None
+
+
+pool = PlaywrightPool()
@@ -1,16 +1,48 @@
 import subprocess
+import asyncio
 import uuid
 import os
 import time
 import sys
 import shutil
 import json
-from typing import Optional, Dict, List
+import math
+import re
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, List, Callable, Tuple
 from pathlib import Path
 
+import progress
+import metrics
+from playwright_pool import pool, to_report
+from run_report import summarize, parse_report_file, for_file, render
+from artifacts import artifact_store, store_report_artifacts
+
 # Windows detection
 IS_WINDOWS = sys.platform.startswith("win")
 
+# Playwright workers for batch runs - defaults to one per core
+BATCH_WORKERS = int(os.getenv("PLAYWRIGHT_BATCH_WORKERS", str(os.cpu_count() or 1)))
+# Largest batch accepted by /run-tests
+BATCH_MAX_SPECS = int(os.getenv("PLAYWRIGHT_BATCH_MAX_SPECS", "50"))
+# Time budget per wave of specs (one spec per worker)
+BATCH_TIMEOUT_PER_WAVE = 60
+# Rough resident memory of one browser plus its Playwright worker
+RUN_MEMORY_MB = int(os.getenv("PLAYWRIGHT_RUN_MEMORY_MB", "400"))
+
+# Artifact capture, using Playwright's `use` modes (on, off, only-on-failure, retain-on-failure)
+ARTIFACT_CAPTURE = {
+    "screenshot": os.getenv("ARTIFACT_SCREENSHOT", "only-on-failure"),
+    "trace": os.getenv("ARTIFACT_TRACE", "retain-on-failure"),
+    "video": os.getenv("ARTIFACT_VIDEO", "retain-on-failure"),
+}
+# Generated in the runner directory; runs pass it with --config
+RUNNER_CONFIG_NAME = "patchpilot.config.mjs"
+# Per-test timeout: written to the config for npx runs and sent to warm
+# workers, so both give the same verdict for a slow test. The 60 s run
+# timeout only caps a whole spec. 30 s is Playwright's own default
+TEST_TIMEOUT_MS = int(os.getenv("PLAYWRIGHT_TEST_TIMEOUT_MS", "30000"))
+
 def find_executable(name: str) -> Optional[str]:
     """
     Find executable using shutil.which, handling Windows .cmd/.exe extensions.
@@ -166,11 +198,175 @@ def setup_playwright_runner_dir() -> str:
             print(f"[Playwright Runner] Warning: Browser installation had issues: {install_browser_result.stderr}")
             # Continue anyway, might already be installed
     
+    write_runner_config(runner_dir)
     return runner_dir
 
-def run_playwright_test(test_code: str) -> dict:
+def write_runner_config(runner_dir: str) -> str:
+    """
+    Write the Playwright config used by every run. testDir is the run's own
+    working directory, the per-test timeout is TEST_TIMEOUT_MS and capture
+    settings come from ARTIFACT_CAPTURE.
+    """
+    config_path = os.path.join(runner_dir, RUNNER_CONFIG_NAME)
+    content = (
+        "// Generated by playwright_runner.py - changes are overwritten\n"
+        "export default {\n"
+        "  testDir: process.cwd(),\n"
+        f"  timeout: {TEST_TIMEOUT_MS},\n"
+        f"  use: {json.dumps(ARTIFACT_CAPTURE)},\n"
+        "};\n"
+    )
+    try:
+        with open(config_path, "r", encoding="utf-8") as f:
+            if f.read() == content:
+                return config_path
+    except FileNotFoundError:
+        pass
+    with open(config_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    return config_path
+
+async def _read_lines(stream, sink: List[bytes], name: str, on_line: Optional[Callable[[str, str], None]]):
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        sink.append(line)
+        if on_line:
+            on_line(name, line.decode("utf-8", errors="replace").rstrip())
+
+async def run_command(
+    cmd: List[str],
+    cwd: str,
+    timeout: float,
+    env: Optional[Dict[str, str]] = None,
+    on_line: Optional[Callable[[str, str], None]] = None,
+    stage: str = "playwright_execution"
+) -> subprocess.CompletedProcess:
+    """
+    Run a command without blocking the event loop.
+    on_line(stream_name, line) is called for every stdout/stderr line as it arrives.
+    Process creation is recorded as the "playwright_spawn" stage and the
+    rest of the run under stage.
+    Raises subprocess.TimeoutExpired (after killing the process) on timeout.
+    The process is also killed when the caller is cancelled.
+    """
+    with metrics.stage("playwright_spawn"):
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            env={**os.environ, **(env or {})},  # Pass through environment
+            limit=16 * 1024 * 1024  # Reporter output can have very long lines
+        )
+    stdout, stderr = [], []
+    try:
+        with metrics.stage(stage):
+            await asyncio.wait_for(
+                asyncio.gather(
+                    _read_lines(proc.stdout, stdout, "stdout", on_line),
+                    _read_lines(proc.stderr, stderr, "stderr", on_line),
+                    proc.wait()
+                ),
+                timeout=timeout
+            )
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    except asyncio.CancelledError:
+        # e.g. a patch search that already found its fix; don't leave the browser running
+        proc.kill()
+        await proc.wait()
+        raise
+    return subprocess.CompletedProcess(
+        cmd,
+        proc.returncode,
+        b"".join(stdout).decode("utf-8", errors="replace"),
+        b"".join(stderr).decode("utf-8", errors="replace")
+    )
+
+def normalize_spec(test_code: str) -> str:
+    """Fix bare localhost URLs that generated specs sometimes pass to page.goto."""
+    test_code = test_code.replace("page.goto('localhost:", "page.goto('http://localhost:")
+    return test_code.replace('page.goto("localhost:', 'page.goto("http://localhost:')
+
+def _available_memory_mb() -> Optional[int]:
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+def default_run_slots() -> int:
+    """
+    Browsers that may run at once: PLAYWRIGHT_MAX_CONCURRENT_RUNS if set,
+    otherwise one per core, capped by available memory / RUN_MEMORY_MB.
+    """
+    configured = os.getenv("PLAYWRIGHT_MAX_CONCURRENT_RUNS")
+    if configured:
+        return max(1, int(configured))
+    slots = os.cpu_count() or 1
+    memory_mb = _available_memory_mb()
+    if memory_mb:
+        slots = min(slots, memory_mb // RUN_MEMORY_MB)
+    return max(1, slots)
+
+class RunLimiter:
+    """
+    Weighted limit on concurrent browsers.
+
+    A single run takes one slot and a batch takes one per Playwright worker,
+    so /run-test, /run-tests and run-test jobs share one CPU/memory budget.
+    Callers queue in arrival order once the budget is used up.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.in_use = 0
+        self.waiting = 0
+        self._condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slots(self, count: int = 1):
+        count = max(1, min(count, self.capacity))
+        async with self._condition:
+            if self.in_use + count > self.capacity:
+                progress.emit("playwright.queued", slots=count, inUse=self.in_use, capacity=self.capacity)
+            self.waiting += 1
+            try:
+                with metrics.stage("playwright_queue"):
+                    await self._condition.wait_for(lambda: self.in_use + count <= self.capacity)
+            finally:
+                self.waiting -= 1
+            self.in_use += count
+        try:
+            yield count
+        finally:
+            async with self._condition:
+                self.in_use -= count
+                self._condition.notify_all()
+
+    def stats(self) -> dict:
+        return {"capacity": self.capacity, "inUse": self.in_use, "waiting": self.waiting}
+
+run_limiter = RunLimiter(default_run_slots())
+
+def _emit_output(stream: str, line: str):
+    if line:
+        progress.emit("playwright.output", stream=stream, line=line)
+
+async def run_playwright_test(test_code: str, use_pool: bool = True) -> dict:
     """
-    Run a Playwright test and return standardized result.
+    Run a Playwright test and return standardized result. use_pool=False skips
+    the warm worker pool and always runs `npx playwright test`.
     
     Returns:
         {
@@ -178,19 +374,22 @@ def run_playwright_test(test_code: str) -> dict:
             "stdout": str,
             "stderr": str,
             "durationMs": int,
-            "screenshotUrl": Optional[str]  # null for now, can be added later
+            "screenshotUrl": Optional[str],  # /artifacts/<hash>.png of the first failing test, if captured
+            "report": Optional[dict]  # run_report.summarize() output, None if no report was written
         }
     """
     # Set up runner directory
     try:
-        runner_dir = setup_playwright_runner_dir()
+        # First-time setup runs npm install; keep it off the event loop
+        runner_dir = await asyncio.to_thread(setup_playwright_runner_dir)
     except Exception as e:
         return {
             "status": "failed",
             "stdout": "",
             "stderr": f"Failed to set up Playwright runner: {str(e)}",
             "durationMs": 0,
-            "screenshotUrl": None
+            "screenshotUrl": None,
+            "report": None
         }
     
     # Find npx executable
@@ -201,82 +400,85 @@ def run_playwright_test(test_code: str) -> dict:
             "stdout": "",
             "stderr": "npx not found in PATH. Install Node.js from https://nodejs.org/",
             "durationMs": 0,
-            "screenshotUrl": None
+            "screenshotUrl": None,
+            "report": None
         }
     
-    # Normalize test code: fix localhost URLs
-    normalized_test_code = test_code.replace("page.goto('localhost:", "page.goto('http://localhost:")
-    normalized_test_code = normalized_test_code.replace('page.goto("localhost:', 'page.goto("http://localhost:')
+    normalized_test_code = normalize_spec(test_code)
     
-    # Generate test file - write to tests/ subdirectory
+    # Each run gets a private directory under runs/ holding its spec, report
+    # and test-results. It is also the cwd, so Playwright only ever discovers
+    # this run's spec; node_modules resolves from runner_dir as a parent.
     test_id = str(uuid.uuid4())
-    test_dir = os.path.join(runner_dir, "tests")
-    os.makedirs(test_dir, exist_ok=True)
+    run_dir = os.path.join(runner_dir, "runs", test_id)
     filename = f"test_{test_id}.spec.ts"
-    test_file_abs = os.path.join(test_dir, filename)
+    test_file_abs = os.path.join(run_dir, filename)
+    report_path = os.path.join(run_dir, "report.json")
     
     # Write test file
     try:
+        os.makedirs(run_dir, exist_ok=True)
         with open(test_file_abs, "w", encoding="utf-8") as f:
             f.write(normalized_test_code)
     except Exception as e:
+        shutil.rmtree(run_dir, ignore_errors=True)
         return {
             "status": "failed",
             "stdout": "",
             "stderr": f"Failed to write test file: {str(e)}",
             "durationMs": 0,
-            "screenshotUrl": None
+            "screenshotUrl": None,
+            "report": None
         }
     
-    # Verification BEFORE running
-    print(f"[Playwright Runner] ===== VERIFICATION =====")
-    print(f"[Playwright Runner] Test file absolute path: {test_file_abs}")
-    print(f"[Playwright Runner] Test file exists: {os.path.exists(test_file_abs)}")
-    print(f"[Playwright Runner] Runner directory: {runner_dir}")
-    print(f"[Playwright Runner] Tests directory: {test_dir}")
-    
-    # List files in tests directory
-    try:
-        test_files = os.listdir(test_dir)
-        print(f"[Playwright Runner] Files in tests/ directory (first 5): {test_files[:5]}")
-    except Exception as e:
-        print(f"[Playwright Runner] Error listing tests directory: {e}")
-    
-    # Assert test file exists
-    if not os.path.exists(test_file_abs):
-        return {
-            "status": "failed",
-            "stdout": "",
-            "stderr": f"Test file was not created: {test_file_abs}",
-            "durationMs": 0,
-            "screenshotUrl": None
-        }
-    
-    start_time = time.time()
-    
-    # Build command with RELATIVE path from runner_dir
-    # Use forward slashes for cross-platform compatibility
-    rel_path = os.path.join("tests", filename).replace("\\", "/")
-    cmd = [npx_path, "playwright", "test", rel_path, "--reporter=json"]
+    # The line reporter streams progress on stdout; the JSON report goes to a
+    # file and is summarized into "report"
+    results_dir = os.path.join(run_dir, "test-results")
+    cmd = [npx_path, "playwright", "test", filename, "--reporter=line,json",
+           f"--config={os.path.join(runner_dir, RUNNER_CONFIG_NAME)}", f"--output={results_dir}"]
     
     # Log command for debugging
     print(f"[Playwright Runner] ===== EXECUTION =====")
     print(f"[Playwright Runner] Command: {' '.join(cmd)}")
-    print(f"[Playwright Runner] Working directory (cwd): {runner_dir}")
-    print(f"[Playwright Runner] Relative test path: {rel_path}")
-    print(f"[Playwright Runner] Absolute test path: {test_file_abs}")
-    print(f"[Playwright Runner] PATH: {os.environ.get('PATH', '')[:200]}...")
+    print(f"[Playwright Runner] Working directory (cwd): {run_dir}")
     
     try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=60,
-            cwd=runner_dir,
-            shell=False,  # Explicitly set to False for security
-            env=os.environ.copy()  # Pass through environment
-        )
+        async with run_limiter.slots(1):
+            start_time = time.time()
+            progress.emit("playwright.started", test=filename)
+
+            # Warm workers skip Node startup and browser launch; None means use npx
+            node_path = find_executable("node") if use_pool else None
+            pooled = None
+            if node_path:
+                pooled = await pool.run(runner_dir, node_path, test_file_abs, timeout=60, on_line=_emit_output,
+                                        artifacts_dir=results_dir, capture=ARTIFACT_CAPTURE,
+                                        test_timeout_ms=TEST_TIMEOUT_MS)
+            if pooled is not None:
+                duration_ms = int((time.time() - start_time) * 1000)
+                status = pooled["status"]
+                report = summarize(to_report(filename, pooled))
+                screenshot_url = await asyncio.to_thread(store_report_artifacts, artifact_store, report)
+                print(f"[Playwright Runner] Ran on warm worker: {status} in {duration_ms}ms")
+                metrics.playwright_runs.inc(runner="pool", status=status)
+                progress.emit("playwright.finished", status=status, durationMs=duration_ms,
+                              timedOut=bool(pooled.get("timedOut")), pooled=True)
+                return {
+                    "status": status,
+                    "stdout": render(report),
+                    "stderr": pooled.get("stderr", ""),
+                    "durationMs": duration_ms,
+                    "screenshotUrl": screenshot_url,
+                    "report": report
+                }
+
+            result = await run_command(
+                cmd,
+                cwd=run_dir,
+                timeout=60,
+                env={"PLAYWRIGHT_JSON_OUTPUT_NAME": report_path},
+                on_line=_emit_output
+            )
         
         duration_ms = int((time.time() - start_time) * 1000)
         
@@ -285,46 +487,19 @@ def run_playwright_test(test_code: str) -> dict:
         print(f"[Playwright Runner] Return code: {result.returncode}")
         print(f"[Playwright Runner] Duration: {duration_ms}ms")
         
-        # Check for "No tests found" error
         stderr_output = result.stderr or ""
         stdout_output = result.stdout or ""
+        report = parse_report_file(report_path) if os.path.exists(report_path) else None
+        # Artifacts live in the sandbox, which is deleted below; keep them in the store
+        screenshot_url = await asyncio.to_thread(store_report_artifacts, artifact_store, report)
         
-        if "No tests found" in stderr_output or "no tests found" in stderr_output.lower():
-            # Add detailed debugging info
-            debug_info = f"\n\n[DEBUG] No tests found - diagnostic info:\n"
-            debug_info += f"  - Runner directory: {runner_dir}\n"
-            debug_info += f"  - Tests directory: {test_dir}\n"
-            debug_info += f"  - Test file absolute: {test_file_abs}\n"
-            debug_info += f"  - Test file exists: {os.path.exists(test_file_abs)}\n"
-            debug_info += f"  - Relative path used: {rel_path}\n"
-            try:
-                test_files = os.listdir(test_dir)
-                debug_info += f"  - Files in tests/: {test_files}\n"
-            except Exception as e:
-                debug_info += f"  - Error listing tests/: {e}\n"
-            stderr_output = stderr_output + debug_info
-            
-            # Try fallback: run without specific file (for debugging)
-            print(f"[Playwright Runner] Attempting fallback: run all tests in directory")
-            fallback_cmd = [npx_path, "playwright", "test", "--reporter=json"]
-            try:
-                fallback_result = subprocess.run(
-                    fallback_cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=60,
-                    cwd=runner_dir,
-                    shell=False,
-                    env=os.environ.copy()
-                )
-                print(f"[Playwright Runner] Fallback return code: {fallback_result.returncode}")
-                print(f"[Playwright Runner] Fallback stdout: {fallback_result.stdout}")
-                print(f"[Playwright Runner] Fallback stderr: {fallback_result.stderr}")
-            except Exception as e:
-                print(f"[Playwright Runner] Fallback failed: {e}")
-        
-        # Log full output when "No tests found"
-        if "No tests found" in stderr_output or "no tests found" in stderr_output.lower():
+        # The run directory only holds this spec, so "No tests found" means the
+        # spec itself declared no tests (or failed to load); report it as such
+        if "no tests found" in (stderr_output + stdout_output).lower():
+            stderr_output += (
+                f"\n\n[DEBUG] No tests found in {filename}. "
+                f"Make sure the spec imports test from '@playwright/test' and declares at least one test()."
+            )
             print(f"[Playwright Runner] Stdout (FULL): {stdout_output}")
             print(f"[Playwright Runner] Stderr (FULL): {stderr_output}")
         else:
@@ -335,50 +510,195 @@ def run_playwright_test(test_code: str) -> dict:
         
         # Determine status: passed if returncode is 0, failed otherwise
         status = "passed" if result.returncode == 0 else "failed"
+        metrics.playwright_runs.inc(runner="npx", status=status)
+        progress.emit("playwright.finished", status=status, durationMs=duration_ms)
         
         return {
             "status": status,
             "stdout": stdout_output,
             "stderr": stderr_output,
             "durationMs": duration_ms,
-            "screenshotUrl": None  # Can be implemented later with artifact serving
+            "screenshotUrl": screenshot_url,
+            "report": report
         }
     
     except subprocess.TimeoutExpired:
         duration_ms = int((time.time() - start_time) * 1000)
+        metrics.playwright_runs.inc(runner="npx", status="timedOut")
+        progress.emit("playwright.finished", status="failed", durationMs=duration_ms, timedOut=True)
         return {
             "status": "failed",
             "stdout": "",
             "stderr": f"Test execution timed out after {duration_ms}ms",
             "durationMs": duration_ms,
-            "screenshotUrl": None
+            "screenshotUrl": None,
+            "report": None
         }
     
     except FileNotFoundError as e:
-        duration_ms = int((time.time() - start_time) * 1000)
         return {
             "status": "failed",
             "stdout": "",
             "stderr": f"Executable not found: {str(e)}. Make sure Node.js and Playwright are installed.",
-            "durationMs": duration_ms,
-            "screenshotUrl": None
+            "durationMs": 0,
+            "screenshotUrl": None,
+            "report": None
         }
     
     except Exception as e:
-        duration_ms = int((time.time() - start_time) * 1000)
         return {
             "status": "failed",
             "stdout": "",
             "stderr": f"Error running test: {str(e)}",
-            "durationMs": duration_ms,
-            "screenshotUrl": None
+            "durationMs": 0,
+            "screenshotUrl": None,
+            "report": None
         }
     
     finally:
-        # Cleanup test file
-        try:
-            if os.path.exists(test_file_abs):
-                os.remove(test_file_abs)
-                print(f"[Playwright Runner] Cleaned up test file: {test_file_abs}")
-        except Exception as e:
-            print(f"[Playwright Runner] Warning: Failed to cleanup test file: {e}")
+        # The whole sandbox goes: spec, report and test-results
+        shutil.rmtree(run_dir, ignore_errors=True)
+        print(f"[Playwright Runner] Cleaned up run directory: {run_dir}")
+
+def _batch_filename(index: int, filename: str) -> str:
+    """Unique, filesystem-safe spec name that Playwright's default testMatch picks up."""
+    stem = re.sub(r"[^A-Za-z0-9_.-]", "_", os.path.basename(filename or "spec"))
+    stem = re.sub(r"(\.spec)?\.(ts|js|mjs)$", "", stem) or "spec"
+    return f"{index:02d}_{stem}.spec.ts"
+
+async def run_playwright_batch(tests: List[Tuple[str, str]]) -> dict:
+    """
+    Run several specs in one Playwright invocation.
+
+    tests is a list of (filename, spec code). The specs are written to their
+    own batch directory and run with --workers sized to the available cores.
+
+    Returns:
+        {
+            "batchId": str,
+            "status": "passed" | "failed",
+            "workers": int,
+            "durationMs": int,
+            "stderr": str,
+            "results": [  # one per spec, in request order
+                {"filename", "status", "stdout", "stderr", "durationMs", "screenshotUrl", "report"}
+            ]
+        }
+    """
+    batch_id = uuid.uuid4().hex[:12]
+
+    def failed_batch(message: str) -> dict:
+        return {
+            "batchId": batch_id,
+            "status": "failed",
+            "workers": 0,
+            "durationMs": 0,
+            "stderr": message,
+            "results": [
+                {"filename": filename, "status": "failed", "stdout": "", "stderr": message,
+                 "durationMs": 0, "screenshotUrl": None, "report": None}
+                for filename, _ in tests
+            ]
+        }
+
+    try:
+        runner_dir = await asyncio.to_thread(setup_playwright_runner_dir)
+    except Exception as e:
+        return failed_batch(f"Failed to set up Playwright runner: {str(e)}")
+
+    npx_path = find_executable("npx")
+    if not npx_path:
+        return failed_batch("npx not found in PATH. Install Node.js from https://nodejs.org/")
+
+    # Each batch gets its own directory so concurrent batches never see each other's specs
+    batch_dir = os.path.join(runner_dir, "batches", batch_id)
+    os.makedirs(batch_dir, exist_ok=True)
+    spec_files = {}
+    for index, (filename, code) in enumerate(tests):
+        name = _batch_filename(index, filename)
+        with open(os.path.join(batch_dir, name), "w", encoding="utf-8") as f:
+            f.write(normalize_spec(code))
+        spec_files[name] = filename
+
+    # Never ask for more browsers than the shared budget allows
+    workers = max(1, min(len(tests), BATCH_WORKERS, run_limiter.capacity))
+    timeout = BATCH_TIMEOUT_PER_WAVE * math.ceil(len(tests) / workers)
+    report_path = os.path.join(batch_dir, "report.json")
+    # Run from the batch directory so Playwright discovers only this batch's specs
+    cmd = [npx_path, "playwright", "test", f"--workers={workers}", "--reporter=line,json",
+           f"--config={os.path.join(runner_dir, RUNNER_CONFIG_NAME)}",
+           f"--output={os.path.join(batch_dir, 'test-results')}"]
+    print(f"[Playwright Runner] Batch {batch_id}: {len(tests)} specs on {workers} workers")
+
+    start_time = time.time()
+    try:
+        async with run_limiter.slots(workers):
+            start_time = time.time()
+            progress.emit("playwright.batch_started", batchId=batch_id, specs=len(tests), workers=workers)
+            result = await run_command(
+                cmd,
+                cwd=batch_dir,
+                timeout=timeout,
+                env={"PLAYWRIGHT_JSON_OUTPUT_NAME": report_path},
+                on_line=_emit_output,
+                stage="playwright_batch"
+            )
+        duration_ms = int((time.time() - start_time) * 1000)
+
+        report = parse_report_file(report_path) if os.path.exists(report_path) else None
+
+        spec_reports = {name: for_file(report, name) if report else None for name in spec_files}
+        screenshots = await asyncio.to_thread(
+            lambda: {name: store_report_artifacts(artifact_store, r) for name, r in spec_reports.items()}
+        )
+
+        results = []
+        for name, filename in spec_files.items():
+            spec_report = spec_reports[name]
+            if spec_report is None or spec_report["errors"] or not spec_report["tests"]:
+                status = "failed"
+            else:
+                status = "failed" if spec_report["summary"]["failed"] else "passed"
+            stderr = "\n\n".join(e["message"] for e in spec_report["errors"]) if spec_report else ""
+            if not (spec_report and spec_report["tests"]) and not stderr:
+                stderr = "No results for this spec in the Playwright report"
+            results.append({
+                "filename": filename,
+                "status": status,
+                "stdout": render(spec_report) if spec_report else "",
+                "stderr": stderr,
+                "durationMs": spec_report["summary"]["durationMs"] if spec_report else 0,
+                "screenshotUrl": screenshots[name],
+                "report": spec_report
+            })
+
+        status = "passed" if result.returncode == 0 and all(r["status"] == "passed" for r in results) else "failed"
+        print(f"[Playwright Runner] Batch {batch_id}: {status} in {duration_ms}ms "
+              f"({sum(r['status'] == 'passed' for r in results)}/{len(results)} specs passed)")
+        metrics.playwright_runs.inc(runner="batch", status=status)
+        progress.emit("playwright.batch_finished", batchId=batch_id, status=status, durationMs=duration_ms)
+        return {
+            "batchId": batch_id,
+            "status": status,
+            "workers": workers,
+            "durationMs": duration_ms,
+            "stderr": result.stderr or "",
+            "results": results
+        }
+
+    except subprocess.TimeoutExpired:
+        duration_ms = int((time.time() - start_time) * 1000)
+        metrics.playwright_runs.inc(runner="batch", status="timedOut")
+        progress.emit("playwright.batch_finished", batchId=batch_id, status="failed", durationMs=duration_ms,
+                      timedOut=True)
+        batch = failed_batch(f"Batch execution timed out after {duration_ms}ms")
+        batch.update(workers=workers, durationMs=duration_ms)
+        return batch
+
+    except Exception as e:
+        batch = failed_batch(f"Error running batch: {str(e)}")
+        batch.update(workers=workers, durationMs=int((time.time() - start_time) * 1000))
+        return batch
+
+    finally:
+        shutil.rmtree(batch_dir, ignore_errors=True)
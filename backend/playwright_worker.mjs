@@ -0,0 +1,258 @@
+// Long-lived Playwright worker used by playwright_pool.py.
+//
+// Keeps one Chromium instance warm and runs spec files on request, so a
+// test run does not pay for Node startup, config resolution and browser
+// launch. The file is copied into the runner directory so that
+// '@playwright/test' resolves from its node_modules.
+//
+// Protocol: newline-delimited JSON. Requests arrive on stdin; responses are
+// written to stdout prefixed with "@@patchpilot ". Any other stdout output
+// is ignored by the pool.
+//
+//   {"id": "...", "type": "ping"}                          -> {"id", "type": "pong", "connected"}
+//   {"id": "...", "type": "run", "spec": "/abs/x.spec.ts",
+//    "timeoutMs": 60000, "testTimeoutMs": 30000, "artifactsDir": "/abs/dir",
+//    "capture": {"screenshot", "trace", "video"}}          -> {"id", "type": "result", "status", "tests", ...}
+//
+// testTimeoutMs applies to each test and each beforeAll hook, like the
+// config's `timeout` under npx (30 s when omitted, Playwright's default);
+// timeoutMs only caps the whole spec.
+// capture takes Playwright's `use` modes (on, off, only-on-failure,
+// retain-on-failure); captured files are listed in each test's attachments.
+//   {"type": "shutdown"}
+//
+// A spec that cannot be loaded as plain JavaScript (TypeScript-only syntax),
+// or that uses Playwright Test features the shim below does not implement,
+// is reported with status "unsupported" and the pool falls back to
+// `npx playwright test`.
+import { createInterface } from 'node:readline';
+import { readFile, writeFile, unlink } from 'node:fs/promises';
+import { pathToFileURL } from 'node:url';
+import path from 'node:path';
+import { chromium, expect } from '@playwright/test';
+
+const PREFIX = '@@patchpilot ';
+const DEFAULT_TEST_TIMEOUT_MS = 30000;
+const send = (message) => process.stdout.write(PREFIX + JSON.stringify(message) + '\n');
+
+// Specs may log; keep stdout for the protocol
+console.log = console.info = console.debug = (...args) => console.error(...args);
+
+const SHIM_PATH = path.join(process.cwd(), '.patchpilot-shim.mjs');
+await writeFile(
+  SHIM_PATH,
+  'export const test = globalThis.__patchpilot.test;\n' +
+  'export const expect = globalThis.__patchpilot.expect;\n' +
+  'export default globalThis.__patchpilot.test;\n'
+);
+
+const browser = await chromium.launch();
+
+// The shim covers plain tests, describe blocks, file-level hooks and
+// test.step. A spec using anything else is answered with "unsupported" and
+// runs under `npx playwright test` instead, so the worker never reports a
+// result the real runner would not. Calls made inside test bodies can only
+// be found in the source; the rest are caught while the spec registers.
+const UNSUPPORTED_SOURCE = [
+  /\.\s*(?:fail|fixme|slow|only|use|extend|setTimeout|configure)\s*\(/,  // modifiers, fixtures, options
+  /(?<!console)\.\s*info\s*\(/,                                         // test.info()
+  /\.\s*skip\s*\(\s*(?!['"`])/,                                         // conditional test.skip(cond)
+  /\.\s*serial\b/,                                                     // describe.serial stops at a failure
+];
+const unsupportedSource = (source) => {
+  for (const pattern of UNSUPPORTED_SOURCE) {
+    const match = pattern.exec(source);
+    if (match) return `Spec uses ${match[0].replace(/\s+/g, '')}`;
+  }
+  return null;
+};
+
+// The shim module is evaluated once, so `test` is built once and writes to
+// whichever registry belongs to the spec currently being loaded
+let registry = null;
+const newRegistry = () => ({
+  tests: [],
+  hooks: { beforeAll: [], beforeEach: [], afterEach: [], afterAll: [] },
+  prefix: [],
+  skipped: 0,
+  unsupported: null,
+});
+const fullTitle = (title) => [...registry.prefix, title].join(' › ');
+const unsupported = (what) => { registry.unsupported ??= `Spec uses ${what}`; };
+
+const register = (title, fn, skip) => {
+  // test(title, details, fn) and testInfo (a second parameter) are not shimmed
+  if (typeof fn !== 'function') return unsupported('test() with details');
+  if (fn.length > 1) return unsupported('testInfo');
+  registry.tests.push({ title: fullTitle(title), fn, skip: skip || registry.skipped > 0 });
+};
+const describe = (title, fn, skip = false) => {
+  if (typeof fn !== 'function') return unsupported('describe() with details');
+  registry.prefix.push(title);
+  registry.skipped += skip ? 1 : 0;
+  try { fn(); } finally {
+    registry.prefix.pop();
+    registry.skipped -= skip ? 1 : 0;
+  }
+};
+
+const test = (title, fn) => register(title, fn, false);
+test.skip = (title, fn) => register(title, fn, true);
+for (const name of ['only', 'fail', 'fixme', 'slow', 'use', 'extend', 'setTimeout', 'info']) {
+  test[name] = () => unsupported(`test.${name}()`);
+}
+test.describe = (title, fn) => describe(title, fn);
+test.describe.parallel = test.describe;
+test.describe.skip = (title, fn) => describe(title, fn, true);
+for (const name of ['only', 'serial', 'fixme', 'configure']) {
+  test.describe[name] = () => unsupported(`test.describe.${name}()`);
+}
+for (const name of ['beforeAll', 'beforeEach', 'afterEach', 'afterAll']) {
+  test[name] = (fn) => {
+    // Hooks here apply to the whole file; scoped ones need the real runner
+    if (registry.prefix.length > 0) return unsupported(`${name} inside describe`);
+    if (typeof fn !== 'function' || fn.length > 1) return unsupported(`${name} with a title or testInfo`);
+    registry.hooks[name].push(fn);
+  };
+}
+test.step = async (_title, fn) => fn();
+test.expect = expect;
+globalThis.__patchpilot = { test, expect };
+
+function withTimeout(promise, ms) {
+  let timer;
+  const timeout = new Promise((_, reject) => {
+    timer = setTimeout(() => reject(Object.assign(new Error(`Test timeout of ${ms}ms exceeded.`), { name: 'TimeoutError' })), ms);
+  });
+  return Promise.race([promise, timeout]).finally(() => clearTimeout(timer));
+}
+
+function errorInfo(error, specPath) {
+  const info = { message: String(error && error.message || error), stack: error && error.stack };
+  // The loaded module keeps the spec's line numbers, so its stack frame points into the spec
+  const frame = specPath && info.stack && /\.worker\.mjs(?:\?run=\d+)?:(\d+):(\d+)/.exec(info.stack);
+  if (frame) info.location = { file: specPath, line: Number(frame[1]), column: Number(frame[2]) };
+  return info;
+}
+
+const keep = (mode, failed) => mode === 'on' || (mode && mode !== 'off' && failed);
+
+async function runSpec(specPath, timeoutMs, testTimeoutMs, artifactsDir, capture = {}) {
+  const started = Date.now();
+  // A test gets its own timeout, but never more than what is left of the run
+  const budget = () => Math.min(testTimeoutMs, Math.max(1000, timeoutMs - (Date.now() - started)));
+  registry = newRegistry();
+
+  // Point '@playwright/test' imports at the shim and load the spec as ESM
+  const source = await readFile(specPath, 'utf8');
+  const reason = unsupportedSource(source);
+  if (reason) return { status: 'unsupported', reason };
+  const rewritten = source.replace(/(['"])@playwright\/test\1/g, JSON.stringify(pathToFileURL(SHIM_PATH).href));
+  const modulePath = `${specPath}.worker.mjs`;
+  await writeFile(modulePath, rewritten);
+  try {
+    await import(`${pathToFileURL(modulePath).href}?run=${Date.now()}`);
+  } catch (error) {
+    // TypeScript-only syntax, or an API the shim lacks; the real runner
+    // also reports genuine load errors properly
+    return { status: 'unsupported', reason: error.message };
+  } finally {
+    await unlink(modulePath).catch(() => {});
+  }
+  if (registry.unsupported) return { status: 'unsupported', reason: registry.unsupported };
+  if (registry.tests.length === 0) return { status: 'unsupported', reason: 'No tests registered' };
+
+  const { hooks } = registry;
+  const fixtures = { browser, browserName: 'chromium' };
+  for (const hook of hooks.beforeAll) await withTimeout(Promise.resolve(hook(fixtures)), budget());
+
+  const results = [];
+  for (const spec of registry.tests) {
+    if (spec.skip) {
+      results.push({ title: spec.title, status: 'skipped', durationMs: 0, error: null });
+      continue;
+    }
+    const testDir = path.join(artifactsDir || path.dirname(specPath), `test-${results.length}`);
+    const recordVideo = artifactsDir && capture.video && capture.video !== 'off';
+    const context = await browser.newContext(recordVideo ? { recordVideo: { dir: testDir } } : {});
+    const tracing = artifactsDir && capture.trace && capture.trace !== 'off';
+    if (tracing) await context.tracing.start({ screenshots: true, snapshots: true });
+    const page = await context.newPage();
+    const attachments = [];
+    const testFixtures = { ...fixtures, context, page, request: context.request };
+    const testStarted = Date.now();
+    let status = 'passed';
+    let error = null;
+    try {
+      await withTimeout((async () => {
+        for (const hook of hooks.beforeEach) await hook(testFixtures);
+        await spec.fn(testFixtures);
+      })(), budget());
+    } catch (e) {
+      status = e && e.name === 'TimeoutError' ? 'timedOut' : 'failed';
+      error = errorInfo(e, specPath);
+    } finally {
+      for (const hook of hooks.afterEach) {
+        try { await hook(testFixtures); } catch {}
+      }
+      const failed = status !== 'passed';
+      // The page may be wedged after a timeout, so capture is best effort
+      if (artifactsDir && keep(capture.screenshot, failed)) {
+        const file = path.join(testDir, 'test-failed-1.png');
+        await withTimeout(page.screenshot({ path: file }), 5000)
+          .then(() => attachments.push({ name: 'screenshot', contentType: 'image/png', path: file }))
+          .catch(() => {});
+      }
+      if (tracing) {
+        const file = path.join(testDir, 'trace.zip');
+        const keepTrace = keep(capture.trace, failed);
+        await withTimeout(context.tracing.stop(keepTrace ? { path: file } : {}), 10000)
+          .then(() => keepTrace && attachments.push({ name: 'trace', contentType: 'application/zip', path: file }))
+          .catch(() => {});
+      }
+      const video = recordVideo ? page.video() : null;
+      await context.close().catch(() => {});
+      if (video) {
+        if (keep(capture.video, failed)) {
+          await video.path()
+            .then((file) => attachments.push({ name: 'video', contentType: 'video/webm', path: file }))
+            .catch(() => {});
+        } else {
+          await video.delete().catch(() => {});
+        }
+      }
+    }
+    results.push({ title: spec.title, status, durationMs: Date.now() - testStarted, error, attachments });
+  }
+  for (const hook of hooks.afterAll) await hook(fixtures);
+
+  const failed = results.some((r) => r.status === 'failed' || r.status === 'timedOut');
+  return { status: failed ? 'failed' : 'passed', tests: results, durationMs: Date.now() - started };
+}
+
+send({ type: 'ready', pid: process.pid });
+
+const lines = createInterface({ input: process.stdin });
+for await (const line of lines) {
+  let message;
+  try {
+    message = JSON.parse(line);
+  } catch {
+    continue;
+  }
+  if (message.type === 'shutdown') break;
+  if (message.type === 'ping') {
+    send({ id: message.id, type: 'pong', connected: browser.isConnected() });
+  } else if (message.type === 'run') {
+    try {
+      const result = await runSpec(message.spec, message.timeoutMs ?? 60000,
+        message.testTimeoutMs ?? DEFAULT_TEST_TIMEOUT_MS, message.artifactsDir, message.capture);
+      send({ id: message.id, type: 'result', ...result });
+    } catch (error) {
+      send({ id: message.id, type: 'result', status: 'failed', tests: [], error: errorInfo(error) });
+    }
+  }
+}
+
+await browser.close();
+process.exit(0);
@@ -0,0 +1,118 @@
+import asyncio
+import contextvars
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import AsyncIterator, Optional
+
+# Closed channels are kept around so late subscribers can still replay them;
+# beyond MAX_CHANNELS the oldest closed ones go (open channels are never dropped)
+MAX_CHANNELS = 256
+KEEPALIVE_SECONDS = 15
+
+_current: contextvars.ContextVar = contextvars.ContextVar("progress_channel", default=None)
+_channels: "OrderedDict[str, ProgressChannel]" = OrderedDict()
+
+
+class ProgressChannel:
+    """
+    Ordered progress events for one job.
+
+    Every event is kept in history, so a subscriber that connects late
+    replays what it missed before receiving live events.
+    """
+
+    def __init__(self, channel_id: str):
+        self.id = channel_id
+        self.history = []
+        self.closed = False
+        self._subscribers = set()
+
+    def publish(self, event: str, data: dict):
+        record = {"id": len(self.history), "event": event, "data": data, "ts": time.time()}
+        self.history.append(record)
+        for queue in self._subscribers:
+            queue.put_nowait(record)
+
+    def close(self):
+        self.closed = True
+        for queue in self._subscribers:
+            queue.put_nowait(None)
+
+    async def subscribe(self, timeout: float = KEEPALIVE_SECONDS) -> AsyncIterator[Optional[dict]]:
+        """Yield past and live events; yields None after timeout seconds of silence."""
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.add(queue)
+        try:
+            # The snapshot is taken in the same step as subscribing, so events
+            # are either replayed here or delivered through the queue, never both
+            for record in list(self.history):
+                yield record
+            if self.closed:
+                return
+            while True:
+                try:
+                    record = await asyncio.wait_for(queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+                if record is None:
+                    return
+                yield record
+        finally:
+            self._subscribers.discard(queue)
+
+
+def open_channel(channel_id: str) -> ProgressChannel:
+    channel = _channels.get(channel_id)
+    if channel is None:
+        channel = ProgressChannel(channel_id)
+        _channels[channel_id] = channel
+        _evict()
+    return channel
+
+
+def _evict():
+    """
+    Drop the oldest finished channels beyond MAX_CHANNELS. Open channels
+    stay: a job's worker and its subscribers must keep finding the same one,
+    even when the job waited in the queue while many others ran.
+    """
+    excess = len(_channels) - MAX_CHANNELS
+    if excess <= 0:
+        return
+    for channel_id in [c.id for c in _channels.values() if c.closed and not c._subscribers][:excess]:
+        del _channels[channel_id]
+
+
+def get_channel(channel_id: str) -> Optional[ProgressChannel]:
+    return _channels.get(channel_id)
+
+
+@contextmanager
+def bind(channel: ProgressChannel):
+    """Route emit() calls in this context (and tasks it spawns) to channel."""
+    token = _current.set(channel)
+    try:
+        yield channel
+    finally:
+        _current.reset(token)
+
+
+def emit(event: str, **data):
+    """Publish a progress event to the bound channel; no-op outside a job."""
+    channel = _current.get()
+    if channel is not None:
+        channel.publish(event, data)
+
+
+def streaming() -> bool:
+    """True when someone may be listening, so producers can opt into incremental work."""
+    return _current.get() is not None
+
+
+def format_sse(record: Optional[dict]) -> str:
+    if record is None:
+        return ": keepalive\n\n"
+    return f"id: {record['id']}\nevent: {record['event']}\ndata: {json.dumps(record['data'])}\n\n"
@@ -0,0 +1,205 @@
+import json
+import os
+import re
+from typing import Iterator, List, Optional, Tuple
+
+# Playwright colours messages and snippets even in JSON output
+_ANSI = re.compile(r"\x1b\[[0-9;]*[A-Za-z]")
+
+MAX_MESSAGE_CHARS = 2000
+MAX_SNIPPET_CHARS = 1200
+# Budget for the failure text sent to the patch prompt
+MAX_EXCERPT_CHARS = int(os.getenv("PATCH_FAILURE_EXCERPT_CHARS", "6000"))
+
+FAILED_STATUSES = ("failed", "timedOut", "interrupted")
+
+
+def _clean(text: Optional[str], limit: int) -> Optional[str]:
+    if not text:
+        return None
+    text = _ANSI.sub("", text).strip()
+    if len(text) > limit:
+        text = text[:limit] + f"\n... ({len(text) - limit} more characters)"
+    return text
+
+
+def _error(error: Optional[dict]) -> Optional[dict]:
+    if not error:
+        return None
+    location = error.get("location")
+    return {
+        "message": _clean(error.get("message") or error.get("value"), MAX_MESSAGE_CHARS) or "Unknown error",
+        "location": {k: location.get(k) for k in ("file", "line", "column")} if location else None,
+        "snippet": _clean(error.get("snippet"), MAX_SNIPPET_CHARS),
+    }
+
+
+def _failing_step(steps: Optional[List[dict]]) -> Optional[str]:
+    """Title path of the innermost step that reported an error."""
+    for step in steps or []:
+        if step.get("error"):
+            inner = _failing_step(step.get("steps"))
+            return f"{step.get('title')} › {inner}" if inner else step.get("title")
+    return None
+
+
+def _specs(report: dict) -> Iterator[Tuple[Tuple[str, ...], dict]]:
+    """Yield (describe titles, spec) for every spec in a JSON report."""
+    def walk(suites, titles):
+        for suite in suites or []:
+            path = titles + (suite["title"],) if suite.get("title") else titles
+            for spec in suite.get("specs", []):
+                yield path, spec
+            yield from walk(suite.get("suites"), path)
+
+    # Top-level suites are files; their title is the path, not a describe block
+    for file_suite in report.get("suites") or []:
+        for spec in file_suite.get("specs", []):
+            yield (), spec
+        yield from walk(file_suite.get("suites"), ())
+
+
+def _summary(tests: List[dict], duration_ms: float) -> dict:
+    return {
+        "total": len(tests),
+        "passed": sum(t["status"] == "passed" for t in tests),
+        "failed": sum(t["status"] in FAILED_STATUSES for t in tests),
+        "skipped": sum(t["status"] == "skipped" for t in tests),
+        "flaky": sum(t["flaky"] for t in tests),
+        "durationMs": int(duration_ms),
+    }
+
+
+def summarize(report: dict) -> dict:
+    """
+    Compact view of a Playwright JSON report.
+
+    Keeps per-test status, timing, failing step, file attachments and the
+    first error (message, location, snippet) with ANSI codes stripped and
+    long text truncated. Inline attachments, stdout/stderr captures and full
+    stacks are dropped.
+    """
+    tests = []
+    for titles, spec in _specs(report):
+        for test in spec.get("tests", []):
+            results = test.get("results") or [{}]
+            last = results[-1]
+            status = last.get("status") or ("skipped" if test.get("status") == "skipped" else "failed")
+            tests.append({
+                "title": " › ".join(titles + (spec.get("title", ""),)),
+                "file": spec.get("file"),
+                "line": spec.get("line"),
+                "status": status,
+                "flaky": len(results) > 1 and status == "passed",
+                "retries": len(results) - 1,
+                "durationMs": sum(r.get("duration", 0) for r in results),
+                "failingStep": _failing_step(last.get("steps")) if status in FAILED_STATUSES else None,
+                "error": _error(last.get("error") or next(iter(last.get("errors") or []), None)),
+                # Files only; inline bodies (console output) are dropped
+                "attachments": [
+                    {"name": a.get("name"), "contentType": a.get("contentType"), "path": a["path"]}
+                    for a in last.get("attachments") or [] if a.get("path")
+                ],
+            })
+
+    duration_ms = (report.get("stats") or {}).get("duration") or sum(t["durationMs"] for t in tests)
+    return {
+        "summary": _summary(tests, duration_ms),
+        "tests": tests,
+        # Errors outside any test: syntax errors, bad imports, config problems
+        "errors": [_error(e) for e in report.get("errors") or []],
+    }
+
+
+def parse_report_file(path: str) -> Optional[dict]:
+    """Summarize a JSON report file, decoding it straight from disk; None if missing or invalid."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return summarize(json.load(f))
+    except (OSError, ValueError) as e:
+        print(f"[Run Report] Could not parse {path}: {e}")
+        return None
+
+
+def for_file(report: dict, filename: str) -> dict:
+    """The part of a summarized report that belongs to one spec file (matched by basename)."""
+    def matches(path):
+        return bool(path) and os.path.basename(path) == filename
+
+    tests = [t for t in report["tests"] if matches(t["file"])]
+    return {
+        "summary": _summary(tests, sum(t["durationMs"] for t in tests)),
+        "tests": tests,
+        "errors": [e for e in report["errors"] if e["location"] and matches(e["location"]["file"])],
+    }
+
+
+def _location(test: dict) -> str:
+    error = test.get("error") or {}
+    location = error.get("location") or {"file": test.get("file"), "line": test.get("line")}
+    if not location.get("file"):
+        return ""
+    parts = [os.path.basename(location["file"]), location.get("line"), location.get("column")]
+    return ":".join(str(p) for p in parts if p is not None)
+
+
+def render(report: dict) -> str:
+    """One line per test, like Playwright's list reporter."""
+    marks = {"passed": "✓", "skipped": "-"}
+    lines = [
+        f"{marks.get(t['status'], '✘')} {t['title']} ({t['durationMs']}ms)"
+        + (" [flaky]" if t["flaky"] else "")
+        + ("" if t["status"] in marks else f" [{t['status']}]")
+        for t in report["tests"]
+    ]
+    summary = report["summary"]
+    lines.append(f"{summary['passed']} passed, {summary['failed']} failed, {summary['skipped']} skipped "
+                 f"({summary['durationMs']}ms)")
+    return "\n".join(lines)
+
+
+def clip_log(text: str, max_chars: int = MAX_EXCERPT_CHARS) -> str:
+    """Head and tail of a raw log; the middle of long output is rarely the failure."""
+    text = _ANSI.sub("", text or "")
+    if len(text) <= max_chars:
+        return text
+    head = max_chars // 3
+    tail = max_chars - head
+    return f"{text[:head]}\n... ({len(text) - max_chars} characters omitted) ...\n{text[-tail:]}"
+
+
+def failure_excerpt(report: dict, max_chars: int = MAX_EXCERPT_CHARS) -> str:
+    """
+    The failures only, for the patch prompt: test, location, failing step,
+    error message and code snippet. Passing tests are left out.
+    """
+    blocks = []
+    for error in report.get("errors") or []:
+        block = f"Error loading tests: {error['message']}"
+        if error.get("snippet"):
+            block += f"\n{error['snippet']}"
+        blocks.append(block)
+    tests = report.get("tests") or []
+    for test in tests:
+        if test.get("status") not in FAILED_STATUSES:
+            continue
+        lines = [f"✘ {test.get('title')} [{test['status']}] ({test.get('durationMs', 0)}ms)"]
+        location = _location(test)
+        if location:
+            lines.append(f"  at {location}")
+        if test.get("failingStep"):
+            lines.append(f"  step: {test['failingStep']}")
+        if test.get("error"):
+            lines.append(test["error"]["message"])
+            if test["error"].get("snippet"):
+                lines.append(test["error"]["snippet"])
+        blocks.append("\n".join(lines))
+
+    if not blocks:
+        return ""
+    failed = sum(t.get("status") in FAILED_STATUSES for t in tests)
+    header = f"{failed} of {len(tests)} tests failed\n\n"
+    excerpt = header + "\n\n".join(blocks)
+    if len(excerpt) > max_chars:
+        excerpt = excerpt[:max_chars] + f"\n... (truncated, {len(excerpt) - max_chars} more characters)"
+    return excerpt
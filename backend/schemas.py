@@ -17,6 +17,9 @@ class TestResponse(BaseModel):
     filename: str
     playwrightSpec: str
 
+class BatchRunRequest(BaseModel):
+    tests: List[TestResponse]
+
 class PatchRequest(BaseModel):
     analysis: Optional[AnalysisResponse] = None
     error_log: str
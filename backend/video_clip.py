@@ -0,0 +1,188 @@
+import math
+import os
+import shutil
+import tempfile
+from typing import Optional, Tuple
+
+import ffmpeg
+import numpy as np
+
+from video_utils import (CHANGE_THRESHOLD, DETECT_WIDTH, PIXEL_DELTA, TOKEN_BUDGET, TOKENS_PER_TILE, _decode_luma,
+                         _open_reader, change_scores)
+
+# Analysis mode: "frames" sends sampled JPEG frames (extract_frames), "video"
+# sends one transcoded clip so the model sees real timing. ANALYSIS_MODE
+# picks one for every request, or "auto" (default) decides per recording:
+# video when ffmpeg is installed, the recording is at most
+# VIDEO_MODE_MAX_SECONDS long and VIDEO_MODE_MAX_MB large, and the clip's
+# token estimate fits FRAME_TOKEN_BUDGET; frames otherwise.
+ANALYSIS_MODES = ("auto", "frames", "video")
+ANALYSIS_MODE = os.getenv("ANALYSIS_MODE", "auto")
+VIDEO_MAX_SECONDS = float(os.getenv("VIDEO_MODE_MAX_SECONDS", "30"))
+VIDEO_MAX_BYTES = int(float(os.getenv("VIDEO_MODE_MAX_MB", "50")) * 1024 * 1024)
+
+# Clip encoding: Gemini samples video at the clip's frame rate (passed as
+# video metadata) and tokenizes each sampled frame like one image tile, so
+# frames beyond that rate would only add bytes. Audio is dropped; screen
+# recordings rarely have any that matters.
+#
+# The rate follows the recording: scan_states reads it at twice
+# CLIP_MAX_FPS for the shortest UI state (a stable screen between two
+# changes), and the clip is sampled fast enough to show that state at least
+# once, between CLIP_FPS and CLIP_MAX_FPS. A faster clip costs more tokens,
+# so in auto mode recordings with brief states fall back to frames sooner.
+# A screen held for a single scan sample counts as part of a transition.
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+CLIP_FPS = float(os.getenv("CLIP_FPS", "1"))
+CLIP_MAX_FPS = max(CLIP_FPS, float(os.getenv("CLIP_MAX_FPS", "4")))
+STATE_SCAN_FPS = 2 * CLIP_MAX_FPS
+CLIP_MAX_WIDTH = int(os.getenv("CLIP_MAX_WIDTH", "1280"))
+CLIP_CRF = int(os.getenv("CLIP_CRF", "30"))
+CLIP_PRESET = "veryfast"
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG_BINARY) is not None
+
+
+def _shortest_state(vr, fps: float) -> Optional[float]:
+    """
+    Seconds of the briefest stable screen between two changes, from luma
+    sampled at STATE_SCAN_FPS; None when no screen sits between two changes.
+    """
+    step = max(1, round(fps / STATE_SCAN_FPS))
+    luma = _decode_luma(vr, range(0, len(vr), step))
+    changed = np.flatnonzero(change_scores(luma) > CHANGE_THRESHOLD)
+    # Changes at samples i < j bound a screen of j - i samples
+    gaps = np.diff(changed)
+    states = gaps[gaps > 1]
+    if len(states) == 0:
+        return None
+    return round(float(states.min()) * step / fps, 3)
+
+
+def probe_recording(video_path: str) -> dict:
+    """
+    Duration, size and resolution of a stored recording; only the first
+    frame is decoded. shortestStateSeconds stays None until scan_states fills it.
+    """
+    vr = _open_reader(video_path)
+    fps = vr.get_avg_fps() or 30.0
+    height, width = vr[0].shape[:2] if len(vr) else (0, 0)
+    return {
+        "durationSeconds": round(len(vr) / fps, 2),
+        "bytes": os.path.getsize(video_path),
+        "width": int(width),
+        "height": int(height),
+        "shortestStateSeconds": None,
+    }
+
+
+def needs_state_scan(info: dict, requested: Optional[str] = None) -> bool:
+    """Whether the shortest-UI-state scan can change the clip for this recording."""
+    mode = requested or ANALYSIS_MODE
+    if mode == "frames" or not ffmpeg_available() or info["durationSeconds"] > VIDEO_MAX_SECONDS:
+        return False
+    return mode == "video" or info["bytes"] <= VIDEO_MAX_BYTES
+
+
+def scan_states(video_path: str) -> Optional[float]:
+    """
+    Shortest UI state of a recording in seconds (None when nothing stays on
+    screen between two changes). Decodes the whole recording, so it takes
+    seconds; callers cache it (state_scan_params).
+    """
+    vr = _open_reader(video_path)
+    if len(vr) < 2:
+        return None
+    return _shortest_state(vr, vr.get_avg_fps() or 30.0)
+
+
+def state_scan_params() -> dict:
+    """Every setting that influences scan_states (part of its cache key)."""
+    return {
+        "scan_fps": STATE_SCAN_FPS,
+        "detect_width": DETECT_WIDTH,
+        "pixel_delta": PIXEL_DELTA,
+        "change_threshold": CHANGE_THRESHOLD,
+    }
+
+
+def clip_fps(info: dict) -> float:
+    """Sampling rate for the recording's clip: fast enough for its shortest UI state."""
+    shortest = info.get("shortestStateSeconds")
+    if not shortest:
+        return CLIP_FPS
+    return min(CLIP_MAX_FPS, max(CLIP_FPS, float(math.ceil(1 / shortest))))
+
+
+def clip_tokens(duration_seconds: float, fps: float = CLIP_FPS) -> int:
+    """Gemini's input token estimate for a clip sampled at fps."""
+    return max(1, round(duration_seconds * fps)) * TOKENS_PER_TILE
+
+
+def choose_mode(info: dict, requested: Optional[str] = None) -> Tuple[str, str]:
+    """(mode, reason) for one recording; requested overrides ANALYSIS_MODE."""
+    mode = requested or ANALYSIS_MODE
+    if mode == "frames":
+        return "frames", "requested"
+    if not ffmpeg_available():
+        if mode == "video":
+            raise RuntimeError(f"Video mode needs ffmpeg, but {FFMPEG_BINARY!r} is not on PATH")
+        return "frames", "ffmpeg not installed"
+    if mode == "video":
+        return "video", "requested"
+    if info["durationSeconds"] > VIDEO_MAX_SECONDS:
+        return "frames", f"longer than {VIDEO_MAX_SECONDS:g}s"
+    if info["bytes"] > VIDEO_MAX_BYTES:
+        return "frames", f"larger than {VIDEO_MAX_BYTES // (1024 * 1024)} MB"
+    fps = clip_fps(info)
+    if clip_tokens(info["durationSeconds"], fps) > TOKEN_BUDGET:
+        return "frames", f"clip at {fps:g} fps would exceed {TOKEN_BUDGET} tokens"
+    return "video", f"short recording, {fps:g} fps"
+
+
+def clip_params(fps: float = CLIP_FPS) -> dict:
+    """Every setting that influences the transcoded clip (part of the analysis cache key)."""
+    return {
+        "mode": "video",
+        "fps": fps,
+        "max_width": CLIP_MAX_WIDTH,
+        "crf": CLIP_CRF,
+        "preset": CLIP_PRESET,
+    }
+
+
+def transcode_clip(video_path: str, info: Optional[dict] = None) -> bytes:
+    """
+    Re-encode a recording as a small H.264 MP4: clip_fps(info) frames per
+    second, at most CLIP_MAX_WIDTH wide, no audio. Returns the file's bytes; the
+    temporary output is removed before returning.
+
+    Raises ffmpeg.Error (with ffmpeg's stderr) when transcoding fails.
+    """
+    info = info or probe_recording(video_path)
+    fps = clip_fps(info)
+    stream = ffmpeg.input(video_path).filter("fps", fps=fps)
+    if info["width"] > CLIP_MAX_WIDTH:
+        # -2 keeps the aspect ratio with an even height, which yuv420p needs
+        stream = stream.filter("scale", CLIP_MAX_WIDTH, -2)
+
+    fd, output_path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    try:
+        (
+            ffmpeg
+            .output(stream, output_path, vcodec="libx264", preset=CLIP_PRESET, crf=CLIP_CRF,
+                    pix_fmt="yuv420p", movflags="+faststart", an=None)
+            .overwrite_output()
+            .run(cmd=FFMPEG_BINARY, capture_stdout=True, capture_stderr=True)
+        )
+        with open(output_path, "rb") as f:
+            clip = f.read()
+    finally:
+        os.remove(output_path)
+
+    print(f"[Clip] {info['durationSeconds']}s {info['width']}x{info['height']} "
+          f"({info['bytes'] // 1024} KB) -> {len(clip) // 1024} KB at {fps:g} fps")
+    return clip
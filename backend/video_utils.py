@@ -1,73 +1,407 @@
-import cv2
+import math
 import os
+from typing import Optional, Tuple
+
+import cv2
 from decord import VideoReader, cpu, gpu
 import numpy as np
 
-def extract_frames(video_path: str, output_dir: str = "temp/frames", max_frames: int = 12):
-    os.makedirs(output_dir, exist_ok=True)
-    
+# Sampling engine tuning:
+# - the coarse grid decodes COARSE_FACTOR samples per frame of budget
+# - an interval between two grid samples that changed is bisected until it
+#   is at most REFINE_MIN_GAP frames wide
+# - frames are decoded through get_batch in chunks of DECODE_CHUNK to keep
+#   peak memory bounded on long, high-resolution recordings
+# - scene-change detection runs on luma downscaled to about DETECT_WIDTH
+#   pixels wide; a pixel counts as changed when its luma moves by more than
+#   PIXEL_DELTA, which ignores compression noise
+COARSE_FACTOR = 4
+REFINE_MIN_GAP = 2
+DECODE_CHUNK = 16
+DETECT_WIDTH = 160
+PIXEL_DELTA = 12
+CHANGE_THRESHOLD = 0.01  # fraction of pixels that must change
+
+# Adaptive budget (extract_frames without max_frames):
+# - frame count: one per detected change plus one per SECONDS_PER_FRAME of
+#   recording, between MIN_FRAMES and FRAME_MAX_FRAMES
+# - the coarse grid takes GRID_PER_SECOND samples per second (within the
+#   limits the frame count implies) so change density is known up front
+# - frames are downscaled until the set fits FRAME_TOKEN_BUDGET, using
+#   Gemini's image tokenization (258 tokens per 768x768 tile), but never
+#   below MIN_WIDTH; past that, frames are dropped. JPEG quality steps down
+#   until the set fits FRAME_BYTE_BUDGET_KB
+# - with FRAME_CROP on, frames after the first are cropped to the region
+#   that changed during the recording (plus CROP_MARGIN), unless that region
+#   covers more than CROP_MAX_AREA of the screen. The crop is at least
+#   CROP_MIN_SIZE of the screen per side; changed blobs smaller than
+#   CROP_MIN_COMPONENT (a blinking cursor) are ignored
+MIN_FRAMES = 6
+MAX_FRAMES = int(os.getenv("FRAME_MAX_FRAMES", "32"))
+SECONDS_PER_FRAME = 10
+GRID_PER_SECOND = 2
+TOKEN_BUDGET = int(os.getenv("FRAME_TOKEN_BUDGET", "8192"))
+BYTE_BUDGET = int(os.getenv("FRAME_BYTE_BUDGET_KB", "4096")) * 1024
+MAX_WIDTH = int(os.getenv("FRAME_MAX_WIDTH", "1280"))
+MIN_WIDTH = 640
+JPEG_QUALITY_STEPS = (85, 75, 65, 55)
+TILE_SIZE = 768
+TOKENS_PER_TILE = 258
+CROP_ENABLED = os.getenv("FRAME_CROP", "1") != "0"
+CROP_MAX_AREA = 0.6
+CROP_MARGIN = 0.05
+CROP_MIN_SIZE = 1 / 3
+CROP_MIN_COMPONENT = 0.001
+
+Box = Tuple[int, int, int, int]  # x0, y0, x1, y1
+
+
+def _open_reader(video_path: str) -> VideoReader:
     # Try GPU first, fallback to CPU
     try:
-        vr = VideoReader(video_path, ctx=gpu(0))
+        return VideoReader(video_path, ctx=gpu(0))
     except:
-        vr = VideoReader(video_path, ctx=cpu(0))
-    
+        return VideoReader(video_path, ctx=cpu(0))
+
+
+def _to_luma(batch: np.ndarray) -> np.ndarray:
+    """
+    Convert an (N, H, W, 3) RGB batch to downscaled (N, h, w) uint8 luma.
+    Downscaling is a block mean (INTER_AREA with an integer factor), done
+    before the colour conversion so only the small frames are converted.
+    """
+    n, height, width, _ = batch.shape
+    scale = max(1, width // DETECT_WIDTH)
+    h, w = height // scale, width // scale
+    luma = np.empty((n, h, w), dtype=np.uint8)
+    for i, frame in enumerate(batch):
+        small = cv2.resize(frame[:h * scale, :w * scale], (w, h), interpolation=cv2.INTER_AREA)
+        luma[i] = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY)
+    return luma
+
+
+def _decode_luma(vr: VideoReader, indices) -> np.ndarray:
+    """Decode frames with get_batch and return them as a downscaled luma tensor."""
+    indices = [int(i) for i in indices]
+    chunks = []
+    for start in range(0, len(indices), DECODE_CHUNK):
+        batch = vr.get_batch(indices[start:start + DECODE_CHUNK]).asnumpy()
+        chunks.append(_to_luma(batch))
+    return np.concatenate(chunks) if chunks else np.empty((0, 0, 0), dtype=np.uint8)
+
+
+def change_scores(luma: np.ndarray) -> np.ndarray:
+    """
+    Fraction of pixels that changed between each pair of consecutive frames.
+    Computed for the whole (N, h, w) tensor in one pass; returns N - 1 scores.
+    """
+    if len(luma) < 2:
+        return np.zeros(0, dtype=np.float32)
+    diffs = np.abs(np.diff(luma.astype(np.int16), axis=0)) > PIXEL_DELTA
+    return diffs.mean(axis=(1, 2), dtype=np.float32)
+
+
+def detect_scene_changes(luma: np.ndarray, k: int) -> np.ndarray:
+    """
+    Pick the top-k scene changes across the whole tensor.
+
+    Returns sorted transition positions: position i means the content changed
+    between frame i and frame i + 1. Changes below CHANGE_THRESHOLD are ignored.
+    """
+    scores = change_scores(luma)
+    candidates = np.flatnonzero(scores > CHANGE_THRESHOLD)
+    if k <= 0 or len(candidates) == 0:
+        return np.empty(0, dtype=int)
+    if len(candidates) > k:
+        top = np.argpartition(scores[candidates], -k)[-k:]
+        candidates = candidates[top]
+    return np.sort(candidates)
+
+
+def _has_changed(a: np.ndarray, b: np.ndarray) -> bool:
+    return change_scores(np.stack([a, b]))[0] > CHANGE_THRESHOLD
+
+
+def _coarse_grid(vr: VideoReader, total_frames: int, num: int) -> np.ndarray:
+    """
+    Evenly spaced sample indices, snapped to nearby keyframes.
+    Seeking to a keyframe avoids decoding the GOP leading up to the target.
+    """
+    grid = np.linspace(0, total_frames - 1, num=min(num, total_frames), dtype=int)
+    if len(grid) < 2:
+        return grid
+
+    try:
+        keys = np.asarray(vr.get_key_indices(), dtype=int)
+    except Exception:
+        keys = np.empty(0, dtype=int)
+
+    if len(keys) > 1:
+        half_step = max(1, (total_frames - 1) // (len(grid) - 1)) // 2
+        pos = np.clip(np.searchsorted(keys, grid), 1, len(keys) - 1)
+        left, right = keys[pos - 1], keys[pos]
+        nearest = np.where(grid - left <= right - grid, left, right)
+        grid = np.where(np.abs(nearest - grid) <= half_step, nearest, grid)
+        # Keep the recording boundaries exact
+        grid[0], grid[-1] = 0, total_frames - 1
+
+    return np.unique(grid)
+
+
+def _refine_changes(vr: VideoReader, intervals: list) -> list:
+    """
+    Bisect every (lo, hi] interval to locate the first frame after a content
+    change. Only log2(hi - lo) frames are decoded per interval instead of
+    the whole interval, and all intervals advance together so each level is
+    one sorted batch decode rather than a seek per midpoint.
+
+    intervals: [(lo, hi, lo_luma)] -> [hi] in the same order
+    """
+    state = [[lo, hi, lo_luma] for lo, hi, lo_luma in intervals]
+    while True:
+        active = [s for s in state if s[1] - s[0] > REFINE_MIN_GAP]
+        if not active:
+            return [s[1] for s in state]
+        mids = sorted({(s[0] + s[1]) // 2 for s in active})
+        lumas = dict(zip(mids, _decode_luma(vr, mids)))
+        for s in active:
+            mid = (s[0] + s[1]) // 2
+            if _has_changed(s[2], lumas[mid]):
+                s[1] = mid
+            else:
+                s[0], s[2] = mid, lumas[mid]
+
+
+def _scan(vr: VideoReader, total_frames: int, samples: int):
+    """Decode the coarse grid once: (grid indices, luma tensor, change scores)."""
+    grid = _coarse_grid(vr, total_frames, samples)
+    luma = _decode_luma(vr, grid)
+    return grid, luma, change_scores(luma)
+
+
+def _select(vr: VideoReader, grid: np.ndarray, luma: np.ndarray, max_frames: int) -> list:
     total_frames = len(vr)
-    
-    if total_frames == 0:
-        return []
+    # First frame: always capture
+    selected = {int(grid[0])}
+    intervals = [(int(grid[pos]), int(grid[pos + 1]), luma[pos])
+                 for pos in detect_scene_changes(luma, max_frames - 1)]
+    selected.update(_refine_changes(vr, intervals))
 
-    # Sample frames uniformly as baseline
+    # Uniform sampling fills whatever budget scene changes did not use
     uniform_indices = np.linspace(0, total_frames - 1, num=max_frames, dtype=int)
+    for idx in uniform_indices:
+        if len(selected) >= max_frames:
+            break
+        selected.add(int(idx))
+
+    return sorted(selected)
+
+
+def sample_frame_indices(vr: VideoReader, max_frames: int = 12) -> list:
+    """
+    Pick up to max_frames frame indices without decoding the whole recording.
+
+    A coarse grid is decoded first and the strongest scene changes across
+    the whole recording are kept, so late changes (often the bug itself) are
+    not crowded out by early ones. Only those intervals are refined to find
+    the frame where the UI changed. Remaining budget is filled with uniform
+    samples.
+    """
+    total_frames = len(vr)
+    if total_frames == 0 or max_frames <= 0:
+        return []
+    grid, luma, _ = _scan(vr, total_frames, max_frames * COARSE_FACTOR)
+    return _select(vr, grid, luma, max_frames)
+
+
+def frame_budget(duration_seconds: float, changes: int) -> int:
+    """Frames to send: one per change plus a few uniform ones for context."""
+    wanted = 1 + changes + math.ceil(duration_seconds / SECONDS_PER_FRAME)
+    return max(MIN_FRAMES, min(MAX_FRAMES, wanted))
+
+
+def image_tokens(width: int, height: int) -> int:
+    """Estimated Gemini input tokens for one image."""
+    if width <= 384 and height <= 384:
+        return TOKENS_PER_TILE
+    return TOKENS_PER_TILE * math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+
+
+def fit_token_budget(width: int, height: int, frames: int, crop: Optional[Box] = None,
+                     fixed_count: bool = False) -> Tuple[int, float]:
+    """
+    Fit the frame set (one full frame, the rest cropped when crop is set)
+    into TOKEN_BUDGET: downscale first, down to MIN_WIDTH, then drop frames
+    (not below MIN_FRAMES, and never when fixed_count). Returns (frames, scale).
+    """
+    crop_width, crop_height = (crop[2] - crop[0], crop[3] - crop[1]) if crop else (width, height)
+
+    def tokens(count, scale):
+        full = image_tokens(round(width * scale), round(height * scale))
+        return full + (count - 1) * image_tokens(round(crop_width * scale), round(crop_height * scale))
+
+    scale = min(1.0, MAX_WIDTH / width)
+    min_scale = min(scale, MIN_WIDTH / width)
+    while scale > min_scale and tokens(frames, scale) > TOKEN_BUDGET:
+        scale = max(min_scale, scale * 0.9)
+    while not fixed_count and frames > MIN_FRAMES and tokens(frames, scale) > TOKEN_BUDGET:
+        frames -= 1
+    return frames, scale
+
+
+def change_region(luma: np.ndarray, scores: np.ndarray, width: int, height: int) -> Optional[Box]:
+    """
+    Bounding box, in full-resolution pixels, of everything that changed
+    between coarse samples; None when cropping would not save much.
+    """
+    changed = scores > CHANGE_THRESHOLD
+    if not changed.any():
+        return None
+    deltas = np.abs(np.diff(luma.astype(np.int16), axis=0))[changed] > PIXEL_DELTA
+    mask = deltas.any(axis=0).astype(np.uint8)
+    count, _, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    min_area = max(1, int(mask.size * CROP_MIN_COMPONENT))
+    blobs = [stats[i] for i in range(1, count) if stats[i, cv2.CC_STAT_AREA] >= min_area]
+    if not blobs:
+        return None
+
+    # _to_luma downscales by an integer block size
+    block = max(1, width // DETECT_WIDTH)
+    x0 = min(b[cv2.CC_STAT_LEFT] for b in blobs) * block
+    y0 = min(b[cv2.CC_STAT_TOP] for b in blobs) * block
+    x1 = max(b[cv2.CC_STAT_LEFT] + b[cv2.CC_STAT_WIDTH] for b in blobs) * block
+    y1 = max(b[cv2.CC_STAT_TOP] + b[cv2.CC_STAT_HEIGHT] for b in blobs) * block
+
+    def span(lo, hi, size):
+        lo, hi = lo - int(size * CROP_MARGIN), hi + int(size * CROP_MARGIN)
+        short = int(size * CROP_MIN_SIZE) - (hi - lo)
+        if short > 0:
+            lo, hi = lo - short // 2, hi + short - short // 2
+        lo, hi = max(0, lo), min(size, hi)
+        return lo, hi
+
+    x0, x1 = span(int(x0), int(x1), width)
+    y0, y1 = span(int(y0), int(y1), height)
+    if (x1 - x0) * (y1 - y0) > CROP_MAX_AREA * width * height:
+        return None
+    return x0, y0, x1, y1
+
+
+def plan_extraction(vr: VideoReader, max_frames: Optional[int] = None) -> dict:
+    """
+    Decide which frames to send and how.
+
+    Returns {"indices", "durationSeconds", "changes", "crop", "scale"}. With
+    max_frames the frame count is fixed; otherwise it comes from the
+    recording's duration and the number of changes on the coarse grid.
+    """
+    total_frames = len(vr)
+    if total_frames == 0 or max_frames == 0:
+        return {"indices": [], "durationSeconds": 0.0, "changes": 0, "crop": None, "scale": 1.0}
+    fps = vr.get_avg_fps() or 30.0
+    duration = total_frames / fps
+    height, width = vr[0].shape[:2]
+
+    if max_frames is None:
+        samples = math.ceil(duration * GRID_PER_SECOND)
+        samples = max(MIN_FRAMES * COARSE_FACTOR, min(MAX_FRAMES * COARSE_FACTOR, samples))
+    else:
+        samples = max_frames * COARSE_FACTOR
+    grid, luma, scores = _scan(vr, total_frames, samples)
+    changes = int(np.count_nonzero(scores > CHANGE_THRESHOLD))
+    crop = change_region(luma, scores, width, height) if CROP_ENABLED else None
+    frames = max_frames if max_frames is not None else frame_budget(duration, changes)
+    frames, scale = fit_token_budget(width, height, frames, crop, fixed_count=max_frames is not None)
+
+    return {
+        "indices": _select(vr, grid, luma, frames),
+        "durationSeconds": round(duration, 2),
+        "changes": changes,
+        "crop": crop,
+        "scale": scale,
+    }
+
+
+def sampling_params(max_frames: Optional[int] = None, jpeg_quality: Optional[int] = None) -> dict:
+    """Every setting that influences which frames are extracted and how they are encoded."""
+    return {
+        "max_frames": max_frames,
+        "jpeg_quality": jpeg_quality,
+        "coarse_factor": COARSE_FACTOR,
+        "refine_min_gap": REFINE_MIN_GAP,
+        "detect_width": DETECT_WIDTH,
+        "pixel_delta": PIXEL_DELTA,
+        "change_threshold": CHANGE_THRESHOLD,
+        "budget": {
+            "min_frames": MIN_FRAMES,
+            "max_frames": MAX_FRAMES,
+            "seconds_per_frame": SECONDS_PER_FRAME,
+            "grid_per_second": GRID_PER_SECOND,
+            "token_budget": TOKEN_BUDGET,
+            "byte_budget": BYTE_BUDGET,
+            "max_width": MAX_WIDTH,
+            "min_width": MIN_WIDTH,
+            "quality_steps": JPEG_QUALITY_STEPS,
+        },
+        "crop": {
+            "enabled": CROP_ENABLED,
+            "max_area": CROP_MAX_AREA,
+            "margin": CROP_MARGIN,
+            "min_size": CROP_MIN_SIZE,
+            "min_component": CROP_MIN_COMPONENT,
+        },
+    }
+
+
+def _encode_all(images: list, quality: int) -> list:
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)]
+    encoded = []
+    for image in images:
+        ok, data = cv2.imencode(".jpg", image, params)
+        if ok:
+            encoded.append(data.tobytes())
+    return encoded
+
+
+def extract_frames(video_path: str, max_frames: Optional[int] = None, jpeg_quality: Optional[int] = None) -> list:
+    """
+    Sample frames from a recording and return them as in-memory JPEG bytes.
+
+    The frame count, output size, crop and JPEG quality follow the adaptive
+    budget (see plan_extraction); max_frames and jpeg_quality pin the count
+    and quality. The first frame is always the full screen so the model sees
+    the page; later ones may be cropped to the region that changed.
+
+    Nothing is written to disk, so concurrent requests never share frame
+    files; each caller owns the list it gets back.
+    """
+    vr = _open_reader(video_path)
+    plan = plan_extraction(vr, max_frames=max_frames)
+    indices = plan["indices"]
+    if not indices:
+        return []
+
+    crop, scale = plan["crop"], plan["scale"]
+    images = []
+    for start in range(0, len(indices), DECODE_CHUNK):
+        batch = vr.get_batch(indices[start:start + DECODE_CHUNK]).asnumpy()
+        for frame in batch:
+            if crop is not None and images:
+                x0, y0, x1, y1 = crop
+                frame = frame[y0:y1, x0:x1]
+            if scale < 1.0:
+                size = (max(1, round(frame.shape[1] * scale)), max(1, round(frame.shape[0] * scale)))
+                frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+            # Decord yields RGB; OpenCV encodes BGR
+            images.append(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
 
-    frames = []
-    prev_gray = None
-    saved = 0
-
-    for i in range(total_frames):
-        frame = vr[i].asnumpy()
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        capture = False
-
-        # Always set prev_gray for next iteration
-        if prev_gray is None:
-            prev_gray = gray
-            # First frame: always capture
-            capture = True
-        else:
-            # Change in scene detection
-            diff = cv2.absdiff(gray, prev_gray)
-            non_zero_count = np.count_nonzero(diff)
-            if non_zero_count > 0.01 * diff.size:  # if 1% change in pixels
-                capture = True
-
-        # Uniform sampling: always include uniform samples
-        if i in uniform_indices:
-            capture = True
-        
-        if capture and saved < max_frames:
-            path = os.path.join(output_dir, f"frame_{saved:03d}.jpg")
-            cv2.imwrite(path, frame)
-            frames.append(path)
-            saved += 1
-        
-        # Always update prev_gray
-        prev_gray = gray
-
-        if saved >= max_frames:
+    # Step quality down until the whole set fits the byte budget
+    qualities = (jpeg_quality,) if jpeg_quality is not None else JPEG_QUALITY_STEPS
+    for quality in qualities:
+        frames = _encode_all(images, quality)
+        if sum(len(f) for f in frames) <= BYTE_BUDGET:
             break
 
-    # Ensure we have at least some frames (uniform samples)
-    if len(frames) == 0 and total_frames > 0:
-        # Fallback: just take uniform samples
-        for idx in uniform_indices[:max_frames]:
-            if idx < total_frames:
-                frame = vr[idx].asnumpy()
-                path = os.path.join(output_dir, f"frame_{len(frames):03d}.jpg")
-                cv2.imwrite(path, frame)
-                frames.append(path)
-                if len(frames) >= max_frames:
-                    break
-
-    return frames
\ No newline at end of file
+    print(f"[Frames] {len(frames)} frames from {plan['durationSeconds']}s with {plan['changes']} changes, "
+          f"scale {scale:.2f}, crop {crop}, quality {quality}, {sum(len(f) for f in frames) // 1024} KB")
+    return frames
@@ -229,6 +229,11 @@ export class HttpAdapter implements BackendAdapter {
     this.apiCallListeners.forEach(cb => cb(info));
   }
 
+  // Artifact URLs from the backend are relative to the backend origin
+  private resolveUrl(url: string): string {
+    return url.startsWith("/") ? `${this.baseUrl}${url}` : url;
+  }
+
   private async request<T>(
     endpoint: string,
     options: RequestInit = {},
@@ -686,7 +691,11 @@ export class HttpAdapter implements BackendAdapter {
       stderr: String(obj.stderr || ""),
       screenshotUrl:
         obj.screenshotUrl || obj.screenshot_url
-          ? String(obj.screenshotUrl || obj.screenshot_url)
+          ? this.resolveUrl(String(obj.screenshotUrl || obj.screenshot_url))
+          : null,
+      report:
+        typeof obj.report === "object" && obj.report !== null
+          ? (obj.report as Record<string, unknown>)
           : null,
     };
   }
@@ -64,6 +64,8 @@ export interface RunResult {
   stdout: string;
   stderr: string;
   screenshotUrl: string | null;
+  // Compact test report from the backend; passed back to /generate-patch
+  report?: Record<string, unknown> | null;
 }
 
 export interface PatchResult {